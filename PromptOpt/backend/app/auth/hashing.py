@@ -0,0 +1,55 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from app.auth.security import password_context
+from app.utils.tracing import span
+
+
+class HashingBusy(Exception):
+	"""The password hashing queue is full; the caller should shed the request."""
+
+
+class PasswordHasherPool:
+	"""Bounded worker pool for bcrypt so hashing never runs on the event loop.
+
+	bcrypt releases the GIL, so a few threads give real parallelism while capping
+	the CPU a login burst can take from everything else. At most
+	``workers + queue_limit`` operations are admitted; the rest fail fast with
+	``HashingBusy`` instead of piling up behind the pool.
+	"""
+
+	def __init__(self, workers: int | None = None, queue_limit: int | None = None):
+		self.workers = workers or int(os.getenv("AUTH_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+		self.queue_limit = queue_limit if queue_limit is not None else int(os.getenv("AUTH_HASH_QUEUE", "32"))
+		self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+		self._lock = threading.Lock()
+		self._in_flight = 0
+		self.rejected = 0
+
+	async def _run(self, fn: Callable[..., Any], *args) -> Any:
+		with self._lock:
+			if self._in_flight >= self.workers + self.queue_limit:
+				self.rejected += 1
+				raise HashingBusy("password hashing queue is full")
+			self._in_flight += 1
+		try:
+			with span("auth.hash"):
+				return await asyncio.wrap_future(self._executor.submit(fn, *args))
+		finally:
+			with self._lock:
+				self._in_flight -= 1
+
+	async def verify(self, plain_password: str, hashed_password: str) -> bool:
+		return await self._run(password_context.verify, plain_password, hashed_password)
+
+	async def hash(self, password: str) -> str:
+		return await self._run(password_context.hash, password)
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {"workers": self.workers, "queue_limit": self.queue_limit, "in_flight": self._in_flight, "rejected": self.rejected}
+
+
+password_hasher = PasswordHasherPool()
@@ -8,6 +8,7 @@ from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.db import models
+from app.auth.user_cache import AuthenticatedUser, user_cache
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev-secret-change-me")
 ALGORITHM = "HS256"
@@ -26,52 +27,83 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 	return password_context.verify(plain_password, hashed_password)
 
 
-def create_access_token(subject: str, role: str, expires_delta: Optional[timedelta] = None) -> str:
-	to_encode = {"sub": subject, "role": role}
-	expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+def create_access_token(subject: str, role: str, expires_delta: Optional[timedelta] = None, user_id: Optional[int] = None) -> str:
+	now = datetime.utcnow()
+	to_encode = {"sub": subject, "role": role, "iat": now}
+	if user_id is not None:
+		to_encode["uid"] = user_id
+	expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
 	to_encode.update({"exp": expire})
 	return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> models.User:
-	credentials_exception = HTTPException(
+def _stateless() -> bool:
+	return os.getenv("AUTH_STATELESS", "false").lower() == "true"
+
+
+def _credentials_exception() -> HTTPException:
+	return HTTPException(
 		status_code=status.HTTP_401_UNAUTHORIZED,
 		detail="Could not validate credentials",
 		headers={"WWW-Authenticate": "Bearer"},
 	)
+
+
+def _resolve_user(db: Session, payload: dict) -> Optional[AuthenticatedUser]:
+	"""Cached (username, iat) -> user lookup; only a cache miss touches the database."""
+	username: str = payload.get("sub")
+	if not username:
+		return None
+	key = (username, payload.get("iat"))
+	user = user_cache.get(key)
+	if user is None:
+		row = db.query(models.User).filter(models.User.username == username).first()
+		if row is None:
+			return None
+		user = AuthenticatedUser.from_orm(row)
+		user_cache.put(key, user)
+	return user
+
+
+def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> AuthenticatedUser:
 	try:
 		payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-		username: str = payload.get("sub")
-		if username is None:
-			raise credentials_exception
-		user = db.query(models.User).filter(models.User.username == username).first()
-		if user is None:
-			raise credentials_exception
-		return user
 	except JWTError:
-		raise credentials_exception
+		raise _credentials_exception()
+	user = _resolve_user(db, payload)
+	if user is None:
+		raise _credentials_exception()
+	return user
 
 
-def get_current_user_optional(db: Session = Depends(get_db), token: Optional[str] = Depends(oauth2_scheme_optional)) -> Optional[models.User]:
+def get_current_user_optional(db: Session = Depends(get_db), token: Optional[str] = Depends(oauth2_scheme_optional)) -> Optional[AuthenticatedUser]:
 	if not token:
 		return None
 	try:
 		payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-		username: str = payload.get("sub")
-		if not username:
-			return None
-		return db.query(models.User).filter(models.User.username == username).first()
 	except JWTError:
 		return None
+	return _resolve_user(db, payload)
 
 
-def require_admin(current_user: models.User = Depends(get_current_user)) -> models.User:
-	if current_user.role != "admin":
+def require_admin(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> AuthenticatedUser:
+	try:
+		payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+	except JWTError:
+		raise _credentials_exception()
+	if _stateless() and payload.get("sub") and payload.get("uid") is not None and payload.get("role"):
+		# Opt-in: trust the signed claims; a role change only takes effect once the token expires.
+		user = AuthenticatedUser(id=payload["uid"], username=payload["sub"], role=payload["role"])
+	else:
+		user = _resolve_user(db, payload)
+	if user is None:
+		raise _credentials_exception()
+	if user.role != "admin":
 		raise HTTPException(status_code=403, detail="Admin privileges required")
-	return current_user
+	return user
 
 
-def require_self_or_admin(target_user_id: int, current_user: models.User = Depends(get_current_user)) -> models.User:
+def require_self_or_admin(target_user_id: int, current_user: AuthenticatedUser = Depends(get_current_user)) -> AuthenticatedUser:
 	if current_user.role == "admin" or current_user.id == target_user_id:
 		return current_user
 	raise HTTPException(status_code=403, detail="Not authorized")
@@ -0,0 +1,90 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional
+from sqlalchemy import event, inspect
+from app.db import models
+
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+	"""Detached snapshot of the columns request handlers read from the current user."""
+
+	id: int
+	username: str
+	role: str
+
+	@classmethod
+	def from_orm(cls, user: models.User) -> "AuthenticatedUser":
+		return cls(id=user.id, username=user.username, role=user.role)
+
+
+class UserCache:
+	"""Bounded TTL cache of authenticated users keyed by (username, token iat).
+
+	Entries for a username are dropped whenever that user row is updated or
+	deleted in this process (SQLAlchemy mapper events); other workers converge
+	within ``AUTH_CACHE_TTL_SECONDS``.
+	"""
+
+	def __init__(self, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+		self.ttl = ttl_seconds if ttl_seconds is not None else float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+		self.max_entries = max_entries or int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+		self._lock = threading.Lock()
+		self._entries: "OrderedDict[Hashable, tuple[float, AuthenticatedUser]]" = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	@property
+	def enabled(self) -> bool:
+		return self.ttl > 0
+
+	def get(self, key: Hashable) -> Optional[AuthenticatedUser]:
+		with self._lock:
+			item = self._entries.get(key)
+			if item is None or item[0] < time.monotonic():
+				if item is not None:
+					del self._entries[key]
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return item[1]
+
+	def put(self, key: Hashable, user: AuthenticatedUser) -> None:
+		if not self.enabled:
+			return
+		with self._lock:
+			self._entries[key] = (time.monotonic() + self.ttl, user)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+
+	def invalidate_user(self, username: str) -> int:
+		with self._lock:
+			stale = [k for k, (_, u) in self._entries.items() if u.username == username]
+			for k in stale:
+				del self._entries[k]
+			return len(stale)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "ttl_seconds": self.ttl}
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+	user_cache.invalidate_user(target.username)
+	# A rename must also evict entries cached under the old username.
+	for old in inspect(target).attrs.username.history.deleted or ():
+		user_cache.invalidate_user(old)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, JSON, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, JSON, Float, Index
+from sqlalchemy import event
+from sqlalchemy.orm import relationship, Session
 from datetime import datetime
 from app.db.database import Base
 
@@ -21,21 +22,42 @@ class Prompt(Base):
 	title = Column(String(200), nullable=False)
 	created_by = Column(String(100), nullable=False)
 	created_at = Column(DateTime, default=datetime.utcnow)
+	# Bumped on any change to the prompt or its versions (see _touch_prompts); drives the /prompts ETag
+	updated_at = Column(DateTime, default=datetime.utcnow, index=True)
 
 	versions = relationship("PromptVersion", back_populates="prompt")
 
 
 class PromptVersion(Base):
 	__tablename__ = "prompt_versions"
+	__table_args__ = (Index("ix_prompt_versions_prompt_active", "prompt_id", "is_active", "version"),)
 	id = Column(Integer, primary_key=True, index=True)
 	prompt_id = Column(Integer, ForeignKey("prompts.id"), nullable=False)
 	version = Column(Integer, nullable=False)
 	content = Column(Text, nullable=False)
 	is_active = Column(Boolean, default=True)
+	# Generation settings; NULL falls back to the service defaults / model router
+	model = Column(String(100), nullable=True)
+	max_tokens = Column(Integer, nullable=True)
+	temperature = Column(Float, nullable=True)
+	timeout_seconds = Column(Float, nullable=True)
+	# A/B traffic share among the prompt's active versions; NULL counts as 1
+	traffic_weight = Column(Float, nullable=True)
 	created_at = Column(DateTime, default=datetime.utcnow)
 
 	prompt = relationship("Prompt", back_populates="versions")
 	conversations = relationship("Conversation", back_populates="prompt_version")
+	arm_stats = relationship("PromptArmStats", uselist=False, cascade="all, delete-orphan")
+
+
+class PromptArmStats(Base):
+	"""Streaming (Welford) aggregate of judge scores for one prompt version."""
+	__tablename__ = "prompt_arm_stats"
+	prompt_version_id = Column(Integer, ForeignKey("prompt_versions.id"), primary_key=True)
+	n = Column(Integer, nullable=False, default=0)
+	mean = Column(Float, nullable=False, default=0.0)
+	m2 = Column(Float, nullable=False, default=0.0)  # sum of squared deviations from the mean
+	updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class Conversation(Base):
@@ -87,3 +109,86 @@ class Guardrail(Base):
 	created_at = Column(DateTime, default=datetime.utcnow)
 
 	conversation = relationship("Conversation", back_populates="guardrails")
+
+
+class ScoreRollup(Base):
+	"""Judge score aggregate per (prompt version, metric, time bucket), maintained on insert.
+
+	``metric`` is ``overall`` or a criterion name; ``prompt_version_id`` 0 means no
+	prompt version. ``h0``..``h9`` count scores in half-point bins over 0-5.
+	"""
+	__tablename__ = "score_rollups"
+	__table_args__ = (Index("ix_score_rollups_metric_bucket", "metric", "granularity", "bucket_start"),)
+	prompt_version_id = Column(Integer, primary_key=True)
+	metric = Column(String(20), primary_key=True)
+	granularity = Column(String(5), primary_key=True)  # 'hour' | 'day'
+	bucket_start = Column(DateTime, primary_key=True)
+	n = Column(Integer, nullable=False, default=0)
+	total = Column(Float, nullable=False, default=0.0)
+	total_sq = Column(Float, nullable=False, default=0.0)
+	min = Column(Float, nullable=True)
+	max = Column(Float, nullable=True)
+	h0 = Column(Integer, nullable=False, default=0)
+	h1 = Column(Integer, nullable=False, default=0)
+	h2 = Column(Integer, nullable=False, default=0)
+	h3 = Column(Integer, nullable=False, default=0)
+	h4 = Column(Integer, nullable=False, default=0)
+	h5 = Column(Integer, nullable=False, default=0)
+	h6 = Column(Integer, nullable=False, default=0)
+	h7 = Column(Integer, nullable=False, default=0)
+	h8 = Column(Integer, nullable=False, default=0)
+	h9 = Column(Integer, nullable=False, default=0)
+
+
+class CountRollup(Base):
+	"""Event counts per (prompt version, dimension, time bucket, value), e.g. ('label', 'good') or ('guardrail', 'redact')."""
+	__tablename__ = "count_rollups"
+	__table_args__ = (Index("ix_count_rollups_dimension_bucket", "dimension", "granularity", "bucket_start"),)
+	prompt_version_id = Column(Integer, primary_key=True)
+	dimension = Column(String(20), primary_key=True)
+	granularity = Column(String(5), primary_key=True)
+	bucket_start = Column(DateTime, primary_key=True)
+	value = Column(String(50), primary_key=True)
+	n = Column(Integer, nullable=False, default=0)
+
+
+class UsageRollup(Base):
+	"""Provider usage per (hour, user, prompt version, operation, model), flushed in batches by ``usage_service``.
+
+	``operation`` is chat | judge | embed | moderate; ``user_id`` / ``prompt_version_id`` 0 means unattributed.
+	``estimated_calls`` counts calls whose tokens were counted locally because the provider returned no usage.
+	"""
+	__tablename__ = "usage_rollups"
+	__table_args__ = (Index("ix_usage_rollups_bucket", "bucket_start"),)
+	bucket_start = Column(DateTime, primary_key=True)
+	user_id = Column(Integer, primary_key=True)
+	prompt_version_id = Column(Integer, primary_key=True)
+	operation = Column(String(20), primary_key=True)
+	model = Column(String(100), primary_key=True)
+	calls = Column(Integer, nullable=False, default=0)
+	errors = Column(Integer, nullable=False, default=0)
+	estimated_calls = Column(Integer, nullable=False, default=0)
+	prompt_tokens = Column(Integer, nullable=False, default=0)
+	completion_tokens = Column(Integer, nullable=False, default=0)
+	cost_usd = Column(Float, nullable=False, default=0.0)
+	latency_ms = Column(Float, nullable=False, default=0.0)  # sum over calls
+
+
+@event.listens_for(Session, "before_flush")
+def _touch_prompts(session, flush_context, instances):
+	"""Stamp ``Prompt.updated_at`` when a prompt or any of its versions is added or modified in this flush.
+
+	Bulk ``query.update()`` bypasses the unit of work; callers pair those with an ORM change to the same prompt.
+	"""
+	now = datetime.utcnow()
+	prompt_ids = set()
+	for obj in list(session.new) + list(session.dirty):
+		if isinstance(obj, Prompt) and session.is_modified(obj, include_collections=False):
+			obj.updated_at = now
+		elif isinstance(obj, PromptVersion) and obj.prompt_id is not None:
+			prompt_ids.add(obj.prompt_id)
+	with session.no_autoflush:
+		for prompt_id in prompt_ids:
+			prompt = session.get(Prompt, prompt_id)
+			if prompt is not None:
+				prompt.updated_at = now
@@ -0,0 +1,23 @@
+"""Dialect-aware insert-or-update for counter-style tables (rollups, usage)."""
+from typing import Optional
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+
+def upsert(connection, table, key: dict, values: dict, increments: Optional[dict] = None, sets: Optional[dict] = None) -> None:
+	"""Insert ``key`` + ``values``; when the row exists, ``UPDATE ... SET col = col + inc`` for ``increments`` and
+	``col = expr`` for ``sets`` instead, atomically on SQLite and PostgreSQL (``ON CONFLICT DO UPDATE``)."""
+	changes = {k: table.c[k] + v for k, v in (increments or {}).items()}
+	changes.update(sets or {})
+	dialect = connection.dialect.name
+	if dialect in ("sqlite", "postgresql"):
+		insert = (sqlite_insert if dialect == "sqlite" else pg_insert)(table).values(**key, **values)
+		if changes:
+			connection.execute(insert.on_conflict_do_update(index_elements=list(key), set_=changes))
+		else:
+			connection.execute(insert.on_conflict_do_nothing(index_elements=list(key)))
+		return
+	where = [table.c[k] == v for k, v in key.items()]
+	if not changes or connection.execute(update(table).where(*where).values(**changes)).rowcount == 0:
+		connection.execute(table.insert().values(**key, **values))
@@ -1,9 +1,39 @@
 from fastapi import FastAPI
-from app.routes import auth, prompt, chat
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from sqlalchemy import text
+from app.routes import auth, prompt, chat, metrics, evaluation, analytics, archive, usage
+from app.utils.tracing import TracingMiddleware
+from app.utils.admission import AdmissionMiddleware
+from app.services.container import services
+from app.services import archive_service, usage_service
+from app.db.database import engine
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import asyncio
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	# Upstream services are built lazily; warming them (and the RAG index) in the background
+	# lets the app answer liveness checks immediately and report ready once they're loaded.
+	warmup = services.start_warm_up() if os.getenv("SERVICE_WARMUP", "true").lower() == "true" else None
+	# Old conversations move to cold storage in the background instead of being pruned per request.
+	interval = archive_service.ARCHIVE_INTERVAL_SECONDS
+	archiver = asyncio.create_task(archive_service.run_periodically(interval)) if interval > 0 else None
+	# Provider usage is aggregated in process and written in batches (a last flush on shutdown).
+	usage_flusher = asyncio.create_task(usage_service.run_periodically(usage_service.USAGE_FLUSH_SECONDS))
+	yield
+	for task in (warmup, archiver, usage_flusher):
+		if task is not None and not task.done():
+			task.cancel()
+			await asyncio.gather(task, return_exceptions=True)
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Innermost: runs after CORS so 429s still carry CORS headers for the browser.
+app.add_middleware(AdmissionMiddleware)
 
 # CORS for development - adjust origins for production
 app.add_middleware(
@@ -17,6 +47,9 @@ app.add_middleware(
 	allow_headers=["*"],
 )
 
+# Outermost, so request latency covers CORS handling too.
+app.add_middleware(TracingMiddleware)
+
 # Note: Database tables and seed data are managed via Alembic migrations.
 # To bootstrap a fresh dev DB with seed users, set BOOTSTRAP_DEV=true and run a one-time script.
 
@@ -25,7 +58,27 @@ app.include_router(auth.router)
 app.include_router(prompt.router)
 app.include_router(chat.router)
 app.include_router(rag.router)
+app.include_router(metrics.router)
+app.include_router(evaluation.router)
+app.include_router(analytics.router)
+app.include_router(archive.router)
+app.include_router(usage.router)
 
 @app.get("/health")
+@app.get("/health/live")
 def health_check():
 	return {"status": "ok"}
+
+
+@app.get("/health/ready")
+def readiness_check():
+	"""503 until background warm-up has finished and the database answers."""
+	report = services.readiness()
+	try:
+		with engine.connect() as conn:
+			conn.execute(text("SELECT 1"))
+		report["database"] = "ok"
+	except Exception as e:
+		report["database"] = str(e)
+		report["ready"] = False
+	return JSONResponse(report, status_code=200 if report["ready"] else 503)
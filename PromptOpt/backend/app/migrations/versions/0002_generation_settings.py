@@ -0,0 +1,23 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0002_generation_settings'
+down_revision = '0001_initial'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+	with op.batch_alter_table('prompt_versions') as batch:
+		batch.add_column(sa.Column('model', sa.String(length=100), nullable=True))
+		batch.add_column(sa.Column('max_tokens', sa.Integer(), nullable=True))
+		batch.add_column(sa.Column('temperature', sa.Float(), nullable=True))
+		batch.add_column(sa.Column('timeout_seconds', sa.Float(), nullable=True))
+
+
+def downgrade():
+	with op.batch_alter_table('prompt_versions') as batch:
+		batch.drop_column('timeout_seconds')
+		batch.drop_column('temperature')
+		batch.drop_column('max_tokens')
+		batch.drop_column('model')
@@ -0,0 +1,26 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0003_prompt_experiments'
+down_revision = '0002_generation_settings'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+	with op.batch_alter_table('prompt_versions') as batch:
+		batch.add_column(sa.Column('traffic_weight', sa.Float(), nullable=True))
+
+	op.create_table('prompt_arm_stats',
+		sa.Column('prompt_version_id', sa.Integer(), sa.ForeignKey('prompt_versions.id'), primary_key=True),
+		sa.Column('n', sa.Integer(), nullable=False, server_default='0'),
+		sa.Column('mean', sa.Float(), nullable=False, server_default='0'),
+		sa.Column('m2', sa.Float(), nullable=False, server_default='0'),
+		sa.Column('updated_at', sa.DateTime(), nullable=True),
+	)
+
+
+def downgrade():
+	op.drop_table('prompt_arm_stats')
+	with op.batch_alter_table('prompt_versions') as batch:
+		batch.drop_column('traffic_weight')
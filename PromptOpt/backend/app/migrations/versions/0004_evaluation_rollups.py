@@ -0,0 +1,93 @@
+from alembic import op
+import sqlalchemy as sa
+import json
+import math
+from datetime import datetime
+
+# revision identifiers, used by Alembic.
+revision = '0004_evaluation_rollups'
+down_revision = '0003_prompt_experiments'
+branch_labels = None
+depends_on = None
+
+METRICS = ("overall", "helpfulness", "accuracy", "clarity", "safety", "relevance", "tone")
+HIST = [f"h{i}" for i in range(10)]
+
+
+def _buckets(ts):
+	if isinstance(ts, str):
+		ts = datetime.fromisoformat(ts)
+	ts = ts or datetime.utcnow()
+	hour = ts.replace(minute=0, second=0, microsecond=0)
+	return (("hour", hour), ("day", hour.replace(hour=0)))
+
+
+def upgrade():
+	score_rollups = op.create_table('score_rollups',
+		sa.Column('prompt_version_id', sa.Integer(), primary_key=True),
+		sa.Column('metric', sa.String(length=20), primary_key=True),
+		sa.Column('granularity', sa.String(length=5), primary_key=True),
+		sa.Column('bucket_start', sa.DateTime(), primary_key=True),
+		sa.Column('n', sa.Integer(), nullable=False, server_default='0'),
+		sa.Column('total', sa.Float(), nullable=False, server_default='0'),
+		sa.Column('total_sq', sa.Float(), nullable=False, server_default='0'),
+		sa.Column('min', sa.Float(), nullable=True),
+		sa.Column('max', sa.Float(), nullable=True),
+		*[sa.Column(h, sa.Integer(), nullable=False, server_default='0') for h in HIST],
+	)
+	count_rollups = op.create_table('count_rollups',
+		sa.Column('prompt_version_id', sa.Integer(), primary_key=True),
+		sa.Column('dimension', sa.String(length=20), primary_key=True),
+		sa.Column('granularity', sa.String(length=5), primary_key=True),
+		sa.Column('bucket_start', sa.DateTime(), primary_key=True),
+		sa.Column('value', sa.String(length=50), primary_key=True),
+		sa.Column('n', sa.Integer(), nullable=False, server_default='0'),
+	)
+	# Range queries across all versions (the primary key leads with prompt_version_id)
+	op.create_index('ix_score_rollups_metric_bucket', 'score_rollups', ['metric', 'granularity', 'bucket_start'])
+	op.create_index('ix_count_rollups_dimension_bucket', 'count_rollups', ['dimension', 'granularity', 'bucket_start'])
+
+	# One-time backfill from existing rows; from here on the app maintains rollups on insert.
+	bind = op.get_bind()
+	scores, counts = {}, {}
+	rows = bind.execute(sa.text(
+		"SELECT e.overall, e.criteria, e.label, e.created_at, c.prompt_version_id "
+		"FROM evaluations e JOIN conversations c ON c.id = e.conversation_id"
+	))
+	for overall, criteria, label, created_at, pv in rows:
+		criteria = json.loads(criteria) if isinstance(criteria, str) else (criteria or {})
+		values = {"overall": overall, **{k: v for k, v in criteria.items() if k in METRICS and isinstance(v, (int, float))}}
+		for granularity, start in _buckets(created_at):
+			for metric, v in values.items():
+				acc = scores.setdefault((pv or 0, metric, granularity, start), {"n": 0, "total": 0.0, "total_sq": 0.0, "min": math.inf, "max": -math.inf, **{h: 0 for h in HIST}})
+				acc["n"] += 1
+				acc["total"] += v
+				acc["total_sq"] += v * v
+				acc["min"] = min(acc["min"], v)
+				acc["max"] = max(acc["max"], v)
+				acc[HIST[min(9, max(0, int(v * 2)))]] += 1
+			key = (pv or 0, "label", granularity, start, label or "unknown")
+			counts[key] = counts.get(key, 0) + 1
+	rows = bind.execute(sa.text(
+		"SELECT g.action, g.created_at, c.prompt_version_id FROM guardrails g JOIN conversations c ON c.id = g.conversation_id"
+	))
+	for action, created_at, pv in rows:
+		for granularity, start in _buckets(created_at):
+			key = (pv or 0, "guardrail", granularity, start, action)
+			counts[key] = counts.get(key, 0) + 1
+
+	if scores:
+		op.bulk_insert(score_rollups, [
+			{"prompt_version_id": k[0], "metric": k[1], "granularity": k[2], "bucket_start": k[3], **v} for k, v in scores.items()
+		])
+	if counts:
+		op.bulk_insert(count_rollups, [
+			{"prompt_version_id": k[0], "dimension": k[1], "granularity": k[2], "bucket_start": k[3], "value": k[4], "n": n} for k, n in counts.items()
+		])
+
+
+def downgrade():
+	op.drop_index('ix_count_rollups_dimension_bucket', table_name='count_rollups')
+	op.drop_index('ix_score_rollups_metric_bucket', table_name='score_rollups')
+	op.drop_table('count_rollups')
+	op.drop_table('score_rollups')
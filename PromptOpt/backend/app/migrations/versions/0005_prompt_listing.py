@@ -0,0 +1,26 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0005_prompt_listing'
+down_revision = '0004_evaluation_rollups'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+	with op.batch_alter_table('prompts') as batch:
+		batch.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+		batch.create_index('ix_prompts_updated_at', ['updated_at'])
+	op.execute(
+		"UPDATE prompts SET updated_at = COALESCE("
+		"(SELECT MAX(prompt_versions.created_at) FROM prompt_versions WHERE prompt_versions.prompt_id = prompts.id), "
+		"prompts.created_at)"
+	)
+	op.create_index('ix_prompt_versions_prompt_active', 'prompt_versions', ['prompt_id', 'is_active', 'version'])
+
+
+def downgrade():
+	op.drop_index('ix_prompt_versions_prompt_active', table_name='prompt_versions')
+	with op.batch_alter_table('prompts') as batch:
+		batch.drop_index('ix_prompts_updated_at')
+		batch.drop_column('updated_at')
@@ -0,0 +1,30 @@
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0006_usage_rollups'
+down_revision = '0005_prompt_listing'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+	op.create_table('usage_rollups',
+		sa.Column('bucket_start', sa.DateTime(), primary_key=True),
+		sa.Column('user_id', sa.Integer(), primary_key=True),
+		sa.Column('prompt_version_id', sa.Integer(), primary_key=True),
+		sa.Column('operation', sa.String(length=20), primary_key=True),
+		sa.Column('model', sa.String(length=100), primary_key=True),
+		sa.Column('calls', sa.Integer(), nullable=False, server_default='0'),
+		sa.Column('errors', sa.Integer(), nullable=False, server_default='0'),
+		sa.Column('estimated_calls', sa.Integer(), nullable=False, server_default='0'),
+		sa.Column('prompt_tokens', sa.Integer(), nullable=False, server_default='0'),
+		sa.Column('completion_tokens', sa.Integer(), nullable=False, server_default='0'),
+		sa.Column('cost_usd', sa.Float(), nullable=False, server_default='0'),
+		sa.Column('latency_ms', sa.Float(), nullable=False, server_default='0'),
+	)
+	op.create_index('ix_usage_rollups_bucket', 'usage_rollups', ['bucket_start'])
+
+
+def downgrade():
+	op.drop_index('ix_usage_rollups_bucket', table_name='usage_rollups')
+	op.drop_table('usage_rollups')
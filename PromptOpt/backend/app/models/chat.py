@@ -15,13 +15,28 @@ class ChatRequest(BaseModel):
 	prompt_id: Optional[int] = None  # Which prompt template to use
 	conversation_history: Optional[List[ChatMessage]] = []
 	evaluate: Optional[bool] = False
-	use_company_context: Optional[bool] = False
+	use_company_context: Optional[bool] = None  # True/False force RAG retrieval on/off; None lets the intent gate decide
 
 
 class ProvenanceItem(BaseModel):
 	text: str
 	score: Optional[float] = None
 	source: Optional[str] = None
+	also_in: Optional[List[str]] = None  # other documents holding a near-duplicate of this chunk
+
+
+class CacheInfo(BaseModel):
+	hit: bool = False
+	tier: Optional[str] = None  # 'exact' | 'semantic'
+	similarity: Optional[float] = None
+	age_seconds: Optional[float] = None
+	lookup_ms: Optional[float] = None
+
+
+class TokenUsage(BaseModel):
+	prompt_tokens: int
+	completion_tokens: int
+	cost_usd: Optional[float] = None  # estimated from the model's price (USAGE_PRICES)
 
 
 class ChatResponse(BaseModel):
@@ -33,3 +48,9 @@ class ChatResponse(BaseModel):
 	guardrails: Optional[GuardrailAnalysis] = None
 	provenance: Optional[List[ProvenanceItem]] = None
 	timestamp: Optional[datetime] = None
+	cache: Optional[CacheInfo] = None
+	model: Optional[str] = None
+	route: Optional[str] = None  # model router decision: pinned | default | fast | large
+	prompt_version_id: Optional[int] = None  # version that answered (the assigned arm during an A/B experiment)
+	degraded: Optional[bool] = None  # True when the LLM call failed and a fallback answer was returned
+	usage: Optional[TokenUsage] = None  # tokens of the generation call; None for cache hits and fallbacks
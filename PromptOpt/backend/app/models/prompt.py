@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from datetime import datetime
 
 class Prompt(BaseModel):
@@ -7,10 +7,45 @@ class Prompt(BaseModel):
     title: str
     content: str
     created_by: str
+    # Optional per-version generation settings; omitted fields use the service defaults
+    model: Optional[str] = None
+    max_tokens: Optional[int] = Field(default=None, ge=1, le=16000)
+    temperature: Optional[float] = Field(default=None, ge=0.0, le=2.0)
+    timeout_seconds: Optional[float] = Field(default=None, gt=0.0, le=600.0)
 
 class PromptVersionOut(BaseModel):
     id: int
     version: int
     content: str
     is_active: bool
+    model: Optional[str] = None
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    timeout_seconds: Optional[float] = None
+    traffic_weight: Optional[float] = None
     created_at: Optional[datetime] = None
+
+class ExperimentArm(BaseModel):
+    version: int
+    weight: float = Field(default=1.0, ge=0.0)
+
+class ExperimentConfig(BaseModel):
+    # Versions to split traffic across; every other version of the prompt is deactivated
+    arms: List[ExperimentArm] = Field(min_length=1)
+
+class ExperimentArmOut(BaseModel):
+    prompt_version_id: int
+    version: int
+    weight: float
+    traffic_share: float
+    n: int
+    mean_score: Optional[float] = None
+    std_error: Optional[float] = None
+
+class ExperimentOut(BaseModel):
+    prompt_id: int
+    arms: List[ExperimentArmOut]
+    auto_promote: bool
+    min_samples: int
+    checkpoints: List[int] = []  # per-arm sample sizes at which promotion is tested
+    leader_version: Optional[int] = None  # arm that currently meets the promotion thresholds
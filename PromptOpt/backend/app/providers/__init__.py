@@ -0,0 +1,29 @@
+import os
+import threading
+from app.providers.base import Provider
+
+_provider = None
+_lock = threading.Lock()
+
+
+def get_provider() -> Provider:
+	"""Process-wide provider selected by ``LLM_PROVIDER`` (``openai`` | ``stub``), metered unless ``USAGE_ENABLED=false``."""
+	global _provider
+	if _provider is None:
+		with _lock:
+			if _provider is None:
+				name = os.getenv("LLM_PROVIDER", "openai").lower()
+				if name == "stub":
+					from app.providers.stub import StubProvider
+					provider = StubProvider()
+				elif name == "openai":
+					from app.providers.openai_provider import OpenAIProvider
+					provider = OpenAIProvider()
+				else:
+					raise ValueError(f"Unknown LLM_PROVIDER: {name}")
+				from app.services.usage_service import USAGE_ENABLED
+				if USAGE_ENABLED:
+					from app.providers.metered import MeteredProvider
+					provider = MeteredProvider(provider)
+				_provider = provider
+	return _provider
@@ -0,0 +1,46 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import List, Optional
+import numpy as np
+
+
+class ProviderError(Exception):
+	"""Provider-neutral upstream failure; ``retryable`` drives ResilientClient."""
+
+	def __init__(self, message: str, retryable: bool = True):
+		super().__init__(message)
+		self.retryable = retryable
+
+
+@dataclass
+class ChatResult:
+	text: str
+	model: str
+	prompt_tokens: Optional[int] = None
+	completion_tokens: Optional[int] = None
+
+
+class Provider(ABC):
+	"""Blocking upstream calls used by the services.
+
+	Every method takes ``timeout`` (seconds) and must give up after it, so
+	ResilientClient deadlines hold whichever backend is plugged in.
+	"""
+
+	name = "base"
+
+	@abstractmethod
+	def chat(self, messages: List[dict], model: str, max_tokens: int, temperature: float, timeout: float) -> ChatResult:
+		...
+
+	@abstractmethod
+	def judge(self, messages: List[dict], model: str, max_tokens: int, timeout: float) -> ChatResult:
+		...
+
+	@abstractmethod
+	def embed(self, texts: List[str], model: str, timeout: float) -> np.ndarray:
+		"""Return a float32 matrix with one (unnormalized) row per input text."""
+
+	@abstractmethod
+	def moderate(self, text: str, model: str, timeout: float) -> bool:
+		"""Return True when the text is flagged."""
@@ -0,0 +1,60 @@
+import time
+from typing import List, Optional
+import numpy as np
+from app.providers.base import ChatResult, Provider
+from app.services.usage_service import UsageMeter, count_message_tokens, count_tokens, meter as default_meter
+
+
+class MeteredProvider(Provider):
+	"""Records tokens, cost and latency of every call in a ``UsageMeter``; anything else goes to the wrapped provider.
+
+	Failed calls count as errors with their latency and no tokens. Embedding and
+	moderation tokens are counted locally: the provider interface returns no usage for them.
+	"""
+
+	def __init__(self, inner: Provider, meter: Optional[UsageMeter] = None):
+		self.inner = inner
+		self.name = inner.name
+		self.meter = meter or default_meter
+
+	def __getattr__(self, name):
+		return getattr(self.inner, name)
+
+	def _completion(self, operation: str, call, messages: List[dict], model: str) -> ChatResult:
+		start = time.perf_counter()
+		try:
+			result = call()
+		except Exception:
+			self.meter.record(operation, model, 0, 0, time.perf_counter() - start, error=True)
+			raise
+		elapsed = time.perf_counter() - start
+		estimated = result.prompt_tokens is None or result.completion_tokens is None
+		if result.prompt_tokens is None:
+			result.prompt_tokens = count_message_tokens(messages, result.model)
+		if result.completion_tokens is None:
+			result.completion_tokens = count_tokens(result.text, result.model)
+		self.meter.record(operation, result.model or model, result.prompt_tokens, result.completion_tokens, elapsed, estimated=estimated)
+		return result
+
+	def _counted(self, operation: str, call, texts: List[str], model: str):
+		start = time.perf_counter()
+		try:
+			result = call()
+		except Exception:
+			self.meter.record(operation, model, 0, 0, time.perf_counter() - start, error=True)
+			raise
+		tokens = sum(count_tokens(t, model) for t in texts)
+		self.meter.record(operation, model, tokens, 0, time.perf_counter() - start, estimated=True)
+		return result
+
+	def chat(self, messages: List[dict], model: str, max_tokens: int, temperature: float, timeout: float) -> ChatResult:
+		return self._completion("chat", lambda: self.inner.chat(messages, model=model, max_tokens=max_tokens, temperature=temperature, timeout=timeout), messages, model)
+
+	def judge(self, messages: List[dict], model: str, max_tokens: int, timeout: float) -> ChatResult:
+		return self._completion("judge", lambda: self.inner.judge(messages, model=model, max_tokens=max_tokens, timeout=timeout), messages, model)
+
+	def embed(self, texts: List[str], model: str, timeout: float) -> np.ndarray:
+		return self._counted("embed", lambda: self.inner.embed(texts, model=model, timeout=timeout), texts, model)
+
+	def moderate(self, text: str, model: str, timeout: float) -> bool:
+		return self._counted("moderate", lambda: self.inner.moderate(text, model=model, timeout=timeout), [text], model)
@@ -0,0 +1,64 @@
+import os
+from typing import List, Optional
+import numpy as np
+import openai
+from app.providers.base import Provider, ChatResult
+from app.utils.tracing import current_trace_id
+
+
+class OpenAIProvider(Provider):
+	name = "openai"
+
+	def __init__(self, client: Optional[openai.OpenAI] = None):
+		# SDK retries are disabled: ResilientClient owns retries, deadlines and circuit breaking.
+		# OPENAI_BASE_URL is honoured by the SDK, so this also talks to the local stub server.
+		self.client = client or openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY", "your-api-key-here"), max_retries=0)
+		# JSON mode makes the judge emit a syntactically valid object; turn off for backends that reject response_format.
+		self.judge_json_mode = os.getenv("JUDGE_JSON_MODE", "true").lower() == "true"
+
+	def chat(self, messages: List[dict], model: str, max_tokens: int, temperature: float, timeout: float) -> ChatResult:
+		resp = self.client.chat.completions.create(
+			model=model,
+			messages=messages,
+			max_tokens=max_tokens,
+			temperature=temperature,
+			timeout=timeout,
+			extra_headers=self._headers(),
+		)
+		return self._result(resp, model)
+
+	def judge(self, messages: List[dict], model: str, max_tokens: int, timeout: float) -> ChatResult:
+		resp = self.client.chat.completions.create(
+			model=model,
+			messages=messages,
+			temperature=0.0,
+			max_tokens=max_tokens,
+			timeout=timeout,
+			extra_headers=self._headers(),
+			**({"response_format": {"type": "json_object"}} if self.judge_json_mode else {}),
+		)
+		return self._result(resp, model)
+
+	def embed(self, texts: List[str], model: str, timeout: float) -> np.ndarray:
+		res = self.client.embeddings.create(model=model, input=texts, timeout=timeout, extra_headers=self._headers())
+		return np.vstack([np.array(e.embedding, dtype=np.float32) for e in res.data])
+
+	def moderate(self, text: str, model: str, timeout: float) -> bool:
+		res = self.client.moderations.create(model=model, input=text, timeout=timeout, extra_headers=self._headers())
+		return bool(res.results[0].flagged)
+
+	@staticmethod
+	def _headers() -> Optional[dict]:
+		# Forward the request's trace ID so upstream logs can be correlated with ours.
+		trace_id = current_trace_id()
+		return {"X-Trace-Id": trace_id} if trace_id else None
+
+	@staticmethod
+	def _result(resp, model: str) -> ChatResult:
+		usage = getattr(resp, "usage", None)
+		return ChatResult(
+			text=resp.choices[0].message.content or "",
+			model=getattr(resp, "model", None) or model,
+			prompt_tokens=getattr(usage, "prompt_tokens", None),
+			completion_tokens=getattr(usage, "completion_tokens", None),
+		)
@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import List
+import numpy as np
+from app.providers.base import Provider, ProviderError, ChatResult
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_VOCAB = (
+	"policy benefits leave employee manager request approval days team handbook payroll "
+	"schedule remote office training review process contact HR portal eligibility coverage "
+	"holiday notice form deadline period accrual balance plan enrollment guidance support"
+).split()
+_CRITERIA = ("helpfulness", "accuracy", "clarity", "safety", "relevance", "tone")
+_BATCH_ITEM_RE = re.compile(r"^### Item (\d+)\n", re.M)
+
+
+@dataclass(frozen=True)
+class LatencyDistribution:
+	"""Latency model parsed from specs like ``0.2``, ``fixed:0.2``, ``uniform:0.1,0.5``,
+	``normal:0.3,0.05`` or ``lognormal:0.3,0.5`` (median seconds, sigma)."""
+
+	kind: str = "fixed"
+	a: float = 0.0
+	b: float = 0.0
+
+	@classmethod
+	def parse(cls, spec: str) -> "LatencyDistribution":
+		spec = (spec or "").strip()
+		if not spec:
+			return cls()
+		kind, _, args = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+		values = [float(x) for x in args.split(",") if x.strip()]
+		if kind == "fixed" and len(values) == 1:
+			return cls("fixed", values[0])
+		if kind in ("uniform", "normal", "lognormal") and len(values) == 2:
+			return cls(kind, values[0], values[1])
+		raise ValueError(f"Invalid latency spec: {spec!r}")
+
+	def sample(self, u: float) -> float:
+		"""Map a uniform draw in (0, 1) to a latency in seconds."""
+		u = min(max(u, 1e-9), 1 - 1e-9)
+		if self.kind == "uniform":
+			return self.a + (self.b - self.a) * u
+		if self.kind == "normal":
+			return max(0.0, NormalDist(self.a, self.b).inv_cdf(u))
+		if self.kind == "lognormal":
+			return float(np.exp(np.log(max(self.a, 1e-9)) + self.b * NormalDist().inv_cdf(u)))
+		return self.a
+
+
+def _digest(*parts: str) -> bytes:
+	h = hashlib.blake2b(digest_size=32)
+	for p in parts:
+		h.update(p.encode("utf-8"))
+		h.update(b"\x1f")
+	return h.digest()
+
+
+def hash_embedding(text: str, dim: int) -> np.ndarray:
+	"""Signed feature hashing of word unigrams and bigrams.
+
+	Deterministic, and texts sharing vocabulary land close together in cosine
+	space, which is enough to exercise retrieval and the semantic cache offline.
+	"""
+	vec = np.zeros(dim, dtype=np.float32)
+	tokens = _TOKEN_RE.findall((text or "").lower())
+	feats = [(t, 1.0) for t in tokens] + [(f"{a} {b}", 0.5) for a, b in zip(tokens, tokens[1:])]
+	if not feats:
+		feats = [(text or "", 1.0)]
+	for feat, weight in feats:
+		h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+		vec[h % dim] += weight if (h >> 63) & 1 else -weight
+	norm = float(np.linalg.norm(vec))
+	if norm > 0:
+		vec /= norm
+	return vec
+
+
+class StubProvider(Provider):
+	"""Deterministic, in-process stand-in for the OpenAI APIs.
+
+	Outputs are pure functions of the inputs (and ``STUB_SEED``); latencies and
+	injected errors are drawn from a seeded stream, so a run with the same call
+	order reproduces exactly. No network access or API spend.
+	"""
+
+	name = "stub"
+
+	def __init__(self, seed: int | None = None, embed_dim: int | None = None):
+		self.seed = seed if seed is not None else int(os.getenv("STUB_SEED", "0"))
+		self.embed_dim = embed_dim or int(os.getenv("STUB_EMBED_DIM", "1536"))
+		self.error_rate = float(os.getenv("STUB_ERROR_RATE", "0"))
+		self.latency = {
+			"chat": LatencyDistribution.parse(os.getenv("STUB_CHAT_LATENCY", "0")),
+			"judge": LatencyDistribution.parse(os.getenv("STUB_JUDGE_LATENCY", "0")),
+			"embed": LatencyDistribution.parse(os.getenv("STUB_EMBED_LATENCY", "0")),
+			"moderate": LatencyDistribution.parse(os.getenv("STUB_MODERATION_LATENCY", "0")),
+		}
+		self.flag_words = {w.strip().lower() for w in os.getenv("STUB_MODERATION_FLAG_WORDS", "stubflag").split(",") if w.strip()}
+		self._rng = random.Random(self.seed)
+		self._lock = threading.Lock()
+
+	# -- latency / fault injection ---------------------------------------
+
+	def draw(self, op: str) -> tuple[float, bool]:
+		"""Next (latency seconds, inject error?) pair for an operation."""
+		with self._lock:
+			u, e = self._rng.random(), self._rng.random()
+		return self.latency[op].sample(u), e < self.error_rate
+
+	def _simulate(self, op: str, timeout: float) -> None:
+		delay, fail = self.draw(op)
+		if delay > timeout:
+			time.sleep(max(0.0, timeout))
+			raise TimeoutError(f"stub {op} exceeded {timeout:.2f}s")
+		if delay > 0:
+			time.sleep(delay)
+		if fail:
+			raise ProviderError(f"stub {op}: injected upstream error")
+
+	# -- pure outputs (shared with the HTTP stand-in) ---------------------
+
+	def chat_text(self, messages: List[dict], model: str, max_tokens: int) -> str:
+		system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+		question = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+		rng = random.Random(_digest(str(self.seed), model, system, question))
+		n_words = min(max_tokens, rng.randint(30, 90))
+		body = " ".join(rng.choice(_VOCAB) for _ in range(n_words))
+		lead = "According to the company documents, " if "[Source 1]" in system else ""
+		return f"{lead}regarding \"{question[:80]}\": {body}."
+
+	def _judgement(self, *parts: str) -> dict:
+		d = _digest(str(self.seed), "judge", *parts)
+		scores = {c: round(3.0 + (d[i] % 21) / 10, 1) for i, c in enumerate(_CRITERIA)}
+		overall = round(sum(scores.values()) / len(scores), 2)
+		label = "good" if overall >= 4 else ("average" if overall >= 3 else "poor")
+		return {**scores, "overall": overall, "label": label, "comments": "stub judge", "hallucination_risk": "low"}
+
+	def judge_text(self, messages: List[dict]) -> str:
+		user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+		items = _BATCH_ITEM_RE.split(user)
+		if len(items) > 1:
+			# Batched judging: one object per "### Item N" block
+			return json.dumps({"items": [{"index": int(n), **self._judgement(items[0], body)} for n, body in zip(items[1::2], items[2::2])]})
+		return json.dumps(self._judgement(*(m.get("content") or "" for m in messages)))
+
+	def embed_matrix(self, texts: List[str]) -> np.ndarray:
+		return np.vstack([hash_embedding(t, self.embed_dim) for t in texts]) if texts else np.zeros((0, self.embed_dim), dtype=np.float32)
+
+	def is_flagged(self, text: str) -> bool:
+		words = set(_TOKEN_RE.findall((text or "").lower()))
+		return bool(words & self.flag_words)
+
+	@staticmethod
+	def count_tokens(text: str) -> int:
+		return max(1, len(text or "") // 4)
+
+	# -- Provider ---------------------------------------------------------
+
+	def chat(self, messages: List[dict], model: str, max_tokens: int, temperature: float, timeout: float) -> ChatResult:
+		self._simulate("chat", timeout)
+		text = self.chat_text(messages, model, max_tokens)
+		prompt_tokens = sum(self.count_tokens(m.get("content") or "") for m in messages)
+		return ChatResult(text=text, model=model, prompt_tokens=prompt_tokens, completion_tokens=self.count_tokens(text))
+
+	def judge(self, messages: List[dict], model: str, max_tokens: int, timeout: float) -> ChatResult:
+		self._simulate("judge", timeout)
+		text = self.judge_text(messages)
+		prompt_tokens = sum(self.count_tokens(m.get("content") or "") for m in messages)
+		return ChatResult(text=text, model=model, prompt_tokens=prompt_tokens, completion_tokens=self.count_tokens(text))
+
+	def embed(self, texts: List[str], model: str, timeout: float) -> np.ndarray:
+		self._simulate("embed", timeout)
+		return self.embed_matrix(texts)
+
+	def moderate(self, text: str, model: str, timeout: float) -> bool:
+		self._simulate("moderate", timeout)
+		return self.is_flagged(text)
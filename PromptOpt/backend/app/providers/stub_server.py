@@ -0,0 +1,98 @@
+"""OpenAI-compatible local HTTP stand-in backed by StubProvider.
+
+Point the backend at it with ``OPENAI_BASE_URL=http://127.0.0.1:9100/v1`` and the
+real OpenAI code path (SDK, HTTP, JSON parsing) is exercised without network
+access or spend:
+
+    python -m app.providers.stub_server --port 9100
+"""
+import time
+import asyncio
+import argparse
+from fastapi import FastAPI, HTTPException, Request
+from app.providers.stub import StubProvider
+
+
+def _is_judge(body: dict) -> bool:
+	if body.get("response_format"):
+		return True
+	system = next((m.get("content") or "" for m in body.get("messages", []) if m.get("role") == "system"), "")
+	return "json" in system.lower() and "evaluat" in system.lower()
+
+
+def build_app(provider: StubProvider | None = None) -> FastAPI:
+	stub = provider or StubProvider()
+	app = FastAPI(title="OpenAI stub")
+
+	async def simulate(op: str):
+		delay, fail = stub.draw(op)
+		if delay > 0:
+			await asyncio.sleep(delay)
+		if fail:
+			raise HTTPException(status_code=503, detail={"message": "injected upstream error", "type": "server_error"})
+
+	@app.get("/v1/models")
+	async def models():
+		return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]}
+
+	@app.post("/v1/chat/completions")
+	async def chat_completions(request: Request):
+		body = await request.json()
+		messages = body.get("messages", [])
+		model = body.get("model", "stub")
+		judge = _is_judge(body)
+		await simulate("judge" if judge else "chat")
+		text = stub.judge_text(messages) if judge else stub.chat_text(messages, model, int(body.get("max_tokens") or 500))
+		prompt_tokens = sum(stub.count_tokens(m.get("content") or "") for m in messages)
+		completion_tokens = stub.count_tokens(text)
+		return {
+			"id": f"chatcmpl-stub-{time.time_ns()}",
+			"object": "chat.completion",
+			"created": int(time.time()),
+			"model": model,
+			"choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+			"usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+		}
+
+	@app.post("/v1/embeddings")
+	async def embeddings(request: Request):
+		body = await request.json()
+		inputs = body.get("input") or []
+		inputs = [inputs] if isinstance(inputs, str) else inputs
+		await simulate("embed")
+		matrix = stub.embed_matrix(inputs)
+		tokens = sum(stub.count_tokens(t) for t in inputs)
+		return {
+			"object": "list",
+			"model": body.get("model", "stub"),
+			"data": [{"object": "embedding", "index": i, "embedding": row.tolist()} for i, row in enumerate(matrix)],
+			"usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+		}
+
+	@app.post("/v1/moderations")
+	async def moderations(request: Request):
+		body = await request.json()
+		text = body.get("input") or ""
+		text = " ".join(text) if isinstance(text, list) else text
+		await simulate("moderate")
+		return {
+			"id": f"modr-stub-{time.time_ns()}",
+			"model": body.get("model", "stub"),
+			"results": [{"flagged": stub.is_flagged(text), "categories": {}, "category_scores": {}}],
+		}
+
+	return app
+
+
+def main():
+	import uvicorn
+
+	parser = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=9100)
+	args = parser.parse_args()
+	uvicorn.run(build_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,80 @@
+from datetime import datetime
+from typing import Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.auth.security import require_admin
+from app.db.database import get_db
+from app.db.models import PromptVersion
+from app.services import analytics_service
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+def _versions(db: Session, prompt_id: Optional[int]) -> Optional[Dict[int, int]]:
+	"""prompt_version_id -> version number for ``prompt_id`` (None: no filter)."""
+	if prompt_id is None:
+		return None
+	rows = db.query(PromptVersion.id, PromptVersion.version).filter(PromptVersion.prompt_id == prompt_id).all()
+	if not rows:
+		raise HTTPException(status_code=404, detail="Prompt not found")
+	return {pv_id: version for pv_id, version in rows}
+
+
+def _label(series: dict, versions: Optional[Dict[int, int]]) -> list:
+	return [
+		{"prompt_version_id": pv or None, "version": versions.get(pv) if versions else None, "points": points}
+		for pv, points in series.items()
+	]
+
+
+@router.get("/analytics/scores")
+def score_analytics(
+	prompt_id: Optional[int] = None,
+	metric: str = Query("overall", description="overall or a criterion name"),
+	granularity: str = Query("day", description="hour | day | week | month"),
+	start: Optional[datetime] = None,
+	end: Optional[datetime] = None,
+	db: Session = Depends(get_db),
+):
+	"""Judge score distribution per prompt version and time bucket."""
+	versions = _versions(db, prompt_id)
+	try:
+		series = analytics_service.score_series(db, metric, granularity, versions.keys() if versions is not None else None, start, end)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	return {"metric": metric, "granularity": granularity, "series": _label(series, versions)}
+
+
+@router.get("/analytics/labels")
+def label_analytics(
+	prompt_id: Optional[int] = None,
+	granularity: str = Query("day", description="hour | day | week | month"),
+	start: Optional[datetime] = None,
+	end: Optional[datetime] = None,
+	db: Session = Depends(get_db),
+):
+	"""Judge label counts and shares per prompt version and time bucket."""
+	versions = _versions(db, prompt_id)
+	try:
+		series = analytics_service.count_series(db, "label", granularity, versions.keys() if versions is not None else None, start, end)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	return {"granularity": granularity, "series": _label(series, versions)}
+
+
+@router.get("/analytics/guardrails")
+def guardrail_analytics(
+	prompt_id: Optional[int] = None,
+	by_version: bool = False,
+	granularity: str = Query("day", description="hour | day | week | month"),
+	start: Optional[datetime] = None,
+	end: Optional[datetime] = None,
+	db: Session = Depends(get_db),
+):
+	"""Guardrail action counts and rates (allow / warn / redact / block) per time bucket."""
+	versions = _versions(db, prompt_id)
+	try:
+		series = analytics_service.count_series(db, "guardrail", granularity, versions.keys() if versions is not None else None, start, end, by_version=by_version)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	return {"granularity": granularity, "series": _label(series, versions)}
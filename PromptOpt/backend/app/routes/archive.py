@@ -0,0 +1,58 @@
+import json
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.auth.security import require_admin
+from app.db.database import get_db
+from app.services import archive_service
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+def _ndjson(rows) -> StreamingResponse:
+	return StreamingResponse((json.dumps(row) + "\n" for row in rows), media_type="application/x-ndjson")
+
+
+@router.post("/archive/run")
+def run_archive(
+	older_than_days: float = Query(archive_service.ARCHIVE_AFTER_DAYS, ge=0),
+	max_batches: Optional[int] = Query(None, ge=1),
+	db: Session = Depends(get_db),
+):
+	"""Move conversations older than the cutoff, with their messages, evaluations and guardrails, to cold storage."""
+	before = datetime.utcnow() - timedelta(days=older_than_days)
+	return asdict(archive_service.archive_conversations(db, before, max_batches=max_batches))
+
+
+@router.get("/archive/stats")
+def archive_stats():
+	return archive_service.stats()
+
+
+@router.get("/archive/conversations")
+def export_conversations(
+	start: Optional[datetime] = None,
+	end: Optional[datetime] = None,
+	user_id: Optional[int] = None,
+	prompt_version_id: Optional[int] = None,
+):
+	"""Archived conversations with messages, evaluations and guardrails nested, streamed as NDJSON."""
+	where = {k: v for k, v in (("user_id", user_id), ("prompt_version_id", prompt_version_id)) if v is not None}
+	return _ndjson(archive_service.iter_conversations(start, end, where))
+
+
+@router.get("/archive/{table}")
+def export_rows(
+	table: str,
+	start: Optional[datetime] = None,
+	end: Optional[datetime] = None,
+	conversation_id: Optional[int] = None,
+):
+	"""Archived rows of one table, streamed as NDJSON."""
+	if table not in archive_service.TABLES:
+		raise HTTPException(status_code=404, detail="Unknown archive table")
+	where = {"conversation_id": conversation_id} if conversation_id is not None else None
+	return _ndjson(archive_service.iter_rows(table, start, end, where))
@@ -1,30 +1,70 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+import os
+import math
+from fastapi import APIRouter, HTTPException, Request, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
 from app.models.user import Token
 from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.db.models import User as ORMUser
-from app.auth.security import verify_password, create_access_token, get_current_user
+from app.auth.security import create_access_token, get_current_user
+from app.auth.hashing import HashingBusy, password_hasher
+from app.auth.user_cache import AuthenticatedUser
+from app.utils.rate_limit import RateLimiter, client_ip
+from app.utils.tracing import registry
 
 router = APIRouter()
 
 
-def authenticate_user(db: Session, username: str, password: str) -> ORMUser | None:
+LOGIN_RATE_LIMIT_ENABLED = os.getenv("LOGIN_RATE_LIMIT_ENABLED", "true").lower() == "true"
+login_ip_limiter = RateLimiter(
+	capacity=float(os.getenv("LOGIN_RATE_IP_BURST", "20")),
+	per_minute=float(os.getenv("LOGIN_RATE_IP_PER_MINUTE", "60")),
+)
+login_user_limiter = RateLimiter(
+	capacity=float(os.getenv("LOGIN_RATE_USER_BURST", "5")),
+	per_minute=float(os.getenv("LOGIN_RATE_USER_PER_MINUTE", "10")),
+)
+LOGIN_REJECTED = registry.counter("promptopt_login_rejected_total", "Login attempts rejected before password verification.", ("reason",))
+
+
+def _enforce_login_rate_limit(request: Request, username: str) -> None:
+	"""Reject excess attempts per client IP, then per username, before any bcrypt work."""
+	if not LOGIN_RATE_LIMIT_ENABLED:
+		return
+	for reason, limiter, key in (("ip", login_ip_limiter, client_ip(request)), ("username", login_user_limiter, username.strip().lower())):
+		allowed, retry_after = limiter.hit(key)
+		if not allowed:
+			LOGIN_REJECTED.inc(reason)
+			raise HTTPException(
+				status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+				detail="Too many login attempts",
+				headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+			)
+
+
+async def authenticate_user(db: Session, username: str, password: str) -> ORMUser | None:
 	user = db.query(ORMUser).filter(ORMUser.username == username).first()
-	if user and verify_password(password, user.password_hash):
+	# Return the pooled connection before the slow hash: a login burst must not drain the pool.
+	db.close()
+	if user and await password_hasher.verify(password, user.password_hash):
 		return user
 	return None
 
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-	user = authenticate_user(db, form_data.username, form_data.password)
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+	_enforce_login_rate_limit(request, form_data.username)
+	try:
+		user = await authenticate_user(db, form_data.username, form_data.password)
+	except HashingBusy:
+		LOGIN_REJECTED.inc("hash_queue_full")
+		raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Login temporarily overloaded", headers={"Retry-After": "1"})
 	if not user:
 		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-	token = create_access_token(subject=user.username, role=user.role)
+	token = create_access_token(subject=user.username, role=user.role, user_id=user.id)
 	return {"access_token": token, "token_type": "bearer"}
 
 
 @router.get("/me")
-def me(current: ORMUser = Depends(get_current_user)):
+def me(current: AuthenticatedUser = Depends(get_current_user)):
 	return {"id": current.id, "username": current.username, "role": current.role}
@@ -1,28 +1,38 @@
 from fastapi import APIRouter, HTTPException, status, Depends
-from app.models.chat import ChatRequest, ChatResponse, ProvenanceItem
-from app.services.llm_service import LLMService
+from app.models.chat import ChatRequest, ChatResponse, ProvenanceItem, CacheInfo
 from typing import List, Optional
-from app.services.evaluation_service import EvaluationService
 from app.utils.guardrails import analyze_guardrails
-from app.utils.moderation import ModerationService
 from app.models.evaluation import GuardrailAnalysis
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, asc
+from sqlalchemy import desc
 from app.db.database import get_db
-from app.db.models import Conversation, Message, Evaluation as ORMEval, Guardrail as ORMGuardrail, PromptVersion, User as ORMUser, Prompt as ORMPrompt
+from app.db.models import Conversation, Message, Evaluation as ORMEval, Guardrail as ORMGuardrail, PromptVersion, Prompt as ORMPrompt
 from app.auth.security import get_current_user, require_admin
-from app.services.rag_service import RAGService
+from app.auth.user_cache import AuthenticatedUser
+from app.services.cache_service import response_cache
+from app.services.container import services
+from app.services.model_router import ModelRouter
+from app.services.experiment_service import ExperimentService
+from app.services.intent_gate import IntentGate
+from app.services import usage_service
+from app.utils.tracing import span
+from app.utils.singleflight import SingleFlight
 from datetime import datetime
 import os
+import time
+import asyncio
+import logging
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
-llm_service = LLMService()
-evaluation_service = EvaluationService()
-moderation = ModerationService()
-rag_service = RAGService()
+model_router = ModelRouter()
+experiment_service = ExperimentService()
+intent_gate = IntentGate()
+# Identical in-flight questions (same prompt version, context and normalized message) share one completion.
+chat_flight = SingleFlight("chat")
 
 
-def _role_based_prompt_id(user: ORMUser) -> Optional[int]:
+def _role_based_prompt_id(user: AuthenticatedUser) -> Optional[int]:
     env = os.getenv
     if user.role == 'admin' and env('DEFAULT_PROMPT_ADMIN_ID'):
         try:
@@ -47,17 +57,13 @@ def _is_restricted_for_employee(db: Session, prompt_id: Optional[int], role: str
     return ('recruit' in title) or ('onboard' in title)
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_with_hr_assistant(request: ChatRequest, db: Session = Depends(get_db), current_user: ORMUser = Depends(get_current_user)):
+async def chat_with_hr_assistant(request: ChatRequest, db: Session = Depends(get_db), current_user: AuthenticatedUser = Depends(get_current_user)):
     """
     Chat with the HR assistant using LLM
     """
     try:
-        # Pre-check moderation on user input
-        action, replacement = moderation.check(request.message)
-        if action == 'block':
-            raise HTTPException(status_code=400, detail="Message blocked by moderation policy")
-        if action == 'redact' and replacement:
-            request.message = replacement
+        # Provider calls made for this request (moderation, embeddings, generation, judging) are metered against the user
+        usage_service.attribute(user_id=current_user.id)
 
         # If no prompt_id is provided, try role-based default
         if request.prompt_id is None:
@@ -65,34 +71,128 @@ async def chat_with_hr_assistant(request: ChatRequest, db: Session = Depends(get
             if rb is not None:
                 request.prompt_id = rb
 
-        # Guard: employees cannot use recruiting/onboarding prompts
-        if _is_restricted_for_employee(db, request.prompt_id, current_user.role):
-            raise HTTPException(status_code=403, detail="Prompt not allowed for employee role")
-
-        # Resolve system prompt from DB if prompt_id specified
-        system_prompt_override = None
-        active_pv = None
-        if request.prompt_id:
-            active_pv = (
-                db.query(PromptVersion)
-                .filter(PromptVersion.prompt_id == request.prompt_id, PromptVersion.is_active == True)
-                .order_by(PromptVersion.version.desc())
-                .first()
-            )
-            if active_pv:
-                system_prompt_override = active_pv.content
+        with span("prompt_lookup"):
+            # Guard: employees cannot use recruiting/onboarding prompts
+            if _is_restricted_for_employee(db, request.prompt_id, current_user.role):
+                raise HTTPException(status_code=403, detail="Prompt not allowed for employee role")
+
+            # Resolve system prompt from DB if prompt_id specified
+            system_prompt_override = None
+            active_pv = None
+            if request.prompt_id:
+                active_versions = (
+                    db.query(PromptVersion)
+                    .filter(PromptVersion.prompt_id == request.prompt_id, PromptVersion.is_active == True)
+                    .all()
+                )
+                # Several active versions form an A/B experiment: sticky weighted pick per user
+                active_pv = experiment_service.choose_version(active_versions, current_user.id, request.prompt_id)
+                if active_pv:
+                    system_prompt_override = active_pv.content
+                    usage_service.attribute(prompt_version_id=active_pv.id)
+
+        # Hand the pooled DB connection back before awaiting upstream calls; rows loaded so far
+        # stay usable detached. Holding it across awaits exhausts the pool under concurrency.
+        db.close()
 
-        # Auto-RAG: if index has docs, add company context
+        # Pre-check moderation on user input
+        with span("moderation"):
+            action, replacement = await services.moderation.check(request.message)
+        if action == 'block':
+            raise HTTPException(status_code=400, detail="Message blocked by moderation policy")
+        if action == 'redact' and replacement:
+            request.message = replacement
+
+        # Auto-RAG: if index has docs and the message looks like it needs them, add company context.
+        # use_company_context forces retrieval on or off; otherwise the intent gate decides.
         provenance_items: List[ProvenanceItem] = []
-        status = rag_service.status()
+        prov = []
+        query_vec = None
+        gate = intent_gate.decide(request.message, len(request.conversation_history or []), force=request.use_company_context)
+        status = services.rag.status() if gate.retrieve else {}
         if status.get("has_index") and status.get("documents", 0) > 0:
-            base = system_prompt_override or llm_service.get_prompt_content(request.prompt_id)
-            prompt, prov = rag_service.build_system_prompt_with_provenance(base_prompt=base, query=request.message, top_k=4)
-            system_prompt_override = prompt
-            provenance_items = [ProvenanceItem(text=p.get("text", "")[:300], score=p.get("score"), source=p.get("source")) for p in prov]
+            base = system_prompt_override or services.llm.get_prompt_content(request.prompt_id)
+            try:
+                rag_started = time.perf_counter()
+                with span("rag.embed"):
+                    query_vec = await services.rag.embed_query_async(request.message)
+                with span("rag.retrieve"):
+                    prompt, prov = services.rag.build_system_prompt_with_provenance(base_prompt=base, query=request.message, top_k=4, query_vec=query_vec)
+                intent_gate.record_retrieval(time.perf_counter() - rag_started, found=bool(prov))
+                system_prompt_override = prompt
+                provenance_items = [ProvenanceItem(text=p.get("text", "")[:300], score=p.get("score"), source=p.get("source"), also_in=p.get("also_in")) for p in prov]
+            except Exception as e:
+                # Embedding provider degraded (timeout / circuit open): answer without company context
+                logger.warning("RAG retrieval skipped: %s", e)
 
-        # Generate response using LLM service (DB prompt wins)
-        response = await llm_service.generate_response(request, system_prompt_override=system_prompt_override)
+        # Response cache: exact match first, then semantic match on the question embedding.
+        # Messages the gate skipped get the exact tier only, so they cost no embedding call at all.
+        def _embed_for_cache():
+            nonlocal query_vec
+            if query_vec is None:
+                query_vec = services.rag.embed_query(request.message)
+            return query_vec
+
+        # Keyed by the snapshot version too, so every worker misses after a publish, not just the one that ingested.
+        cache_ns = response_cache.namespace(active_pv.id if active_pv else None, request.prompt_id, prov, status.get("version"))
+        with span("cache.lookup"):
+            # In a worker thread: a semantic lookup may block on (or coalesce with) an embedding call.
+            hit = await asyncio.to_thread(response_cache.get, cache_ns, request.message, request.conversation_history,
+                                          embed=_embed_for_cache if gate.retrieve else None)
+
+        if hit is not None:
+            response = ChatResponse(
+                response=hit.entry.response,
+                prompt_used=hit.entry.prompt_used,
+                response_time=hit.lookup_ms / 1000,
+                conversation_id=f"conv_{int(time.time())}",
+                cache=CacheInfo(
+                    hit=True,
+                    tier=hit.tier,
+                    similarity=hit.similarity,
+                    age_seconds=time.time() - hit.entry.created_at,
+                    lookup_ms=hit.lookup_ms,
+                ),
+            )
+        else:
+            # Pick model + generation settings (prompt version settings win, then routing rules)
+            with span("routing"):
+                decision = model_router.route(
+                    request.message,
+                    context_chars=sum(len(p.get("text", "")) for p in prov),
+                    history_turns=len(request.conversation_history or []),
+                    prompt_version=active_pv,
+                )
+            # Generate response using LLM service (DB prompt wins)
+            flight_key = (response_cache.make_key(cache_ns, request.message, request.conversation_history), decision.settings)
+            with span("llm"):
+                response, shared = await chat_flight.do(
+                    flight_key,
+                    lambda: services.llm.generate_response(request, system_prompt_override=system_prompt_override, settings=decision.settings),
+                )
+            # The flight result is shared with followers: leader and followers each annotate their own copy.
+            response = response.model_copy(deep=True)
+            if not shared:
+                model_router.record(decision, response.response_time or 0.0, ok=not response.degraded)
+            else:
+                # Followers made no provider call; the leader's request carries the usage.
+                response.usage = None
+            response.route = decision.route
+            if response_cache.enabled:
+                response.cache = CacheInfo(hit=False)
+                if not response.degraded:
+                    with span("cache.store"):
+                        response_cache.put(
+                            cache_ns,
+                            request.prompt_id,
+                            request.message,
+                            response.response,
+                            response.prompt_used,
+                            history=request.conversation_history,
+                            query_vec=query_vec,
+                        )
+
+        response.prompt_version_id = active_pv.id if active_pv else None
 
         # Guardrails analysis and potential redaction/warn
         guardrails_report = analyze_guardrails(request.message, response.response)
@@ -100,61 +200,60 @@ async def chat_with_hr_assistant(request: ChatRequest, db: Session = Depends(get
         if guardrails.action == "redact" and guardrails.redacted_text:
             response.response = guardrails.redacted_text
 
-        # Persist conversation and messages
-        conv = Conversation(user_id=current_user.id)
-        if active_pv:
-            conv.prompt_version_id = active_pv.id
-        db.add(conv)
-        db.flush()
-
-        m_user = Message(conversation_id=conv.id, role="user", content=request.message)
-        m_assistant = Message(conversation_id=conv.id, role="assistant", content=response.response)
-        db.add_all([m_user, m_assistant])
-        db.flush()
-
-        # Optional evaluation
+        # Optional evaluation (before any DB writes: no transaction is held open across awaits)
+        evaluation = None
         if request.evaluate:
-            evaluation = await evaluation_service.evaluate(
+            evaluation = await services.evaluation.evaluate(
                 user_message=request.message,
                 assistant_response=response.response,
                 prompt_used=response.prompt_used,
             )
             response.evaluation = evaluation
-            db.add(ORMEval(
+
+        # Persist conversation and messages
+        promoted = None
+        with span("db.persist"):
+            conv = Conversation(user_id=current_user.id)
+            if active_pv:
+                conv.prompt_version_id = active_pv.id
+            db.add(conv)
+            db.flush()
+
+            m_user = Message(conversation_id=conv.id, role="user", content=request.message)
+            m_assistant = Message(conversation_id=conv.id, role="assistant", content=response.response)
+            db.add_all([m_user, m_assistant])
+            db.flush()
+
+            if evaluation is not None:
+                db.add(ORMEval(
+                    conversation_id=conv.id,
+                    message_id=m_assistant.id,
+                    overall=evaluation.overall_score,
+                    criteria=evaluation.criteria.dict(),
+                    label=evaluation.label,
+                    judge_model=evaluation.judge_model,
+                ))
+                # Online experiment scoring; heuristic fallbacks and degraded answers say nothing about the prompt
+                if active_pv and evaluation.judge_model != "heuristic" and not response.degraded:
+                    experiment_service.record_score(db, active_pv.id, evaluation.overall_score)
+                    promoted = experiment_service.maybe_promote(db, request.prompt_id, scored_version_id=active_pv.id)
+                    if promoted is not None:
+                        logger.info("Experiment on prompt %s promoted version %s", request.prompt_id, promoted.version)
+
+            # Attach guardrails and provenance
+            response.guardrails = guardrails
+            response.provenance = provenance_items or None
+            response.timestamp = datetime.utcnow()
+            db.add(ORMGuardrail(
                 conversation_id=conv.id,
                 message_id=m_assistant.id,
-                overall=evaluation.overall_score,
-                criteria=evaluation.criteria.dict(),
-                label=evaluation.label,
-                judge_model=evaluation.judge_model,
+                action=guardrails.action,
+                report=guardrails.dict(),
             ))
 
-        # Attach guardrails and provenance
-        response.guardrails = guardrails
-        response.provenance = provenance_items or None
-        response.timestamp = datetime.utcnow()
-        db.add(ORMGuardrail(
-            conversation_id=conv.id,
-            message_id=m_assistant.id,
-            action=guardrails.action,
-            report=guardrails.dict(),
-        ))
-
-        db.commit()
-
-        # prune old conversations to keep only the latest 10
-        count = db.query(Conversation).count()
-        if count > 10:
-            # delete the oldest ones beyond 10
-            to_delete = (
-                db.query(Conversation)
-                .order_by(asc(Conversation.started_at))
-                .limit(count - 10)
-                .all()
-            )
-            for c in to_delete:
-                db.delete(c)
             db.commit()
+            if promoted is not None:
+                response_cache.invalidate_prompt(request.prompt_id)
 
         return response
     except HTTPException:
@@ -165,6 +264,31 @@ async def chat_with_hr_assistant(request: ChatRequest, db: Session = Depends(get
             detail=f"Error processing chat request: {str(e)}"
         )
 
+@router.get("/chat/cache/stats", dependencies=[Depends(require_admin)])
+def get_cache_stats():
+    return response_cache.stats()
+
+@router.get("/chat/router/stats", dependencies=[Depends(require_admin)])
+def get_router_stats():
+    return model_router.stats()
+
+@router.get("/chat/gate/stats", dependencies=[Depends(require_admin)])
+def get_gate_stats():
+    return intent_gate.stats()
+
+@router.get("/chat/coalescing/stats", dependencies=[Depends(require_admin)])
+def get_coalescing_stats():
+    return {f.name: f.stats() for f in (chat_flight, services.rag.embed_flight)}
+
+@router.get("/chat/judge/stats", dependencies=[Depends(require_admin)])
+def get_judge_stats():
+    return services.evaluation.stats()
+
+@router.get("/chat/upstream/stats", dependencies=[Depends(require_admin)])
+def get_upstream_stats():
+    clients = [services.llm.resilient, services.evaluation.resilient, services.moderation.resilient, services.rag.resilient]
+    return {c.name: c.stats() for c in clients}
+
 @router.get("/chat/logs", dependencies=[Depends(require_admin)])
 def get_conversation_logs(db: Session = Depends(get_db)):
     items = (
@@ -0,0 +1,92 @@
+import os
+import re
+import json
+import uuid
+import asyncio
+import logging
+import tempfile
+from typing import Dict, List
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from app.auth.security import require_admin
+from app.services.batch_eval import MANIFEST, REPORT, BatchEvalRun, load_versions
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+EVAL_RUNS_DIR = os.getenv("EVAL_RUNS_DIR", os.path.join("data", "eval_runs"))
+_RUN_ID = re.compile(r"^[0-9a-f]{32}$")
+# Background tasks of this process, by run id. Runs survive restarts on disk; resume them via the API.
+_tasks: Dict[str, asyncio.Task] = {}
+
+
+def _run_dir(run_id: str) -> str:
+	path = os.path.join(EVAL_RUNS_DIR, run_id)
+	if not _RUN_ID.match(run_id) or not os.path.exists(os.path.join(path, MANIFEST)):
+		raise HTTPException(status_code=404, detail="Evaluation run not found")
+	return path
+
+
+def _start(run_id: str, run: BatchEvalRun) -> None:
+	async def _go():
+		try:
+			await run.run()
+		except Exception:
+			logger.exception("Evaluation run %s failed", run_id)
+			raise
+
+	_tasks[run_id] = asyncio.create_task(_go())
+
+
+@router.post("/eval/runs", dependencies=[Depends(require_admin)])
+async def create_eval_run(
+	file: UploadFile = File(...),
+	prompt_id: int = Form(...),
+	versions: str = Form(""),
+	concurrency: int = Form(16),
+):
+	"""Start an offline evaluation of prompt versions over an uploaded JSONL golden dataset."""
+	try:
+		numbers: List[int] = [int(x) for x in versions.split(",") if x.strip()]
+		selected = load_versions(prompt_id, numbers)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	if not selected:
+		raise HTTPException(status_code=404, detail="Prompt has no versions")
+
+	run_id = uuid.uuid4().hex
+	os.makedirs(EVAL_RUNS_DIR, exist_ok=True)
+	with tempfile.NamedTemporaryFile("wb", suffix=".jsonl", dir=EVAL_RUNS_DIR, delete=False) as tmp:
+		tmp.write(await file.read())
+	try:
+		run = BatchEvalRun.create(os.path.join(EVAL_RUNS_DIR, run_id), tmp.name, selected, concurrency=max(1, min(concurrency, 64)))
+	except (ValueError, json.JSONDecodeError) as e:
+		raise HTTPException(status_code=400, detail=f"Invalid dataset: {e}")
+	finally:
+		os.unlink(tmp.name)
+	_start(run_id, run)
+	return {"run_id": run_id, **run.status()}
+
+
+@router.get("/eval/runs/{run_id}", dependencies=[Depends(require_admin)])
+def get_eval_run(run_id: str):
+	path = _run_dir(run_id)
+	task = _tasks.get(run_id)
+	out = {"run_id": run_id, **BatchEvalRun(path).status(), "running": bool(task and not task.done())}
+	if task and task.done() and not task.cancelled() and task.exception():
+		out["error"] = str(task.exception())
+	report_path = os.path.join(path, REPORT)
+	if out["finished"]:
+		with open(report_path, "r", encoding="utf-8") as f:
+			out["report"] = json.load(f)
+	return out
+
+
+@router.post("/eval/runs/{run_id}/resume", dependencies=[Depends(require_admin)])
+async def resume_eval_run(run_id: str):
+	path = _run_dir(run_id)
+	task = _tasks.get(run_id)
+	if task and not task.done():
+		raise HTTPException(status_code=409, detail="Evaluation run is already running")
+	run = BatchEvalRun(path)
+	_start(run_id, run)
+	return {"run_id": run_id, **run.status()}
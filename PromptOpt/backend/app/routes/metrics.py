@@ -0,0 +1,35 @@
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from app.auth.security import require_admin
+from app.utils.tracing import registry
+from app.utils.profiler import profiler
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics(authorization: Optional[str] = Header(default=None)):
+	# Scrapers usually can't log in; guard with a static bearer token when METRICS_TOKEN is set.
+	token = os.getenv("METRICS_TOKEN")
+	if token and authorization != f"Bearer {token}":
+		raise HTTPException(status_code=401, detail="Invalid metrics token")
+	return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/debug/profiler", dependencies=[Depends(require_admin)])
+def profiler_status():
+	return profiler.status()
+
+
+@router.post("/debug/profiler/start", dependencies=[Depends(require_admin)])
+def profiler_start(interval_ms: float = Query(10.0, ge=1.0, le=1000.0)):
+	started = profiler.start(interval_ms / 1000)
+	return {"started": started, **profiler.status()}
+
+
+@router.post("/debug/profiler/stop", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+def profiler_stop():
+	"""Stop sampling and return collapsed stacks (feed to flamegraph.pl or speedscope)."""
+	return PlainTextResponse(profiler.stop())
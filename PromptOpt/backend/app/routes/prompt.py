@@ -1,8 +1,12 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from app.models.prompt import Prompt as PromptSchema, PromptVersionOut
-from typing import List
+import hashlib
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Response
+from app.models.prompt import Prompt as PromptSchema, PromptVersionOut, ExperimentConfig, ExperimentOut, ExperimentArmOut
+from typing import List, Optional
 from app.models.evaluation import EvaluationRequest, EvaluationResult
-from app.services.evaluation_service import EvaluationService
+from app.services.container import services
+from app.services.cache_service import response_cache
+from app.services.experiment_service import ExperimentService
+from sqlalchemy import func, and_
 from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.db.models import Prompt as ORMPrompt, PromptVersion as ORMPromptVersion
@@ -10,12 +14,71 @@ from app.auth.security import require_admin, get_current_user
 
 router = APIRouter()
 
-eval_service = EvaluationService()
+experiment_service = ExperimentService()
+
+GENERATION_FIELDS = ("model", "max_tokens", "temperature", "timeout_seconds")
+
+
+def _generation_settings(prompt: PromptSchema, inherit_from: ORMPromptVersion | None = None) -> dict:
+	"""Generation settings for a new version; unset fields carry over from the previous version."""
+	out = {}
+	for name in GENERATION_FIELDS:
+		value = getattr(prompt, name)
+		if value is None and inherit_from is not None:
+			value = getattr(inherit_from, name)
+		out[name] = value
+	return out
+
+
+def _prompt_out(p: ORMPrompt, v: ORMPromptVersion) -> PromptSchema:
+	return PromptSchema(id=p.id, title=p.title, content=v.content, created_by=p.created_by, **{n: getattr(v, n) for n in GENERATION_FIELDS})
+
+
+def _listing_etag(db: Session, limit: Optional[int], offset: int) -> tuple:
+	"""(weak ETag, prompt count); the ETag changes whenever any prompt or version does (``Prompt.updated_at``)."""
+	count, last_change = db.query(func.count(ORMPrompt.id), func.max(ORMPrompt.updated_at)).one()
+	digest = hashlib.sha1(f"{count}|{last_change}|{limit}|{offset}".encode("utf-8")).hexdigest()[:16]
+	return f'W/"{digest}"', count
+
 
 @router.get("/prompts", response_model=List[PromptSchema])
-def list_prompts(db: Session = Depends(get_db)):
-	rows = db.query(ORMPrompt).all()
-	return [PromptSchema(id=r.id, title=r.title, content=(r.versions[0].content if r.versions else ""), created_by=r.created_by) for r in rows]
+def list_prompts(
+	request: Request,
+	response: Response,
+	limit: Optional[int] = Query(None, ge=1, le=1000),
+	offset: int = Query(0, ge=0),
+	db: Session = Depends(get_db),
+):
+	"""Prompts with their live version's content, by id. ``X-Total-Count`` carries the unpaginated total.
+
+	Polling clients send ``If-None-Match``; an unchanged listing costs one aggregate query and a 304.
+	During an A/B experiment the newest active version stands for the prompt.
+	"""
+	etag, total = _listing_etag(db, limit, offset)
+	headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Total-Count": str(total)}
+	if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+		return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+	response.headers.update(headers)
+
+	live = (
+		db.query(ORMPromptVersion.prompt_id, func.max(ORMPromptVersion.version).label("version"))
+		.filter(ORMPromptVersion.is_active == True)
+		.group_by(ORMPromptVersion.prompt_id)
+		.subquery()
+	)
+	query = (
+		db.query(ORMPrompt.id, ORMPrompt.title, ORMPrompt.created_by, ORMPromptVersion.content, *(getattr(ORMPromptVersion, n) for n in GENERATION_FIELDS))
+		.outerjoin(live, live.c.prompt_id == ORMPrompt.id)
+		.outerjoin(ORMPromptVersion, and_(ORMPromptVersion.prompt_id == ORMPrompt.id, ORMPromptVersion.version == live.c.version))
+		.order_by(ORMPrompt.id)
+		.offset(offset)
+	)
+	if limit is not None:
+		query = query.limit(limit)
+	return [
+		PromptSchema(id=r.id, title=r.title, content=r.content or "", created_by=r.created_by, **{n: getattr(r, n) for n in GENERATION_FIELDS})
+		for r in query.all()
+	]
 
 @router.get("/prompts/{prompt_id}/versions", response_model=List[PromptVersionOut])
 def list_prompt_versions(prompt_id: int, db: Session = Depends(get_db), current_user=Depends(require_admin)):
@@ -23,18 +86,18 @@ def list_prompt_versions(prompt_id: int, db: Session = Depends(get_db), current_
 	if not p:
 		raise HTTPException(status_code=404, detail="Prompt not found")
 	versions = db.query(ORMPromptVersion).filter(ORMPromptVersion.prompt_id == prompt_id).order_by(ORMPromptVersion.version.desc()).all()
-	return [PromptVersionOut(id=v.id, version=v.version, content=v.content, is_active=v.is_active, created_at=v.created_at) for v in versions]
+	return [PromptVersionOut(id=v.id, version=v.version, content=v.content, is_active=v.is_active, traffic_weight=v.traffic_weight, created_at=v.created_at, **{n: getattr(v, n) for n in GENERATION_FIELDS}) for v in versions]
 
 @router.post("/prompts", response_model=PromptSchema)
 def create_prompt(prompt: PromptSchema, db: Session = Depends(get_db), current_user=Depends(require_admin)):
 	p = ORMPrompt(title=prompt.title, created_by=current_user.username)
 	db.add(p)
 	db.flush()
-	v = ORMPromptVersion(prompt_id=p.id, version=1, content=prompt.content, is_active=True)
+	v = ORMPromptVersion(prompt_id=p.id, version=1, content=prompt.content, is_active=True, **_generation_settings(prompt))
 	db.add(v)
 	db.commit()
 	db.refresh(p)
-	return PromptSchema(id=p.id, title=p.title, content=v.content, created_by=p.created_by)
+	return _prompt_out(p, v)
 
 @router.patch("/prompts/{prompt_id}/title")
 def rename_prompt(prompt_id: int, payload: dict, db: Session = Depends(get_db), current_user=Depends(require_admin)):
@@ -58,12 +121,13 @@ def update_prompt(prompt_id: int, prompt: PromptSchema, db: Session = Depends(ge
 		.order_by(ORMPromptVersion.version.desc())
 		.first())
 	next_version = (latest_version.version + 1) if latest_version else 1
-	v = ORMPromptVersion(prompt_id=prompt_id, version=next_version, content=prompt.content, is_active=True)
-	if latest_version:
-		latest_version.is_active = False
+	v = ORMPromptVersion(prompt_id=prompt_id, version=next_version, content=prompt.content, is_active=True, **_generation_settings(prompt, latest_version))
+	# A new version replaces whatever is live, including every arm of a running experiment
+	db.query(ORMPromptVersion).filter(ORMPromptVersion.prompt_id == prompt_id, ORMPromptVersion.is_active == True).update({"is_active": False})
 	db.add(v)
 	db.commit()
-	return PromptSchema(id=p.id, title=p.title, content=v.content, created_by=p.created_by)
+	response_cache.invalidate_prompt(prompt_id)
+	return _prompt_out(p, v)
 
 @router.post("/prompts/{prompt_id}/activate/{version}")
 def activate_prompt_version(prompt_id: int, version: int, db: Session = Depends(get_db), current_user=Depends(require_admin)):
@@ -75,13 +139,61 @@ def activate_prompt_version(prompt_id: int, version: int, db: Session = Depends(
 		if v.version == version:
 			found = v
 			v.is_active = True
+			v.traffic_weight = None
 		else:
 			v.is_active = False
 	if not found:
 		raise HTTPException(status_code=404, detail="Version not found")
 	db.commit()
+	response_cache.invalidate_prompt(prompt_id)
 	return {"ok": True}
 
+def _experiment_out(db: Session, prompt_id: int) -> ExperimentOut:
+	active = db.query(ORMPromptVersion).filter(ORMPromptVersion.prompt_id == prompt_id, ORMPromptVersion.is_active == True).all()
+	arms = experiment_service.summaries(db, active)
+	total = sum(a.weight for a in arms) or 1.0
+	leader = experiment_service.winner(arms)
+	return ExperimentOut(
+		prompt_id=prompt_id,
+		arms=[ExperimentArmOut(
+			prompt_version_id=a.prompt_version_id,
+			version=a.version,
+			weight=a.weight,
+			traffic_share=a.weight / total,
+			n=a.n,
+			mean_score=a.mean if a.n else None,
+			std_error=a.std_error if a.n > 1 else None,
+		) for a in arms],
+		auto_promote=experiment_service.auto_promote,
+		min_samples=experiment_service.min_samples,
+		checkpoints=experiment_service.checkpoints,
+		leader_version=leader.version if leader else None,
+	)
+
+@router.get("/prompts/{prompt_id}/experiment", response_model=ExperimentOut)
+def get_experiment(prompt_id: int, db: Session = Depends(get_db), current_user=Depends(require_admin)):
+	if not db.query(ORMPrompt).filter(ORMPrompt.id == prompt_id).first():
+		raise HTTPException(status_code=404, detail="Prompt not found")
+	return _experiment_out(db, prompt_id)
+
+@router.put("/prompts/{prompt_id}/experiment", response_model=ExperimentOut)
+def configure_experiment(prompt_id: int, config: ExperimentConfig, db: Session = Depends(get_db), current_user=Depends(require_admin)):
+	versions = {v.version: v for v in db.query(ORMPromptVersion).filter(ORMPromptVersion.prompt_id == prompt_id).all()}
+	if not versions:
+		raise HTTPException(status_code=404, detail="Prompt not found")
+	weights = {a.version: a.weight for a in config.arms}
+	missing = sorted(set(weights) - set(versions))
+	if missing:
+		raise HTTPException(status_code=404, detail=f"Version(s) not found: {missing}")
+	if sum(weights.values()) <= 0:
+		raise HTTPException(status_code=400, detail="At least one arm needs a positive weight")
+	for number, v in versions.items():
+		v.is_active = number in weights
+		v.traffic_weight = weights.get(number)
+	db.commit()
+	response_cache.invalidate_prompt(prompt_id)
+	return _experiment_out(db, prompt_id)
+
 @router.delete("/prompts/{prompt_id}")
 def delete_prompt(prompt_id: int, db: Session = Depends(get_db), current_user=Depends(require_admin)):
 	p = db.query(ORMPrompt).filter(ORMPrompt.id == prompt_id).first()
@@ -89,12 +201,13 @@ def delete_prompt(prompt_id: int, db: Session = Depends(get_db), current_user=De
 		raise HTTPException(status_code=404, detail="Prompt not found")
 	db.delete(p)
 	db.commit()
+	response_cache.invalidate_prompt(prompt_id)
 	return {"ok": True}
 
 @router.post("/evaluate", response_model=EvaluationResult)
 async def evaluate_response(payload: EvaluationRequest):
 	try:
-		result = await eval_service.evaluate(
+		result = await services.evaluation.evaluate(
 			user_message=payload.user_message,
 			assistant_response=payload.assistant_response,
 			prompt_used=payload.prompt_used,
@@ -1,23 +1,29 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 import os
-from app.services.rag_service import RAGService, INDEX_DIR
+import asyncio
 from app.auth.security import require_admin
+from app.services.cache_service import response_cache
+from app.services.container import services
 
 router = APIRouter()
-rag = RAGService()
 
 @router.post("/rag/ingest")
 async def rag_ingest(file: UploadFile = File(...), current_user=Depends(require_admin)):
 	try:
+		from app.services.rag_service import INDEX_DIR
+
 		os.makedirs(INDEX_DIR, exist_ok=True)
 		target = os.path.join(INDEX_DIR, file.filename)
 		with open(target, "wb") as f:
 			f.write(await file.read())
-		count = rag.ingest_pdf(target)
-		return {"ok": True, "chunks": count}
+		# Parsing, embedding and the cross-process snapshot lock all block: keep them off the event loop.
+		result = await asyncio.to_thread(services.rag.ingest_pdf, target)
+		if result.indexed or result.merged:
+			response_cache.invalidate_collection()
+		return {"ok": True, "chunks": result.indexed, "duplicates": result.duplicates, "merged": result.merged}
 	except Exception as e:
 		raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/rag/status")
 def rag_status(current_user=Depends(require_admin)):
-	return rag.status()
+	return services.rag.status()
@@ -0,0 +1,44 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.auth.security import require_admin
+from app.db.database import get_db
+from app.db.models import PromptVersion
+from app.services import usage_service
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/usage/users")
+def usage_by_user(
+	start: Optional[datetime] = None,
+	end: Optional[datetime] = None,
+	user_id: Optional[int] = None,
+	db: Session = Depends(get_db),
+):
+	"""Provider calls, tokens, estimated cost and latency per user, most expensive first."""
+	usage_service.meter.flush(db)
+	ids = [user_id] if user_id is not None else None
+	return {"users": usage_service.totals(db, "user", start, end, ids)}
+
+
+@router.get("/usage/prompt-versions")
+def usage_by_prompt_version(
+	prompt_id: Optional[int] = None,
+	start: Optional[datetime] = None,
+	end: Optional[datetime] = None,
+	db: Session = Depends(get_db),
+):
+	"""Provider calls, tokens, estimated cost and latency per prompt version; ``operations.chat.avg_prompt_tokens`` is the prompt length."""
+	usage_service.meter.flush(db)
+	q = db.query(PromptVersion.id, PromptVersion.prompt_id, PromptVersion.version)
+	if prompt_id is not None:
+		q = q.filter(PromptVersion.prompt_id == prompt_id)
+	versions = {pv_id: (pid, version) for pv_id, pid, version in q.all()}
+	if prompt_id is not None and not versions:
+		raise HTTPException(status_code=404, detail="Prompt not found")
+	items = usage_service.totals(db, "prompt_version", start, end, versions.keys() if prompt_id is not None else None)
+	for item in items:
+		item["prompt_id"], item["version"] = versions.get(item["prompt_version_id"], (None, None))
+	return {"prompt_versions": items}
@@ -0,0 +1,184 @@
+"""Evaluation analytics backed by incrementally maintained rollup tables.
+
+Every inserted ``Evaluation`` adds its overall and per-criterion scores to
+``score_rollups`` and its label to ``count_rollups``; every ``Guardrail`` adds
+its action. Both are upserted in the inserting transaction (SQLAlchemy
+``after_insert`` mapper events), once per granularity (hour and day). Queries
+read only the rollup rows of the requested range: a year of daily buckets is a
+few hundred rows per series, however many conversations produced them.
+Rollups are history: pruning old conversations does not remove their counts.
+"""
+import math
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import case, event, select
+from sqlalchemy.orm import Session
+from app.db import models
+from app.db.upsert import upsert
+
+METRICS = ("overall", "helpfulness", "accuracy", "clarity", "safety", "relevance", "tone")
+STORED_GRANULARITIES = ("hour", "day")
+GRANULARITIES = ("hour", "day", "week", "month")
+HIST_BINS = 10  # half-point bins over 0-5
+_HIST_COLS = [f"h{i}" for i in range(HIST_BINS)]
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+	if granularity == "hour":
+		return ts.replace(minute=0, second=0, microsecond=0)
+	day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+	if granularity == "day":
+		return day
+	if granularity == "week":
+		return day - timedelta(days=day.weekday())
+	if granularity == "month":
+		return day.replace(day=1)
+	raise ValueError(f"unknown granularity {granularity!r}")
+
+
+def hist_bin(score: float) -> int:
+	return min(HIST_BINS - 1, max(0, int(score * 2)))
+
+
+# -- incremental maintenance ----------------------------------------------
+
+def _min_max(table, value: float) -> dict:
+	"""``SET`` expressions keeping a running min / max of the bucket."""
+	return {
+		"min": case((table.c.min.is_(None), value), (table.c.min < value, table.c.min), else_=value),
+		"max": case((table.c.max.is_(None), value), (table.c.max > value, table.c.max), else_=value),
+	}
+
+
+def _prompt_version_id(connection, conversation_id: int) -> int:
+	conv = models.Conversation.__table__
+	pv = connection.execute(select(conv.c.prompt_version_id).where(conv.c.id == conversation_id)).scalar()
+	return pv or 0
+
+
+def add_scores(connection, prompt_version_id: int, ts: datetime, scores: Dict[str, float]) -> None:
+	table = models.ScoreRollup.__table__
+	for granularity in STORED_GRANULARITIES:
+		start = bucket_start(ts, granularity)
+		for metric, score in scores.items():
+			score = float(score)
+			h = _HIST_COLS[hist_bin(score)]
+			key = {"prompt_version_id": prompt_version_id, "metric": metric, "granularity": granularity, "bucket_start": start}
+			values = {"n": 1, "total": score, "total_sq": score * score, "min": score, "max": score, **{c: int(c == h) for c in _HIST_COLS}}
+			upsert(connection, table, key, values, {"n": 1, "total": score, "total_sq": score * score, h: 1}, _min_max(table, score))
+
+
+def add_count(connection, prompt_version_id: int, ts: datetime, dimension: str, value: str) -> None:
+	table = models.CountRollup.__table__
+	for granularity in STORED_GRANULARITIES:
+		key = {
+			"prompt_version_id": prompt_version_id, "dimension": dimension, "granularity": granularity,
+			"bucket_start": bucket_start(ts, granularity), "value": value,
+		}
+		upsert(connection, table, key, {"n": 1}, {"n": 1})
+
+
+def _criteria_scores(evaluation) -> Dict[str, float]:
+	scores = {"overall": evaluation.overall}
+	for name, value in (evaluation.criteria or {}).items():
+		if name in METRICS and isinstance(value, (int, float)):
+			scores[name] = value
+	return scores
+
+
+@event.listens_for(models.Evaluation, "after_insert")
+def _rollup_evaluation(mapper, connection, target):
+	pv = _prompt_version_id(connection, target.conversation_id)
+	ts = target.created_at or datetime.utcnow()
+	add_scores(connection, pv, ts, _criteria_scores(target))
+	add_count(connection, pv, ts, "label", target.label or "unknown")
+
+
+@event.listens_for(models.Guardrail, "after_insert")
+def _rollup_guardrail(mapper, connection, target):
+	pv = _prompt_version_id(connection, target.conversation_id)
+	add_count(connection, pv, target.created_at or datetime.utcnow(), "guardrail", target.action)
+
+
+# -- queries ----------------------------------------------------------------
+
+def _stored(granularity: str) -> str:
+	if granularity not in GRANULARITIES:
+		raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+	return "hour" if granularity == "hour" else "day"
+
+
+def _range_filter(col, start: Optional[datetime], end: Optional[datetime]) -> list:
+	out = []
+	if start is not None:
+		out.append(col >= start)
+	if end is not None:
+		out.append(col < end)
+	return out
+
+
+def score_series(db: Session, metric: str, granularity: str, version_ids: Optional[Iterable[int]] = None,
+		start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[int, List[dict]]:
+	"""Per prompt version, time-ordered buckets with n, mean, std, min, max and the score histogram."""
+	if metric not in METRICS:
+		raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+	R = models.ScoreRollup
+	# Plain column tuples: no ORM identity bookkeeping for what can be thousands of rows
+	q = db.query(R.prompt_version_id, R.bucket_start, R.n, R.total, R.total_sq, R.min, R.max, *(getattr(R, c) for c in _HIST_COLS))
+	q = q.filter(R.metric == metric, R.granularity == _stored(granularity), *_range_filter(R.bucket_start, start, end))
+	if version_ids is not None:
+		q = q.filter(R.prompt_version_id.in_(list(version_ids)))
+	series: Dict[int, Dict[datetime, dict]] = {}
+	for pv, ts, n, total, total_sq, lo, hi, *hist in q.order_by(R.prompt_version_id, R.bucket_start):
+		b = bucket_start(ts, granularity)
+		acc = series.setdefault(pv, {}).get(b)
+		if acc is None:
+			series[pv][b] = {"n": n, "total": total, "total_sq": total_sq, "min": lo, "max": hi, "hist": hist}
+			continue
+		acc["n"] += n
+		acc["total"] += total
+		acc["total_sq"] += total_sq
+		acc["min"] = min(acc["min"], lo)
+		acc["max"] = max(acc["max"], hi)
+		acc["hist"] = [x + y for x, y in zip(acc["hist"], hist)]
+	out = {}
+	for pv, buckets in series.items():
+		points = []
+		for b, acc in buckets.items():
+			n = acc["n"]
+			mean = acc["total"] / n
+			var = max(0.0, (acc["total_sq"] - n * mean * mean) / (n - 1)) if n > 1 else 0.0
+			points.append({
+				"bucket": b.isoformat(),
+				"n": n,
+				"mean": round(mean, 4),
+				"std": round(math.sqrt(var), 4),
+				"min": acc["min"],
+				"max": acc["max"],
+				"histogram": acc["hist"],
+			})
+		out[pv] = points
+	return out
+
+
+def count_series(db: Session, dimension: str, granularity: str, version_ids: Optional[Iterable[int]] = None,
+		start: Optional[datetime] = None, end: Optional[datetime] = None, by_version: bool = True) -> Dict[int, List[dict]]:
+	"""Per prompt version (or all pooled under 0), time-ordered buckets with counts and rates per value."""
+	R = models.CountRollup
+	q = db.query(R.prompt_version_id, R.bucket_start, R.value, R.n)
+	q = q.filter(R.dimension == dimension, R.granularity == _stored(granularity), *_range_filter(R.bucket_start, start, end))
+	if version_ids is not None:
+		q = q.filter(R.prompt_version_id.in_(list(version_ids)))
+	series: Dict[int, Dict[datetime, Dict[str, int]]] = {}
+	for pv, ts, value, n in q.order_by(R.prompt_version_id, R.bucket_start):
+		counts = series.setdefault(pv if by_version else 0, {}).setdefault(bucket_start(ts, granularity), {})
+		counts[value] = counts.get(value, 0) + n
+	out = {}
+	for pv, buckets in series.items():
+		points = []
+		for b in sorted(buckets):
+			counts = buckets[b]
+			n = sum(counts.values())
+			points.append({"bucket": b.isoformat(), "n": n, "counts": counts, "rates": {k: round(v / n, 4) for k, v in counts.items()}})
+		out[pv] = points
+	return out
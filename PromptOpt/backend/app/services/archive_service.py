@@ -0,0 +1,354 @@
+"""Cold storage for old conversations and everything hanging off them.
+
+Conversations that started before the retention cutoff are moved, a batch at a
+time, out of the hot tables into compressed NDJSON parts partitioned by table
+and month of the conversation:
+
+    <ARCHIVE_DIR>/conversations/month=2026-03/part-000000000001-000000000500.ndjson.zst
+    <ARCHIVE_DIR>/messages/month=2026-03/part-000000000001-000000000500.ndjson.zst
+    ...
+    <ARCHIVE_DIR>/manifest.jsonl    one line per part: table, file, rows, time range
+
+Parts are zstd-compressed when ``zstandard`` is installed and gzip otherwise.
+Each part is written atomically and listed in the manifest before its rows are
+deleted, so a crash can at worst archive a batch twice; readers drop repeated
+ids. Batches are serialized across processes (every worker runs the schedule)
+with an advisory lock on ``ARCHIVE_DIR``. Analytics rollups are kept in the hot DB and are unaffected.
+
+Readers stream parts lazily and skip parts whose time range can't match:
+
+    python -m app.services.archive_service --older-than-days 30
+    python -m app.services.archive_service --export conversations --start 2026-03-01 > march.ndjson
+"""
+import os
+import io
+import sys
+import gzip
+import json
+import asyncio
+import logging
+import argparse
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+try:
+	import fcntl
+except ImportError:  # Windows: single-writer deployments only
+	fcntl = None
+from app.db.models import Conversation, Evaluation, Guardrail, Message
+from app.utils.tracing import registry
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "data", "archive"))
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))  # 0 disables the in-app schedule
+ARCHIVE_CODEC = os.getenv("ARCHIVE_CODEC", "auto").lower()  # auto | zstd | gzip
+MANIFEST = "manifest.jsonl"
+
+# Children first when deleting; parents first when reading back.
+TABLES = {
+	"conversations": (Conversation.__table__, "started_at"),
+	"messages": (Message.__table__, "created_at"),
+	"evaluations": (Evaluation.__table__, "created_at"),
+	"guardrails": (Guardrail.__table__, "created_at"),
+}
+EXTENSIONS = {"zstd": ".ndjson.zst", "gzip": ".ndjson.gz"}
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_ROWS = registry.counter("promptopt_archive_rows_total", "Rows moved from the hot DB to cold storage.", ("table",))
+
+
+@dataclass
+class ArchiveResult:
+	batches: int = 0
+	parts: int = 0
+	bytes: int = 0
+	rows: Dict[str, int] = field(default_factory=lambda: {t: 0 for t in TABLES})
+
+
+def codec() -> str:
+	if ARCHIVE_CODEC in ("zstd", "auto"):
+		try:
+			import zstandard  # noqa: F401
+			return "zstd"
+		except ImportError:
+			if ARCHIVE_CODEC == "zstd":
+				raise
+	return "gzip"
+
+
+def _open_write(path: str, name: str):
+	if name == "zstd":
+		import zstandard
+		return io.TextIOWrapper(zstandard.ZstdCompressor(level=10).stream_writer(open(path, "wb")), encoding="utf-8")
+	return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+
+
+def _open_read(path: str):
+	if path.endswith(EXTENSIONS["zstd"]):
+		import zstandard
+		return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+	return gzip.open(path, "rt", encoding="utf-8")
+
+
+def _json_default(value):
+	if isinstance(value, (datetime, date)):
+		return value.isoformat()
+	raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _write_part(root: str, table: str, month: str, key: str, rows: List[dict], name: str) -> dict:
+	ts_col = TABLES[table][1]
+	rel = os.path.join(table, f"month={month}", f"part-{key}{EXTENSIONS[name]}")
+	path = os.path.join(root, rel)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+	with _open_write(tmp, name) as f:
+		for row in rows:
+			f.write(json.dumps(row, default=_json_default, separators=(",", ":")) + "\n")
+	os.replace(tmp, path)
+	times = [r[ts_col] for r in rows if r[ts_col] is not None]
+	return {
+		"table": table,
+		"file": rel,
+		"batch": key,
+		"rows": len(rows),
+		"bytes": os.path.getsize(path),
+		"min_ts": min(times).isoformat() if times else None,
+		"max_ts": max(times).isoformat() if times else None,
+	}
+
+
+def _append_manifest(root: str, entries: List[dict]) -> None:
+	with open(os.path.join(root, MANIFEST), "a", encoding="utf-8") as f:
+		for entry in entries:
+			f.write(json.dumps(entry) + "\n")
+		f.flush()
+		os.fsync(f.fileno())
+
+
+@contextmanager
+def _lock(root: str):
+	with open(os.path.join(root, ".lock"), "a") as f:
+		if fcntl is not None:
+			fcntl.flock(f, fcntl.LOCK_EX)
+		try:
+			yield
+		finally:
+			if fcntl is not None:
+				fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _archive_batch(db: Session, root: str, ids: List[int], before: datetime, name: str, result: ArchiveResult) -> bool:
+	"""Write and delete the conversations in ``ids`` still in the hot DB; False when another pass got them first."""
+	conversations = Conversation.__table__
+	convs = db.execute(select(conversations).where(conversations.c.id.in_(ids)).order_by(conversations.c.id)).mappings().all()
+	if not convs:
+		return False
+	ids = [c["id"] for c in convs]
+	month_of = {c["id"]: (c["started_at"] or before).strftime("%Y-%m") for c in convs}
+	key = f"{ids[0]:012d}-{ids[-1]:012d}"
+	entries = []
+	for table, (tbl, _) in TABLES.items():
+		if table == "conversations":
+			rows = [dict(c) for c in convs]
+		else:
+			rows = [dict(r) for r in db.execute(select(tbl).where(tbl.c.conversation_id.in_(ids)).order_by(tbl.c.id)).mappings()]
+		by_month: Dict[str, List[dict]] = {}
+		for row in rows:
+			by_month.setdefault(month_of[row.get("conversation_id", row["id"])], []).append(row)
+		for month, part in sorted(by_month.items()):
+			entries.append(_write_part(root, table, month, key, part, name))
+		result.rows[table] += len(rows)
+	_append_manifest(root, entries)
+	for table in reversed(TABLES):
+		tbl = TABLES[table][0]
+		db.execute(delete(tbl).where((tbl.c.id if table == "conversations" else tbl.c.conversation_id).in_(ids)))
+	db.commit()
+	result.batches += 1
+	result.parts += len(entries)
+	result.bytes += sum(e["bytes"] for e in entries)
+	return True
+
+
+def archive_conversations(db: Session, before: datetime, batch_size: Optional[int] = None, root: Optional[str] = None,
+		max_batches: Optional[int] = None) -> ArchiveResult:
+	"""Move conversations started before ``before`` (and their messages, evaluations, guardrails) to cold storage."""
+	root = root or ARCHIVE_DIR
+	batch_size = batch_size or ARCHIVE_BATCH_SIZE
+	name = codec()
+	os.makedirs(root, exist_ok=True)
+	result = ArchiveResult()
+	conversations = Conversation.__table__
+	while max_batches is None or result.batches < max_batches:
+		ids = list(db.execute(
+			select(conversations.c.id).where(conversations.c.started_at < before).order_by(conversations.c.id).limit(batch_size)
+		).scalars())
+		if not ids:
+			break
+		# Another worker's pass may have archived these while we waited for the lock: re-read them inside it.
+		with _lock(root):
+			_archive_batch(db, root, ids, before, name, result)
+	for table, n in result.rows.items():
+		if n:
+			ARCHIVED_ROWS.inc(table, amount=n)
+	return result
+
+
+def manifest(root: Optional[str] = None) -> List[dict]:
+	try:
+		with open(os.path.join(root or ARCHIVE_DIR, MANIFEST), "r", encoding="utf-8") as f:
+			return [json.loads(line) for line in f if line.strip()]
+	except FileNotFoundError:
+		return []
+
+
+def _naive_utc(ts: Optional[datetime]) -> Optional[datetime]:
+	"""Archived timestamps are naive UTC; bring aware bounds (``...Z`` in a query) to the same form."""
+	if ts is None or ts.tzinfo is None:
+		return ts
+	return ts.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _overlaps(entry: dict, start: Optional[datetime], end: Optional[datetime]) -> bool:
+	if entry["min_ts"] is None:
+		return start is None and end is None
+	if start is not None and datetime.fromisoformat(entry["max_ts"]) < start:
+		return False
+	if end is not None and datetime.fromisoformat(entry["min_ts"]) >= end:
+		return False
+	return True
+
+
+def _read_part(root: str, entry: dict) -> Iterator[dict]:
+	with _open_read(os.path.join(root, entry["file"])) as f:
+		for line in f:
+			yield json.loads(line)
+
+
+def iter_rows(table: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+		where: Optional[dict] = None, root: Optional[str] = None) -> Iterator[dict]:
+	"""Archived rows of ``table`` with time column in [start, end) and matching ``where`` equalities, streamed part by part."""
+	if table not in TABLES:
+		raise ValueError(f"Unknown archive table: {table}")
+	root = root or ARCHIVE_DIR
+	start, end = _naive_utc(start), _naive_utc(end)
+	ts_col = TABLES[table][1]
+	lo, hi = (start.isoformat() if start else None), (end.isoformat() if end else None)
+	seen = set()
+	for entry in manifest(root):
+		if entry["table"] != table or not _overlaps(entry, start, end):
+			continue
+		for row in _read_part(root, entry):
+			ts = row.get(ts_col)
+			if (lo is not None and (ts is None or ts < lo)) or (hi is not None and (ts is None or ts >= hi)):
+				continue
+			if where and any(row.get(k) != v for k, v in where.items()):
+				continue
+			if row["id"] in seen:
+				continue
+			seen.add(row["id"])
+			yield row
+
+
+def iter_conversations(start: Optional[datetime] = None, end: Optional[datetime] = None,
+		where: Optional[dict] = None, root: Optional[str] = None) -> Iterator[dict]:
+	"""Archived conversations with their messages, evaluations and guardrails nested, one archive batch in memory at a time."""
+	root = root or ARCHIVE_DIR
+	start, end = _naive_utc(start), _naive_utc(end)
+	entries = manifest(root)
+	seen = set()
+	for entry in entries:
+		if entry["table"] != "conversations" or not _overlaps(entry, start, end):
+			continue
+		convs = [r for r in _read_part(root, entry) if r["id"] not in seen
+			and (start is None or r["started_at"] >= start.isoformat()) and (end is None or r["started_at"] < end.isoformat())
+			and not (where and any(r.get(k) != v for k, v in where.items()))]
+		if not convs:
+			continue
+		wanted = {c["id"] for c in convs}
+		children: Dict[str, Dict[int, list]] = {t: {} for t in TABLES if t != "conversations"}
+		child_ids = set()
+		for other in entries:
+			if other["batch"] != entry["batch"] or other["table"] == "conversations":
+				continue
+			for row in _read_part(root, other):
+				if row["conversation_id"] in wanted and (other["table"], row["id"]) not in child_ids:
+					child_ids.add((other["table"], row["id"]))
+					children[other["table"]].setdefault(row["conversation_id"], []).append(row)
+		for conv in convs:
+			seen.add(conv["id"])
+			yield {**conv, **{t: rows.get(conv["id"], []) for t, rows in children.items()}}
+
+
+def stats(root: Optional[str] = None) -> dict:
+	out = {}
+	for entry in manifest(root):
+		s = out.setdefault(entry["table"], {"parts": 0, "rows": 0, "bytes": 0, "min_ts": None, "max_ts": None})
+		s["parts"] += 1
+		s["rows"] += entry["rows"]
+		s["bytes"] += entry["bytes"]
+		if entry["min_ts"] and (s["min_ts"] is None or entry["min_ts"] < s["min_ts"]):
+			s["min_ts"] = entry["min_ts"]
+		if entry["max_ts"] and (s["max_ts"] is None or entry["max_ts"] > s["max_ts"]):
+			s["max_ts"] = entry["max_ts"]
+	return {"codec": codec(), "tables": out}
+
+
+def run(older_than_days: Optional[float] = None, **kwargs) -> ArchiveResult:
+	"""One archival pass against the application database."""
+	from app.db.database import SessionLocal
+
+	days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+	db = SessionLocal()
+	try:
+		return archive_conversations(db, datetime.utcnow() - timedelta(days=days), **kwargs)
+	finally:
+		db.close()
+
+
+async def run_periodically(interval: float) -> None:
+	"""Archival pass every ``interval`` seconds, off the event loop, until cancelled."""
+	while True:
+		await asyncio.sleep(interval)
+		try:
+			result = await asyncio.to_thread(run)
+			if result.batches:
+				logger.info("Archived %s", result.rows)
+		except Exception:
+			logger.exception("Archival pass failed")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+	p = argparse.ArgumentParser(description="Archive old conversations to cold storage, or export archived rows.")
+	p.add_argument("--older-than-days", type=float, default=ARCHIVE_AFTER_DAYS)
+	p.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+	p.add_argument("--root", default=ARCHIVE_DIR)
+	p.add_argument("--stats", action="store_true", help="Print archive contents and exit")
+	p.add_argument("--export", choices=sorted(TABLES), help="Stream archived rows as NDJSON to stdout (conversations are nested)")
+	p.add_argument("--start", type=datetime.fromisoformat)
+	p.add_argument("--end", type=datetime.fromisoformat)
+	args = p.parse_args(argv)
+	if args.stats:
+		print(json.dumps(stats(args.root), indent=2))
+		return 0
+	if args.export:
+		if args.export == "conversations":
+			rows = iter_conversations(args.start, args.end, root=args.root)
+		else:
+			rows = iter_rows(args.export, args.start, args.end, root=args.root)
+		for row in rows:
+			sys.stdout.write(json.dumps(row) + "\n")
+		return 0
+	result = run(args.older_than_days, batch_size=args.batch_size, root=args.root)
+	print(json.dumps(asdict(result)))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
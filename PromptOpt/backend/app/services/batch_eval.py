@@ -0,0 +1,335 @@
+"""Offline batch evaluation of prompt versions over a golden dataset.
+
+A run directory holds everything needed to resume:
+
+    manifest.json      versions (content + generation settings snapshot), config
+    dataset.jsonl      one case per line: {"question": ..., "id"?: ..., "history"?: [...]}
+    part-00000.npz ... completed results, one compressed columnar shard per flush
+    report.json        per-version score report, written when the run completes
+
+Every (case, version) pair is generated with ``LLMService`` under bounded
+concurrency and judged with ``EvaluationService.evaluate_batch``, several
+answers per judge call. Shards are written atomically,
+so an interrupted run loses at most the unflushed tail and ``resume`` skips
+everything already on disk:
+
+    python -m app.services.batch_eval --dataset golden.jsonl --prompt-id 3 --versions 1,2 --run-dir runs/faq
+    python -m app.services.batch_eval --resume --run-dir runs/faq
+"""
+import os
+import sys
+import glob
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import numpy as np
+from app.models.chat import ChatMessage, ChatRequest
+from app.models.evaluation import EvaluationRequest
+from app.services.llm_service import LLMService
+from app.services.evaluation_service import EvaluationService
+from app.services.model_router import ModelRouter
+from app.services.container import services
+from app.services.usage_service import usage_scope
+
+CRITERIA = ("helpfulness", "accuracy", "clarity", "safety", "relevance", "tone")
+MANIFEST = "manifest.json"
+DATASET = "dataset.jsonl"
+REPORT = "report.json"
+
+
+@dataclass
+class EvalVersion:
+	"""Snapshot of a prompt version, so a resumed run uses exactly the same prompt."""
+
+	id: int
+	version: int
+	content: str
+	model: Optional[str] = None
+	max_tokens: Optional[int] = None
+	temperature: Optional[float] = None
+	timeout_seconds: Optional[float] = None
+
+	@classmethod
+	def from_orm(cls, v) -> "EvalVersion":
+		return cls(id=v.id, version=v.version, content=v.content, model=v.model, max_tokens=v.max_tokens,
+			temperature=v.temperature, timeout_seconds=v.timeout_seconds)
+
+
+def load_dataset(path: str) -> List[dict]:
+	cases = []
+	with open(path, "r", encoding="utf-8") as f:
+		for line_no, line in enumerate(f, 1):
+			if not line.strip():
+				continue
+			row = json.loads(line)
+			question = row.get("question") or row.get("message")
+			if not question:
+				raise ValueError(f"{path}:{line_no}: missing 'question'")
+			cases.append({"id": row.get("id", line_no), "question": question, "history": row.get("history") or []})
+	return cases
+
+
+class ResultBuffer:
+	"""Column-wise accumulator flushed to ``part-NNNNN.npz`` shards."""
+
+	def __init__(self):
+		self.columns: Dict[str, list] = {k: [] for k in ("case", "version_id", "overall", *CRITERIA, "latency_ms", "degraded", "judge_fallback")}
+
+	def __len__(self) -> int:
+		return len(self.columns["case"])
+
+	def add(self, case: int, version_id: int, evaluation, latency_ms: float, degraded: bool) -> None:
+		c = self.columns
+		c["case"].append(case)
+		c["version_id"].append(version_id)
+		c["overall"].append(evaluation.overall_score)
+		for name in CRITERIA:
+			c[name].append(getattr(evaluation.criteria, name))
+		c["latency_ms"].append(latency_ms)
+		c["degraded"].append(degraded)
+		c["judge_fallback"].append(evaluation.judge_model == "heuristic")
+
+	def to_arrays(self) -> Dict[str, np.ndarray]:
+		out = {}
+		for name, values in self.columns.items():
+			if name in ("case", "version_id"):
+				out[name] = np.asarray(values, dtype=np.int32)
+			elif name in ("degraded", "judge_fallback"):
+				out[name] = np.asarray(values, dtype=bool)
+			else:
+				out[name] = np.asarray(values, dtype=np.float32)
+		return out
+
+
+def read_results(run_dir: str) -> Dict[str, np.ndarray]:
+	"""All shards of a run concatenated column by column."""
+	shards = [np.load(p) for p in sorted(glob.glob(os.path.join(run_dir, "part-*.npz")))]
+	if not shards:
+		return {k: np.zeros(0) for k in ResultBuffer().columns}
+	return {k: np.concatenate([s[k] for s in shards]) for k in shards[0].files}
+
+
+class BatchEvalRun:
+	def __init__(self, run_dir: str, llm_service: Optional[LLMService] = None, evaluation_service: Optional[EvaluationService] = None):
+		self.run_dir = run_dir
+		with open(os.path.join(run_dir, MANIFEST), "r", encoding="utf-8") as f:
+			self.manifest = json.load(f)
+		self.versions = [EvalVersion(**v) for v in self.manifest["versions"]]
+		self.llm = llm_service or services.llm
+		self.judge = evaluation_service or services.evaluation
+		self.router = ModelRouter()
+		self._shard_index = len(glob.glob(os.path.join(run_dir, "part-*.npz")))
+
+	@classmethod
+	def create(cls, run_dir: str, dataset_path: str, versions: List[EvalVersion], concurrency: int = 16,
+			shard_size: int = 1000, **services) -> "BatchEvalRun":
+		if os.path.exists(os.path.join(run_dir, MANIFEST)):
+			raise FileExistsError(f"{run_dir} already holds a run; resume it or pick another directory")
+		if not versions:
+			raise ValueError("at least one prompt version is required")
+		os.makedirs(run_dir, exist_ok=True)
+		cases = load_dataset(dataset_path)
+		data = "".join(json.dumps(c, ensure_ascii=False) + "\n" for c in cases)
+		with open(os.path.join(run_dir, DATASET), "w", encoding="utf-8") as f:
+			f.write(data)
+		manifest = {
+			"created_at": time.time(),
+			"dataset_sha256": hashlib.sha256(data.encode("utf-8")).hexdigest(),
+			"cases": len(cases),
+			"versions": [asdict(v) for v in versions],
+			"concurrency": concurrency,
+			"shard_size": shard_size,
+		}
+		_atomic_write_json(os.path.join(run_dir, MANIFEST), manifest)
+		return cls(run_dir, **services)
+
+	# -- progress ---------------------------------------------------------
+
+	@property
+	def total(self) -> int:
+		return self.manifest["cases"] * len(self.versions)
+
+	def completed(self) -> Set[Tuple[int, int]]:
+		res = read_results(self.run_dir)
+		return set(zip(res["case"].tolist(), res["version_id"].tolist()))
+
+	def status(self) -> dict:
+		done = len(self.completed())
+		return {"run_dir": self.run_dir, "completed": done, "total": self.total, "finished": os.path.exists(os.path.join(self.run_dir, REPORT))}
+
+	# -- execution --------------------------------------------------------
+
+	def _flush(self, buf: ResultBuffer) -> None:
+		if not len(buf):
+			return
+		path = os.path.join(self.run_dir, f"part-{self._shard_index:05d}.npz")
+		tmp = path + ".tmp.npz"
+		np.savez_compressed(tmp, **buf.to_arrays())
+		os.replace(tmp, path)
+		self._shard_index += 1
+
+	async def _generate(self, case: dict, version: EvalVersion, sem: asyncio.Semaphore):
+		history = [ChatMessage(**m) for m in case["history"]]
+		request = ChatRequest(message=case["question"], conversation_history=history)
+		async with sem:
+			start = time.perf_counter()
+			response = await self.llm.generate_response(request, system_prompt_override=version.content, settings=self.router.settings_for(version))
+		return response, (time.perf_counter() - start) * 1000
+
+	async def _evaluate_chunk(self, chunk: List[Tuple[int, EvalVersion]], cases: List[dict], sem: asyncio.Semaphore) -> List[tuple]:
+		"""Generate answers for a chunk of same-version pairs, then judge them together."""
+		# Chunks share a version: meter their generation and judge calls against it.
+		with usage_scope(prompt_version_id=chunk[0][1].id):
+			generated = await asyncio.gather(*(self._generate(cases[i], v, sem) for i, v in chunk))
+			evaluations = await self.judge.evaluate_batch([
+				EvaluationRequest(user_message=cases[i]["question"], assistant_response=response.response, prompt_used=v.content)
+				for (i, v), (response, _) in zip(chunk, generated)
+			])
+		return [
+			(i, v.id, evaluation, latency_ms, bool(response.degraded))
+			for (i, v), (response, latency_ms), evaluation in zip(chunk, generated, evaluations)
+		]
+
+	async def run(self, on_progress: Optional[Callable[[int, int], None]] = None) -> dict:
+		"""Evaluate every pending (case, version) pair, then write and return the report."""
+		cases = load_dataset(os.path.join(self.run_dir, DATASET))
+		done = self.completed()
+		finished = len(done)
+		buf = ResultBuffer()
+		shard_size = self.manifest.get("shard_size", 1000)
+		concurrency = max(1, int(self.manifest.get("concurrency", 16)))
+		# Chunks share a version (hence a judge system prompt) so each is judged in one batched call.
+		chunk_size = max(1, self.judge.batch_max_items)
+		queue: asyncio.Queue = asyncio.Queue()
+		for v in self.versions:
+			pending = [(i, v) for i in range(len(cases)) if (i, v.id) not in done]
+			for k in range(0, len(pending), chunk_size):
+				queue.put_nowait(pending[k:k + chunk_size])
+		sem = asyncio.Semaphore(concurrency)
+
+		async def worker():
+			nonlocal finished, buf
+			while True:
+				try:
+					chunk = queue.get_nowait()
+				except asyncio.QueueEmpty:
+					return
+				rows = await self._evaluate_chunk(chunk, cases, sem)
+				# Bind ``buf`` only after the await: another worker may have flushed and swapped it meanwhile.
+				for row in rows:
+					buf.add(*row)
+					finished += 1
+					if len(buf) >= shard_size:
+						full, buf = buf, ResultBuffer()
+						self._flush(full)
+					if on_progress:
+						on_progress(finished, self.total)
+
+		try:
+			await asyncio.gather(*(worker() for _ in range(concurrency)))
+		finally:
+			# Also on cancellation/Ctrl-C: keep everything finished so far.
+			self._flush(buf)
+		report = self.report()
+		_atomic_write_json(os.path.join(self.run_dir, REPORT), report)
+		return report
+
+	# -- reporting --------------------------------------------------------
+
+	def report(self) -> dict:
+		res = read_results(self.run_dir)
+		versions = []
+		for v in self.versions:
+			mask = res["version_id"] == v.id
+			n = int(mask.sum())
+			entry = {"prompt_version_id": v.id, "version": v.version, "n": n}
+			if n:
+				overall = res["overall"][mask].astype(np.float64)
+				entry.update({
+					"mean": round(float(overall.mean()), 4),
+					"std": round(float(overall.std(ddof=1)), 4) if n > 1 else 0.0,
+					"std_error": round(float(overall.std(ddof=1) / np.sqrt(n)), 4) if n > 1 else None,
+					"p10": round(float(np.percentile(overall, 10)), 4),
+					"p50": round(float(np.percentile(overall, 50)), 4),
+					"criteria": {c: round(float(res[c][mask].mean()), 4) for c in CRITERIA},
+					"latency_ms_p50": round(float(np.percentile(res["latency_ms"][mask], 50)), 2),
+					"degraded": int(res["degraded"][mask].sum()),
+					"judge_fallbacks": int(res["judge_fallback"][mask].sum()),
+					"judge_fallback_rate": round(float(res["judge_fallback"][mask].mean()), 4),
+				})
+			versions.append(entry)
+		scored = [v for v in versions if v["n"]]
+		best = max(scored, key=lambda v: v["mean"]) if scored else None
+		return {
+			"cases": self.manifest["cases"],
+			"completed": int(len(res["case"])),
+			"total": self.total,
+			"versions": versions,
+			"best_version": best["version"] if best else None,
+		}
+
+
+def _atomic_write_json(path: str, data: dict) -> None:
+	tmp = path + ".tmp"
+	with open(tmp, "w", encoding="utf-8") as f:
+		json.dump(data, f, indent=2)
+	os.replace(tmp, path)
+
+
+def load_versions(prompt_id: int, numbers: Optional[List[int]] = None) -> List[EvalVersion]:
+	"""Versions of a prompt from the database (all of them when ``numbers`` is empty)."""
+	from app.db.database import SessionLocal
+	from app.db.models import PromptVersion
+
+	with SessionLocal() as db:
+		q = db.query(PromptVersion).filter(PromptVersion.prompt_id == prompt_id)
+		if numbers:
+			q = q.filter(PromptVersion.version.in_(numbers))
+		rows = q.order_by(PromptVersion.version).all()
+		found = {r.version for r in rows}
+		missing = sorted(set(numbers or []) - found)
+		if missing:
+			raise ValueError(f"prompt {prompt_id} has no version(s) {missing}")
+		return [EvalVersion.from_orm(r) for r in rows]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+	p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	p.add_argument("--run-dir", required=True)
+	p.add_argument("--dataset", help="JSONL golden dataset (new runs)")
+	p.add_argument("--prompt-id", type=int, help="Prompt whose versions are compared (new runs)")
+	p.add_argument("--versions", default="", help="Comma-separated version numbers (default: all)")
+	p.add_argument("--concurrency", type=int, default=16)
+	p.add_argument("--shard-size", type=int, default=1000, help="Results per checkpoint shard")
+	p.add_argument("--resume", action="store_true", help="Continue an interrupted run in --run-dir")
+	args = p.parse_args(argv)
+
+	if args.resume:
+		run = BatchEvalRun(args.run_dir)
+	else:
+		if not args.dataset or args.prompt_id is None:
+			p.error("--dataset and --prompt-id are required for a new run")
+		numbers = [int(x) for x in args.versions.split(",") if x.strip()]
+		run = BatchEvalRun.create(args.run_dir, args.dataset, load_versions(args.prompt_id, numbers),
+			concurrency=args.concurrency, shard_size=args.shard_size)
+
+	start = time.perf_counter()
+	last = [0.0]
+
+	def progress(done: int, total: int) -> None:
+		now = time.perf_counter()
+		if now - last[0] >= 2 or done == total:
+			last[0] = now
+			print(f"{done}/{total} ({done / max(1, now - start):.0f}/s)", file=sys.stderr, flush=True)
+
+	report = asyncio.run(run.run(progress))
+	print(json.dumps(report, indent=2))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
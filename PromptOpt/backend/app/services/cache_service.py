@@ -0,0 +1,296 @@
+import os
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+_WS_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s\?\!\.\,;:]+$")
+
+
+def normalize_message(text: str) -> str:
+	"""Canonical form used for exact-match keys: NFKC, casefolded, collapsed whitespace."""
+	text = unicodedata.normalize("NFKC", text or "").casefold()
+	text = _WS_RE.sub(" ", text).strip()
+	return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def context_fingerprint(provenance: Optional[List[dict]]) -> str:
+	"""Stable digest of the retrieved RAG context (order-sensitive, like the prompt it builds)."""
+	if not provenance:
+		return "none"
+	h = hashlib.sha1()
+	for p in provenance:
+		h.update((p.get("source") or "").encode("utf-8"))
+		h.update(b"\x1f")
+		h.update((p.get("text") or "").encode("utf-8"))
+		h.update(b"\x1e")
+	return h.hexdigest()
+
+
+def history_fingerprint(history: Optional[list]) -> str:
+	if not history:
+		return "none"
+	h = hashlib.sha1()
+	for m in history:
+		h.update(f"{m.role}\x1f{m.content}\x1e".encode("utf-8"))
+	return h.hexdigest()
+
+
+@dataclass
+class CacheEntry:
+	key: str
+	namespace: str
+	prompt_id: Optional[int]
+	response: str
+	prompt_used: Optional[str]
+	created_at: float
+	expires_at: float
+	size: int
+	vec_id: Optional[int] = None
+
+
+@dataclass
+class CacheHit:
+	entry: CacheEntry
+	tier: str  # exact | semantic
+	similarity: float
+	lookup_ms: float
+
+
+class ResponseCache:
+	"""Two-tier cache of assistant responses.
+
+	The exact tier is keyed by (prompt version, RAG snapshot version, RAG context
+	fingerprint, conversation history, normalized message). The semantic tier indexes
+	question embeddings in a FAISS inner-product index and only serves entries from the
+	same namespace (prompt version + snapshot + context) whose cosine similarity clears
+	the threshold. Keying by the snapshot version means every worker misses once it
+	maps a newly published snapshot, not only the worker that ran the ingest.
+	Entries expire after a TTL and are evicted least-recently-used once the
+	configured byte budget is exceeded.
+	"""
+
+	def __init__(self):
+		self.enabled = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+		self.semantic_enabled = os.getenv("RESPONSE_CACHE_SEMANTIC", "true").lower() == "true"
+		self.ttl_seconds = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+		self.max_bytes = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+		self.similarity_threshold = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+		self.semantic_candidates = int(os.getenv("RESPONSE_CACHE_SEMANTIC_CANDIDATES", "8"))
+		self._lock = threading.Lock()
+		self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+		self._by_vec_id: Dict[int, str] = {}
+		self._index = None
+		self._dim: Optional[int] = None
+		self._next_vec_id = 0
+		self._bytes = 0
+		self._stats = {
+			"hits_exact": 0,
+			"hits_semantic": 0,
+			"misses": 0,
+			"stores": 0,
+			"evictions": 0,
+			"expirations": 0,
+			"invalidations": 0,
+		}
+
+	# -- keys -------------------------------------------------------------
+
+	@staticmethod
+	def namespace(prompt_version_id: Optional[int], prompt_id: Optional[int], provenance: Optional[List[dict]],
+			rag_version: Optional[str] = None) -> str:
+		"""``rag_version``: the RAG snapshot the answer was built against (None when retrieval was skipped)."""
+		pv = f"pv:{prompt_version_id}" if prompt_version_id else f"default:{prompt_id or 0}"
+		return f"{pv}|rag:{rag_version or 'none'}|ctx:{context_fingerprint(provenance)}"
+
+	@staticmethod
+	def make_key(namespace: str, message: str, history: Optional[list] = None) -> str:
+		raw = f"{namespace}|hist:{history_fingerprint(history)}|{normalize_message(message)}"
+		return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+	# -- lookups ----------------------------------------------------------
+
+	def get(self, namespace: str, message: str, history: Optional[list] = None,
+			embed: Optional[Callable[[], Optional[np.ndarray]]] = None) -> Optional[CacheHit]:
+		"""Look up a cached response.
+
+		``embed`` is called lazily, only when the exact tier misses and the semantic
+		tier applies, so callers that already hold the query embedding pay nothing.
+		"""
+		if not self.enabled:
+			return None
+		start = time.perf_counter()
+		key = self.make_key(namespace, message, history)
+		now = time.time()
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				if entry.expires_at <= now:
+					self._remove(key)
+					self._stats["expirations"] += 1
+				else:
+					self._entries.move_to_end(key)
+					self._stats["hits_exact"] += 1
+					return CacheHit(entry, "exact", 1.0, (time.perf_counter() - start) * 1000)
+		# The semantic tier only applies to single-turn questions; follow-ups depend on history.
+		if self.semantic_enabled and embed is not None and not history:
+			try:
+				query_vec = embed()
+			except Exception:
+				query_vec = None
+			if query_vec is not None:
+				with self._lock:
+					hit = self._semantic_lookup(namespace, query_vec, now)
+					if hit is not None:
+						entry, sim = hit
+						self._entries.move_to_end(entry.key)
+						self._stats["hits_semantic"] += 1
+						return CacheHit(entry, "semantic", sim, (time.perf_counter() - start) * 1000)
+		with self._lock:
+			self._stats["misses"] += 1
+		return None
+
+	def _semantic_lookup(self, namespace: str, query_vec: np.ndarray, now: float) -> Optional[Tuple[CacheEntry, float]]:
+		if self._index is None or self._index.ntotal == 0:
+			return None
+		q = self._as_row(query_vec)
+		if q is None:
+			return None
+		k = min(self.semantic_candidates, self._index.ntotal)
+		sims, ids = self._index.search(q, k)
+		for sim, vec_id in zip(sims[0], ids[0]):
+			if vec_id < 0 or sim < self.similarity_threshold:
+				break  # results are sorted by similarity
+			key = self._by_vec_id.get(int(vec_id))
+			entry = self._entries.get(key) if key else None
+			if entry is None or entry.namespace != namespace:
+				continue
+			if entry.expires_at <= now:
+				self._remove(entry.key)
+				self._stats["expirations"] += 1
+				continue
+			return entry, float(sim)
+		return None
+
+	# -- writes -----------------------------------------------------------
+
+	def put(self, namespace: str, prompt_id: Optional[int], message: str, response: str, prompt_used: Optional[str],
+			history: Optional[list] = None, query_vec: Optional[np.ndarray] = None) -> None:
+		if not self.enabled:
+			return
+		key = self.make_key(namespace, message, history)
+		now = time.time()
+		size = len(key) + len(response.encode("utf-8")) + len((prompt_used or "").encode("utf-8"))
+		row = self._as_row(query_vec) if (self.semantic_enabled and query_vec is not None and not history) else None
+		if row is not None:
+			size += row.nbytes
+		if size > self.max_bytes:
+			return
+		with self._lock:
+			if key in self._entries:
+				self._remove(key)
+			entry = CacheEntry(
+				key=key,
+				namespace=namespace,
+				prompt_id=prompt_id,
+				response=response,
+				prompt_used=prompt_used,
+				created_at=now,
+				expires_at=now + self.ttl_seconds,
+				size=size,
+			)
+			if row is not None:
+				self._ensure_index(row.shape[1])
+				entry.vec_id = self._next_vec_id
+				self._next_vec_id += 1
+				self._index.add_with_ids(row, np.array([entry.vec_id], dtype=np.int64))
+				self._by_vec_id[entry.vec_id] = key
+			self._entries[key] = entry
+			self._bytes += size
+			self._stats["stores"] += 1
+			while self._bytes > self.max_bytes and self._entries:
+				oldest = next(iter(self._entries))
+				self._remove(oldest)
+				self._stats["evictions"] += 1
+
+	def _ensure_index(self, dim: int) -> None:
+		if self._index is not None and self._dim == dim:
+			return
+		if self._index is not None:
+			# Embedding model changed; vectors are no longer comparable.
+			for entry in self._entries.values():
+				entry.vec_id = None
+			self._by_vec_id.clear()
+		import faiss  # deferred: only needed once semantic entries exist
+		self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+		self._dim = dim
+
+	def _remove(self, key: str) -> None:
+		entry = self._entries.pop(key, None)
+		if entry is None:
+			return
+		self._bytes -= entry.size
+		if entry.vec_id is not None and self._index is not None:
+			self._index.remove_ids(np.array([entry.vec_id], dtype=np.int64))
+			self._by_vec_id.pop(entry.vec_id, None)
+
+	@staticmethod
+	def _as_row(vec: Optional[np.ndarray]) -> Optional[np.ndarray]:
+		if vec is None:
+			return None
+		row = np.ascontiguousarray(vec, dtype=np.float32).reshape(1, -1).copy()
+		norm = float(np.linalg.norm(row))
+		if norm == 0.0:
+			return None
+		row /= norm
+		return row
+
+	# -- invalidation -----------------------------------------------------
+
+	def invalidate_prompt(self, prompt_id: int) -> int:
+		"""Drop every entry produced with any version of the given prompt."""
+		with self._lock:
+			keys = [k for k, e in self._entries.items() if e.prompt_id == prompt_id]
+			for k in keys:
+				self._remove(k)
+			self._stats["invalidations"] += len(keys)
+			return len(keys)
+
+	def invalidate_collection(self) -> int:
+		"""The RAG collection changed; any cached answer may now be stale. Other workers
+		miss on their own once they map the new snapshot (see ``namespace``)."""
+		return self.clear()
+
+	def clear(self) -> int:
+		with self._lock:
+			n = len(self._entries)
+			self._entries.clear()
+			self._by_vec_id.clear()
+			self._index = None
+			self._dim = None
+			self._bytes = 0
+			self._stats["invalidations"] += n
+			return n
+
+	def stats(self) -> dict:
+		with self._lock:
+			hits = self._stats["hits_exact"] + self._stats["hits_semantic"]
+			lookups = hits + self._stats["misses"]
+			return {
+				**self._stats,
+				"enabled": self.enabled,
+				"semantic_enabled": self.semantic_enabled,
+				"entries": len(self._entries),
+				"bytes": self._bytes,
+				"max_bytes": self.max_bytes,
+				"hit_rate": (hits / lookups) if lookups else 0.0,
+			}
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,95 @@
+"""Process-wide service singletons, built on first use.
+
+Importing the app must stay cheap: the upstream services pull in the OpenAI
+SDK, faiss and the on-disk RAG index. Routes reach them through ``services``
+instead of constructing them at import time; the app lifespan optionally warms
+them up in the background, and readiness reports when that has finished.
+"""
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+	def __init__(self):
+		self._lock = threading.RLock()
+		self._instances: Dict[str, Any] = {}
+		self.warmup_state = "idle"  # idle | running | done | failed
+		self.warmup_seconds: Optional[float] = None
+		self.warmup_error: Optional[str] = None
+
+	def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+		instance = self._instances.get(name)
+		if instance is None:
+			with self._lock:
+				instance = self._instances.get(name)
+				if instance is None:
+					instance = self._instances[name] = factory()
+		return instance
+
+	@property
+	def llm(self):
+		from app.services.llm_service import LLMService
+		return self._get("llm", LLMService)
+
+	@property
+	def evaluation(self):
+		from app.services.evaluation_service import EvaluationService
+		return self._get("evaluation", EvaluationService)
+
+	@property
+	def moderation(self):
+		from app.utils.moderation import ModerationService
+		return self._get("moderation", ModerationService)
+
+	@property
+	def rag(self):
+		from app.services.rag_service import RAGService
+		return self._get("rag", RAGService)
+
+	def initialized(self) -> list:
+		return sorted(self._instances)
+
+	def warm_up(self) -> None:
+		"""Build every service and load the RAG index (blocking; run it off the event loop)."""
+		start = time.perf_counter()
+		try:
+			self.llm, self.evaluation, self.moderation
+			self.rag.status()
+			self.warmup_state = "done"
+		except Exception as e:
+			# Not fatal: requests build whatever is missing on first use.
+			self.warmup_state = "failed"
+			self.warmup_error = str(e)
+			logger.exception("Service warm-up failed")
+		finally:
+			self.warmup_seconds = round(time.perf_counter() - start, 3)
+
+	def start_warm_up(self) -> asyncio.Task:
+		"""Schedule ``warm_up`` in a worker thread; readiness reports "running" until it finishes."""
+		self.warmup_state = "running"
+		return asyncio.create_task(asyncio.to_thread(self.warm_up))
+
+	def readiness(self) -> dict:
+		# A failed warm-up doesn't block readiness: services are then built on first use.
+		return {
+			"ready": self.warmup_state != "running",
+			"warmup": self.warmup_state,
+			"warmup_seconds": self.warmup_seconds,
+			"warmup_error": self.warmup_error,
+			"services": self.initialized(),
+		}
+
+	def reset(self) -> None:
+		with self._lock:
+			self._instances.clear()
+		self.warmup_state = "idle"
+		self.warmup_seconds = None
+		self.warmup_error = None
+
+
+services = ServiceContainer()
@@ -1,7 +1,14 @@
 import os
-from typing import Optional
-import openai
-from app.models.evaluation import EvaluationResult, EvalCriteriaScores
+import re
+import asyncio
+import threading
+from typing import Dict, List, Optional, Tuple
+from app.models.evaluation import EvaluationResult, EvalCriteriaScores, EvaluationRequest
+from app.services.resilience import ResilientClient, upstream_breaker
+from app.providers import get_provider
+from app.providers.base import Provider
+from app.utils.tracing import span, registry
+from app.utils.lenient_json import parse_lenient
 
 JUDGE_SYSTEM_PROMPT = (
 	"You are an expert HR quality evaluator. Score the assistant response from 0-5 on: "
@@ -9,55 +16,244 @@ JUDGE_SYSTEM_PROMPT = (
 	"Return strict JSON with keys: helpfulness, accuracy, clarity, safety, relevance, tone, overall, label, comments, hallucination_risk."
 )
 
+BATCH_JUDGE_SYSTEM_PROMPT = (
+	"You are an expert HR quality evaluator. For each numbered item, score the assistant response from 0-5 on: "
+	"helpfulness, accuracy, clarity, safety, relevance, and tone. "
+	"Return a strict JSON object {\"items\": [...]} with exactly one object per item, each with keys: index (the item number), "
+	"helpfulness, accuracy, clarity, safety, relevance, tone, overall, label, comments (one short sentence), hallucination_risk."
+)
+CRITERIA = ("helpfulness", "accuracy", "clarity", "safety", "relevance", "tone")
+# "4", "4.5/5", "8 out of 10"
+_SCORE_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*(?:(?:/|out of)\s*(\d+(?:\.\d+)?))?\s*$")
+
+# ok: strict JSON; repaired: lenient parse and/or clamping was needed; fallback_*: heuristic scores were used
+JUDGE_RESULTS = registry.counter("promptopt_judge_results_total", "Judge results by outcome (ok, repaired, fallback_parse, fallback_upstream).", ("outcome",))
+
+
+def _estimate_tokens(text: str) -> int:
+	return len(text or "") // 4 + 1
+
+
+def coerce_score(value) -> Tuple[float, bool]:
+	"""A judge score as a float clamped to 0-5, plus whether it had to be adjusted.
+
+	Accepts numbers and strings such as "4", "4.5/5" or "8 out of 10" (rescaled to 0-5).
+	Raises ValueError for anything else (None, NaN, prose).
+	"""
+	adjusted = False
+	if isinstance(value, bool) or value is None:
+		raise ValueError(f"not a score: {value!r}")
+	if isinstance(value, (int, float)):
+		score = float(value)
+	else:
+		m = _SCORE_RE.match(str(value))
+		if not m:
+			raise ValueError(f"not a score: {value!r}")
+		score = float(m.group(1))
+		if m.group(2) and float(m.group(2)) > 0:
+			score = score / float(m.group(2)) * 5
+		adjusted = True
+	if score != score:  # NaN
+		raise ValueError("not a score: NaN")
+	if not 0.0 <= score <= 5.0:
+		score = min(5.0, max(0.0, score))
+		adjusted = True
+	return score, adjusted
+
 
 class EvaluationService:
-	def __init__(self):
-		self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY", "your-api-key-here"))
+	def __init__(self, provider: Optional[Provider] = None):
+		self.provider = provider or get_provider()
 		self.judge_model = os.getenv("JUDGE_MODEL", "gpt-4o-mini")
+		self.resilient = ResilientClient("judge", upstream_breaker, deadline=float(os.getenv("JUDGE_TIMEOUT_SECONDS", "20")))
+		# Batched judging: several (question, answer) pairs per judge call, sized to stay within token limits
+		self.batch_max_items = int(os.getenv("JUDGE_BATCH_MAX_ITEMS", "8"))
+		self.batch_max_input_tokens = int(os.getenv("JUDGE_BATCH_MAX_INPUT_TOKENS", "6000"))
+		self.batch_max_output_tokens = int(os.getenv("JUDGE_BATCH_MAX_OUTPUT_TOKENS", "2000"))
+		self.batch_tokens_per_item = int(os.getenv("JUDGE_BATCH_TOKENS_PER_ITEM", "120"))
+		self.batch_timeout = float(os.getenv("JUDGE_BATCH_TIMEOUT_SECONDS", "60"))
+		# Re-ask the judge this many times when its output can't be parsed even leniently
+		self.parse_retries = int(os.getenv("JUDGE_PARSE_RETRIES", "1"))
+		self._stats_lock = threading.Lock()
+		self._stats = {"ok": 0, "repaired": 0, "fallback_parse": 0, "fallback_upstream": 0, "parse_retries": 0}
+
+	def _record(self, outcome: str) -> None:
+		with self._stats_lock:
+			self._stats[outcome] += 1
+		if outcome != "parse_retries":
+			JUDGE_RESULTS.inc(outcome)
 
+	def stats(self) -> dict:
+		with self._stats_lock:
+			out = dict(self._stats)
+		total = out["ok"] + out["repaired"] + out["fallback_parse"] + out["fallback_upstream"]
+		out["total"] = total
+		out["fallback_rate"] = round((out["fallback_parse"] + out["fallback_upstream"]) / total, 4) if total else 0.0
+		return out
+
+	@span("evaluation")
 	async def evaluate(self, user_message: str, assistant_response: str, prompt_used: Optional[str] = None) -> EvaluationResult:
+		messages = [
+			{"role": "system", "content": JUDGE_SYSTEM_PROMPT},
+			{"role": "user", "content": (
+				f"Prompt (system):\n{prompt_used or '[none]'}\n\n"
+				f"User: {user_message}\n\nAssistant: {assistant_response}\n\n"
+				"Please return JSON only."
+			)},
+		]
+		for _ in range(1 + max(0, self.parse_retries)):
+			try:
+				resp = await self.resilient.call(lambda timeout: self.provider.judge(
+					messages,
+					model=self.judge_model,
+					max_tokens=300,
+					timeout=timeout,
+				))
+			except Exception:
+				return self._heuristic_fallback(assistant_response, "fallback_upstream")
+			parsed = self._parse_judgement(resp.text)
+			if parsed is not None:
+				result, repaired = parsed
+				self._record("repaired" if repaired else "ok")
+				return result
+			self._record("parse_retries")
+		return self._heuristic_fallback(assistant_response, "fallback_parse")
+
+	def _parse_judgement(self, text: str) -> Optional[Tuple[EvaluationResult, bool]]:
+		try:
+			data, repaired = parse_lenient(text, types=(dict,))
+		except ValueError:
+			return None
+		return self._result_from_dict(data, repaired)
+
+	def _result_from_dict(self, data: dict, repaired: bool = False) -> Optional[Tuple[EvaluationResult, bool]]:
+		"""Validated judge result (scores clamped to 0-5), or None when criteria are missing or not scores."""
 		try:
-			messages = [
-				{"role": "system", "content": JUDGE_SYSTEM_PROMPT},
-				{"role": "user", "content": (
-					f"Prompt (system):\n{prompt_used or '[none]'}\n\n"
-					f"User: {user_message}\n\nAssistant: {assistant_response}\n\n"
-					"Please return JSON only."
-				)},
-			]
-
-			resp = self.client.chat.completions.create(
+			scores = {}
+			for c in CRITERIA:
+				scores[c], adjusted = coerce_score(data[c])
+				repaired = repaired or adjusted
+			if data.get("overall") is not None:
+				overall, adjusted = coerce_score(data["overall"])
+				repaired = repaired or adjusted
+			else:
+				overall = sum(scores.values()) / len(scores)
+		except (KeyError, ValueError):
+			return None
+		return EvaluationResult(
+			overall_score=overall,
+			criteria=EvalCriteriaScores(**scores),
+			label=str(data.get("label") or "unknown"),
+			comments=str(data.get("comments") or ""),
+			hallucination_risk=str(data.get("hallucination_risk") or "unknown"),
+			judge_model=self.judge_model,
+		), repaired
+
+	async def evaluate_batch(self, items: List[EvaluationRequest]) -> List[EvaluationResult]:
+		"""Judge many responses with few judge calls; results are in input order.
+
+		Items are grouped by system prompt (sent once per call) and packed greedily
+		under the input/output token budgets. Items whose entry in the judge's array
+		is missing or invalid are re-judged one by one; if the batch call itself
+		fails, its items get the heuristic fallback, as ``evaluate`` does.
+		"""
+		results: List[Optional[EvaluationResult]] = [None] * len(items)
+		batches = self._plan_batches(items)
+		await asyncio.gather(*(self._judge_batch(items, idx, results) for idx in batches))
+		return results  # type: ignore[return-value]
+
+	def _plan_batches(self, items: List[EvaluationRequest]) -> List[List[int]]:
+		by_prompt: Dict[Optional[str], List[int]] = {}
+		for i, item in enumerate(items):
+			by_prompt.setdefault(item.prompt_used, []).append(i)
+		max_items = max(1, min(self.batch_max_items, self.batch_max_output_tokens // max(1, self.batch_tokens_per_item)))
+		batches = []
+		for prompt, indices in by_prompt.items():
+			base = _estimate_tokens(BATCH_JUDGE_SYSTEM_PROMPT) + _estimate_tokens(prompt)
+			current: List[int] = []
+			used = base
+			for i in indices:
+				cost = _estimate_tokens(items[i].user_message) + _estimate_tokens(items[i].assistant_response) + 10
+				if current and (len(current) >= max_items or used + cost > self.batch_max_input_tokens):
+					batches.append(current)
+					current, used = [], base
+				current.append(i)
+				used += cost
+			if current:
+				batches.append(current)
+		return batches
+
+	def _batch_messages(self, items: List[EvaluationRequest], indices: List[int]) -> List[dict]:
+		parts = [f"Prompt (system):\n{items[indices[0]].prompt_used or '[none]'}"]
+		for n, i in enumerate(indices, 1):
+			parts.append(f"### Item {n}\nUser: {items[i].user_message}\n\nAssistant: {items[i].assistant_response}")
+		parts.append(f"Return a JSON object {{\"items\": [...]}} with exactly {len(indices)} entries, one per item.")
+		return [
+			{"role": "system", "content": BATCH_JUDGE_SYSTEM_PROMPT},
+			{"role": "user", "content": "\n\n".join(parts)},
+		]
+
+	async def _judge_batch(self, items: List[EvaluationRequest], indices: List[int], results: List[Optional[EvaluationResult]]) -> None:
+		if len(indices) == 1:
+			item = items[indices[0]]
+			results[indices[0]] = await self.evaluate(item.user_message, item.assistant_response, item.prompt_used)
+			return
+		try:
+			resp = await self.resilient.call(lambda timeout: self.provider.judge(
+				self._batch_messages(items, indices),
 				model=self.judge_model,
-				messages=messages,
-				temperature=0.0,
-				max_tokens=300,
-			)
-			content = resp.choices[0].message.content
-			data = self._safe_parse_json(content)
-			if not data:
-				return self._heuristic_fallback(assistant_response)
-
-			criteria = EvalCriteriaScores(
-				helpfulness=float(data.get("helpfulness", 3)),
-				accuracy=float(data.get("accuracy", 3)),
-				clarity=float(data.get("clarity", 3)),
-				safety=float(data.get("safety", 3)),
-				relevance=float(data.get("relevance", 3)),
-				tone=float(data.get("tone", 3)),
-			)
-			overall = float(data.get("overall", sum([criteria.helpfulness, criteria.accuracy, criteria.clarity, criteria.safety, criteria.relevance, criteria.tone]) / 6))
-			return EvaluationResult(
-				overall_score=overall,
-				criteria=criteria,
-				label=str(data.get("label", "unknown")),
-				comments=str(data.get("comments", "")),
-				hallucination_risk=str(data.get("hallucination_risk", "unknown")),
-				judge_model=self.judge_model,
-			)
+				max_tokens=min(self.batch_max_output_tokens, self.batch_tokens_per_item * len(indices) + 50),
+				timeout=timeout,
+			), deadline=self.batch_timeout)
 		except Exception:
-			return self._heuristic_fallback(assistant_response)
+			for i in indices:
+				results[i] = self._heuristic_fallback(items[i].assistant_response, "fallback_upstream")
+			return
+		parsed = self._parse_batch(resp.text, len(indices))
+		retry = []
+		for n, i in enumerate(indices, 1):
+			if n in parsed:
+				results[i], repaired = parsed[n]
+				self._record("repaired" if repaired else "ok")
+			else:
+				retry.append(i)
+		if retry:
+			singles = await asyncio.gather(*(self.evaluate(items[i].user_message, items[i].assistant_response, items[i].prompt_used) for i in retry))
+			for i, result in zip(retry, singles):
+				results[i] = result
+
+	def _parse_batch(self, text: str, expected: int) -> Dict[int, Tuple[EvaluationResult, bool]]:
+		"""Validated entries of a batch judgement, keyed by 1-based item number."""
+		try:
+			data, repaired = parse_lenient(text)
+		except ValueError:
+			return {}
+		if isinstance(data, dict):
+			data = data.get("items")
+		if not isinstance(data, list):
+			return {}
+		out: Dict[int, Tuple[EvaluationResult, bool]] = {}
+		seen = set()
+		for entry in data:
+			if not isinstance(entry, dict):
+				continue
+			n = entry.get("index")
+			if isinstance(n, str) and n.strip().isdigit():
+				n = int(n)
+			if not isinstance(n, int) or isinstance(n, bool) or not 1 <= n <= expected:
+				continue
+			if n in seen:
+				# Ambiguous: two answers for one item, trust neither
+				out.pop(n, None)
+				continue
+			seen.add(n)
+			parsed = self._result_from_dict(entry, repaired)
+			if parsed is not None:
+				out[n] = parsed
+		return out
 
-	def _heuristic_fallback(self, assistant_response: str) -> EvaluationResult:
+	def _heuristic_fallback(self, assistant_response: str, reason: str = "fallback_parse") -> EvaluationResult:
+		self._record(reason)
 		length = len(assistant_response.strip())
 		helpfulness = 2.0 + min(3.0, length / 500)
 		clarity = 2.5
@@ -83,14 +279,3 @@ class EvaluationService:
 			hallucination_risk="unknown",
 			judge_model="heuristic",
 		)
-
-	def _safe_parse_json(self, text: str):
-		import json
-		try:
-			start = text.find('{')
-			end = text.rfind('}')
-			if start == -1 or end == -1:
-				return None
-			return json.loads(text[start:end+1])
-		except Exception:
-			return None
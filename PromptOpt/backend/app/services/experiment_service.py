@@ -0,0 +1,195 @@
+import os
+import math
+import bisect
+import hashlib
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Dict, List, Optional, Sequence
+from sqlalchemy.orm import Session
+from app.db.models import PromptArmStats, PromptVersion
+from app.db.upsert import upsert
+
+
+@dataclass(frozen=True)
+class ArmSummary:
+	prompt_version_id: int
+	version: int
+	weight: float
+	n: int
+	mean: float
+	variance: float
+
+	@property
+	def std_error(self) -> float:
+		return math.sqrt(self.variance / self.n) if self.n > 1 else float("inf")
+
+
+def welford_update(n: int, mean: float, m2: float, x: float) -> tuple[int, float, float]:
+	"""One streaming mean/variance step: O(1) state per arm, no rescans."""
+	n += 1
+	delta = x - mean
+	mean += delta / n
+	m2 += delta * (x - mean)
+	return n, mean, m2
+
+
+def checkpoints(first: int, last: int, looks: int) -> List[int]:
+	"""Per-arm sample sizes at which an experiment is tested: ``looks`` evenly spaced from ``first`` to ``last``."""
+	if looks <= 1 or first >= last:
+		return [last]
+	return sorted({round(first + (last - first) * k / (looks - 1)) for k in range(looks)})
+
+
+def spending_boundaries(looks: Sequence[int], max_n: int, alpha: float) -> List[float]:
+	"""z boundary per look from the Lan-DeMets O'Brien-Fleming alpha-spending function
+	``alpha(t) = 2 - 2 Phi(z_{1-alpha/2} / sqrt(t))`` at information fraction ``t = n / max_n``.
+
+	Each look only spends its increment of alpha, so the chance of a false
+	promotion over all looks stays at or below ``alpha`` (by the union bound, a
+	little conservative). Early looks need overwhelming evidence; the last one is
+	close to the fixed-sample threshold.
+	"""
+	norm = NormalDist()
+	z_alpha = norm.inv_cdf(1 - alpha / 2)
+	spent, out = 0.0, []
+	for n in looks:
+		total = 2 * (1 - norm.cdf(z_alpha / math.sqrt(min(1.0, n / max_n))))
+		increment = total - spent
+		out.append(-norm.inv_cdf(increment / 2) if increment > 0 else math.inf)
+		spent = max(spent, total)
+	return out
+
+
+class ExperimentService:
+	"""Weighted, sticky traffic splitting across a prompt's active versions, with
+	online judge-score aggregation and automatic promotion of a clear winner.
+
+	A prompt with one active version is not an experiment and behaves as before.
+	Promotion compares the best arm against every other arm with a two-sample
+	z-test on the streamed means (Welch standard error). The test is group
+	sequential: it only runs at ``EXPERIMENT_LOOKS`` pre-registered per-arm
+	sample sizes from ``EXPERIMENT_MIN_SAMPLES`` to ``EXPERIMENT_MAX_SAMPLES``,
+	against O'Brien-Fleming alpha-spending boundaries for an overall
+	false-promotion rate of ``EXPERIMENT_ALPHA`` (Bonferroni-split across the
+	comparisons), and the lift must be at least ``EXPERIMENT_MIN_EFFECT`` judge
+	points. Past the last look without a winner, nothing is promoted automatically.
+	"""
+
+	def __init__(self):
+		self.auto_promote = os.getenv("EXPERIMENT_AUTO_PROMOTE", "true").lower() == "true"
+		self.min_samples = int(os.getenv("EXPERIMENT_MIN_SAMPLES", "30"))
+		looks = max(1, int(os.getenv("EXPERIMENT_LOOKS", "5")))
+		self.max_samples = max(self.min_samples, int(os.getenv("EXPERIMENT_MAX_SAMPLES", str(self.min_samples * looks))))
+		self.alpha = float(os.getenv("EXPERIMENT_ALPHA", "0.01"))
+		self.min_effect = float(os.getenv("EXPERIMENT_MIN_EFFECT", "0.1"))
+		self.checkpoints = checkpoints(self.min_samples, self.max_samples, looks)
+		self._boundaries: Dict[int, List[float]] = {}
+
+	def boundaries(self, comparisons: int = 1) -> List[float]:
+		"""z boundary per checkpoint when the best arm is compared against ``comparisons`` others."""
+		if comparisons not in self._boundaries:
+			self._boundaries[comparisons] = spending_boundaries(self.checkpoints, self.max_samples, self.alpha / comparisons)
+		return self._boundaries[comparisons]
+
+	def look(self, arms: Sequence[ArmSummary]) -> Optional[int]:
+		"""Index of the last checkpoint every arm has reached, None before the first."""
+		k = bisect.bisect_right(self.checkpoints, min((a.n for a in arms), default=0)) - 1
+		return k if k >= 0 else None
+
+	@staticmethod
+	def _weight(v: PromptVersion) -> float:
+		return 1.0 if v.traffic_weight is None else max(0.0, v.traffic_weight)
+
+	def choose_version(self, versions: Sequence[PromptVersion], user_id: int, prompt_id: int) -> Optional[PromptVersion]:
+		"""Pick an arm for this user. The same user always lands on the same arm while
+		the arm set and weights are unchanged."""
+		arms = sorted(versions, key=lambda v: v.version)
+		if len(arms) <= 1:
+			return arms[0] if arms else None
+		total = sum(self._weight(v) for v in arms)
+		if total <= 0:
+			return arms[-1]
+		digest = hashlib.blake2b(f"{prompt_id}:{user_id}".encode(), digest_size=8).digest()
+		point = int.from_bytes(digest, "big") / 2 ** 64 * total
+		for v in arms:
+			point -= self._weight(v)
+			if point < 0:
+				return v
+		return arms[-1]
+
+	def record_score(self, db: Session, prompt_version_id: int, score: float) -> PromptArmStats:
+		"""Fold one judge score into the arm aggregate (in the caller's transaction)."""
+		# Create the arm row race-free first: concurrent first scores would otherwise both insert it,
+		# and FOR UPDATE then always has a row to lock.
+		upsert(db.connection(), PromptArmStats.__table__, {"prompt_version_id": prompt_version_id}, {"n": 0, "mean": 0.0, "m2": 0.0})
+		stats = (
+			db.query(PromptArmStats)
+			.filter(PromptArmStats.prompt_version_id == prompt_version_id)
+			.with_for_update()
+			.populate_existing()
+			.one()
+		)
+		stats.n, stats.mean, stats.m2 = welford_update(stats.n or 0, stats.mean or 0.0, stats.m2 or 0.0, float(score))
+		return stats
+
+	def summaries(self, db: Session, versions: Sequence[PromptVersion]) -> List[ArmSummary]:
+		ids = [v.id for v in versions]
+		rows = {s.prompt_version_id: s for s in db.query(PromptArmStats).filter(PromptArmStats.prompt_version_id.in_(ids)).all()} if ids else {}
+		out = []
+		for v in sorted(versions, key=lambda v: v.version):
+			s = rows.get(v.id)
+			n = s.n if s else 0
+			out.append(ArmSummary(
+				prompt_version_id=v.id,
+				version=v.version,
+				weight=self._weight(v),
+				n=n,
+				mean=s.mean if s else 0.0,
+				variance=(s.m2 / (n - 1)) if s and n > 1 else 0.0,
+			))
+		return out
+
+	def winner(self, arms: Sequence[ArmSummary]) -> Optional[ArmSummary]:
+		"""The arm that beats every other arm significantly at the latest look reached, if any."""
+		k = self.look(arms)
+		if len(arms) < 2 or k is None:
+			return None
+		z_boundary = self.boundaries(len(arms) - 1)[k]
+		best = max(arms, key=lambda a: a.mean)
+		for other in arms:
+			if other is best:
+				continue
+			lift = best.mean - other.mean
+			se = math.sqrt(best.variance / best.n + other.variance / other.n)
+			z = lift / se if se > 0 else (float("inf") if lift > 0 else 0.0)
+			if lift < self.min_effect or z < z_boundary:
+				return None
+		return best
+
+	def maybe_promote(self, db: Session, prompt_id: int, scored_version_id: Optional[int] = None) -> Optional[PromptVersion]:
+		"""End the experiment when one arm is a clear winner: it becomes the only active
+		version. Changes are left in the caller's transaction.
+
+		Only tests when the arms have just reached a checkpoint. With ``scored_version_id``
+		(the arm that just got a score) each checkpoint is tested exactly once, by the
+		score that completed it."""
+		if not self.auto_promote:
+			return None
+		active = db.query(PromptVersion).filter(PromptVersion.prompt_id == prompt_id, PromptVersion.is_active == True).all()
+		arms = self.summaries(db, active)
+		n = min((a.n for a in arms), default=0)
+		if len(arms) < 2 or n not in self.checkpoints:
+			return None
+		if scored_version_id is not None and next((a.n for a in arms if a.prompt_version_id == scored_version_id), None) != n:
+			return None
+		best = self.winner(arms)
+		if best is None:
+			return None
+		promoted = None
+		for v in active:
+			if v.id == best.prompt_version_id:
+				v.traffic_weight = None
+				promoted = v
+			else:
+				v.is_active = False
+		return promoted
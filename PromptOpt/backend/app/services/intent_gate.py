@@ -0,0 +1,212 @@
+"""Per-message decision whether RAG retrieval is worth an embedding call and a search.
+
+Greetings, thanks and rewrite requests about the previous answer ("can you
+shorten that") never need company context. A small lexicon catches those and
+obvious HR questions; messages it can't place go to an optional logistic
+regression over hashed word features, trained offline from logged user
+messages labelled by whether retrieval actually finds context for them:
+
+    python -m app.services.intent_gate --output data/intent_gate.json
+
+Without a trained model, undecided messages retrieve (the retrieval score floor
+still keeps irrelevant context out of the prompt).
+"""
+import os
+import re
+import sys
+import json
+import zlib
+import argparse
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from app.utils.tracing import registry
+
+MODEL_PATH = os.getenv("RAG_GATE_MODEL_PATH", os.path.join(os.path.dirname(__file__), "..", "..", "data", "intent_gate.json"))
+FEATURE_DIM = 1 << 12
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+SMALLTALK = frozenset("""
+	hi hello hey hiya yo morning afternoon evening good thanks thank thx ty you so much very lot ok okay k kk cool great
+	nice awesome perfect sure yes yeah yep no nope bye goodbye cheers appreciated appreciate it that's that is helpful
+	got understood alright fine lol haha please np welcome
+""".split())
+# Rewrites of the previous answer: only meaningful with history, and answered from it
+FOLLOWUP_VERBS = frozenset("shorten shorter summarize summarise rephrase reword rewrite simplify expand elaborate translate format tldr condense clarify longer briefer".split())
+FOLLOWUP_REFS = frozenset("that this it above previous last answer response reply again".split())
+DOMAIN = frozenset("""
+	policy policies handbook leave vacation pto sick holiday holidays parental maternity paternity benefit benefits
+	insurance medical dental vision 401k pension retirement salary pay payroll paycheck bonus expense expenses
+	reimbursement reimburse travel remote hybrid office overtime hours schedule onboarding offboarding training
+	review promotion performance harassment complaint grievance hr employee employees manager approval enrollment
+	contract notice resignation termination severance equity stock visa relocation allowance stipend
+""".split())
+
+GATE_DECISIONS = registry.counter("promptopt_rag_gate_decisions_total", "RAG intent gate decisions.", ("decision", "reason"))
+
+
+@dataclass(frozen=True)
+class GateDecision:
+	retrieve: bool
+	reason: str  # forced | disabled | smalltalk | followup | classifier | lexicon | default
+	probability: Optional[float] = None
+
+
+def features(message: str) -> np.ndarray:
+	"""Hashed unigram + bigram counts (L2-normalized) plus a few shape features in the last slots."""
+	words = _WORD_RE.findall((message or "").lower())
+	vec = np.zeros(FEATURE_DIM, dtype=np.float32)
+	for feat in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+		vec[zlib.crc32(feat.encode("utf-8")) % (FEATURE_DIM - 4)] += 1.0
+	norm = float(np.linalg.norm(vec))
+	if norm:
+		vec /= norm
+	vec[-4] = "?" in (message or "")
+	vec[-3] = min(len(words), 40) / 40.0
+	vec[-2] = bool(words) and all(w in SMALLTALK for w in words)
+	vec[-1] = any(w in DOMAIN for w in words)
+	return vec
+
+
+class GateModel:
+	"""Logistic regression over ``features``."""
+
+	def __init__(self, weights: np.ndarray, bias: float, threshold: float = 0.5, meta: Optional[dict] = None):
+		self.weights = weights
+		self.bias = bias
+		self.threshold = threshold
+		self.meta = meta or {}
+
+	def probability(self, message: str) -> float:
+		return float(1.0 / (1.0 + np.exp(-(features(message) @ self.weights + self.bias))))
+
+	@classmethod
+	def train(cls, messages: Sequence[str], labels: Sequence[bool], epochs: int = 300, lr: float = 0.5, l2: float = 1e-3) -> "GateModel":
+		x = np.stack([features(m) for m in messages])
+		y = np.asarray(labels, dtype=np.float32)
+		w, b = np.zeros(FEATURE_DIM, dtype=np.float32), 0.0
+		for _ in range(epochs):
+			p = 1.0 / (1.0 + np.exp(-(x @ w + b)))
+			grad = p - y
+			w -= lr * (x.T @ grad / len(y) + l2 * w)
+			b -= lr * float(grad.mean())
+		# Missing context costs more than a wasted search: lean towards retrieving.
+		return cls(w, b, threshold=0.35, meta={"samples": len(y), "positive_rate": float(y.mean()) if len(y) else 0.0})
+
+	def save(self, path: str) -> None:
+		with open(path, "w", encoding="utf-8") as f:
+			json.dump({"dim": FEATURE_DIM, "bias": self.bias, "threshold": self.threshold, "meta": self.meta, "weights": [round(float(v), 6) for v in self.weights]}, f)
+
+	@classmethod
+	def load(cls, path: str) -> Optional["GateModel"]:
+		try:
+			with open(path, "r", encoding="utf-8") as f:
+				data = json.load(f)
+		except FileNotFoundError:
+			return None
+		if data.get("dim") != FEATURE_DIM:
+			return None
+		return cls(np.asarray(data["weights"], dtype=np.float32), float(data["bias"]), float(data.get("threshold", 0.5)), data.get("meta"))
+
+
+class IntentGate:
+	"""Decides per chat message whether to run RAG retrieval, and accounts for the work it saves."""
+
+	def __init__(self, model_path: Optional[str] = None):
+		self.enabled = os.getenv("RAG_GATE_ENABLED", "true").lower() == "true"
+		self.model = GateModel.load(model_path or MODEL_PATH)
+		self._lock = threading.Lock()
+		self._decisions: Dict[tuple, int] = {}
+		self._retrievals = 0
+		self._empty_retrievals = 0
+		self._retrieval_seconds = 0.0
+
+	def decide(self, message: str, history_turns: int = 0, force: Optional[bool] = None) -> GateDecision:
+		decision = self._decide(message, history_turns, force)
+		with self._lock:
+			key = (decision.retrieve, decision.reason)
+			self._decisions[key] = self._decisions.get(key, 0) + 1
+		GATE_DECISIONS.inc("retrieve" if decision.retrieve else "skip", decision.reason)
+		return decision
+
+	def _decide(self, message: str, history_turns: int, force: Optional[bool]) -> GateDecision:
+		if force is not None:
+			return GateDecision(force, "forced")
+		if not self.enabled:
+			return GateDecision(True, "disabled")
+		words = _WORD_RE.findall((message or "").lower())
+		if not words or all(w in SMALLTALK for w in words):
+			return GateDecision(False, "smalltalk")
+		if (history_turns and len(words) <= 12 and FOLLOWUP_VERBS.intersection(words) and DOMAIN.isdisjoint(words)
+				and (FOLLOWUP_REFS.intersection(words) or len(words) <= 4)):
+			return GateDecision(False, "followup")
+		if DOMAIN.intersection(words):
+			return GateDecision(True, "lexicon")
+		if self.model is not None:
+			p = self.model.probability(message)
+			return GateDecision(p >= self.model.threshold, "classifier", p)
+		return GateDecision(True, "default")
+
+	def record_retrieval(self, seconds: float, found: bool) -> None:
+		"""Time of an embed + search the gate let through, and whether it found any context."""
+		with self._lock:
+			self._retrievals += 1
+			self._retrieval_seconds += seconds
+			if not found:
+				self._empty_retrievals += 1
+
+	def stats(self) -> dict:
+		with self._lock:
+			decisions = dict(self._decisions)
+			retrievals, empty, seconds = self._retrievals, self._empty_retrievals, self._retrieval_seconds
+		total = sum(decisions.values())
+		skipped = sum(n for (retrieve, _), n in decisions.items() if not retrieve)
+		avg = seconds / retrievals if retrievals else 0.0
+		return {
+			"enabled": self.enabled,
+			"classifier": self.model.meta if self.model is not None else None,
+			"decisions": total,
+			"skipped": skipped,
+			"skip_rate": skipped / total if total else 0.0,
+			"by_reason": {f"{'retrieve' if r else 'skip'}:{reason}": n for (r, reason), n in sorted(decisions.items())},
+			"retrievals": retrievals,
+			# Retrievals that found nothing: candidates the gate could have skipped
+			"empty_retrieval_rate": empty / retrievals if retrievals else 0.0,
+			"avg_retrieval_ms": avg * 1000,
+			"estimated_saved_ms": skipped * avg * 1000,
+		}
+
+
+def training_set(limit: int) -> tuple:
+	"""Logged user messages labelled by whether retrieval finds context for them today."""
+	from app.db.database import SessionLocal
+	from app.db.models import Message
+	from app.services.container import services
+
+	db = SessionLocal()
+	try:
+		rows = db.query(Message.content).filter(Message.role == "user").order_by(Message.id.desc()).limit(limit).all()
+	finally:
+		db.close()
+	messages = list(dict.fromkeys(r[0] for r in rows if r[0]))
+	return messages, [bool(services.rag.retrieve(m)) for m in messages]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+	p = argparse.ArgumentParser(description="Train the RAG intent gate classifier from logged chat messages.")
+	p.add_argument("--output", default=MODEL_PATH)
+	p.add_argument("--limit", type=int, default=5000, help="Most recent user messages to label (one embedding call each)")
+	args = p.parse_args(argv)
+	messages, labels = training_set(args.limit)
+	if len(set(labels)) < 2:
+		print(f"Need messages both with and without retrievable context; got {len(messages)} messages, {sum(labels)} positive.")
+		return 1
+	model = GateModel.train(messages, labels)
+	model.save(args.output)
+	print(json.dumps({"output": args.output, **model.meta}))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -1,16 +1,19 @@
-import openai
-import os
 import time
 from typing import List, Optional
-from app.models.chat import ChatMessage, ChatRequest, ChatResponse
+from app.models.chat import ChatMessage, ChatRequest, ChatResponse, TokenUsage
 from app.models.prompt import Prompt
+from app.services.model_router import GenerationSettings, default_generation_settings
+from app.services.resilience import ResilientClient, upstream_breaker
+from app.providers import get_provider
+from app.providers.base import Provider
+from app.services.usage_service import count_message_tokens, count_tokens, meter
 
 class LLMService:
-    def __init__(self):
-        # Initialize OpenAI client
-        self.client = openai.OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY", "your-api-key-here")
-        )
+    def __init__(self, provider: Optional[Provider] = None):
+        # Upstream provider (OpenAI or the offline stub, see LLM_PROVIDER)
+        self.provider = provider or get_provider()
+        self.default_settings = default_generation_settings()
+        self.resilient = ResilientClient("chat", upstream_breaker, deadline=self.default_settings.timeout)
         
         # Default HR prompts
         self.default_prompts = {
@@ -44,9 +47,10 @@ class LLMService:
             })
         return messages
     
-    async def generate_response(self, request: ChatRequest, system_prompt_override: Optional[str] = None) -> ChatResponse:
+    async def generate_response(self, request: ChatRequest, system_prompt_override: Optional[str] = None, settings: Optional[GenerationSettings] = None) -> ChatResponse:
         """Generate response using OpenAI API"""
         start_time = time.time()
+        settings = settings or self.default_settings
         
         try:
             # Choose system prompt (DB override wins)
@@ -67,23 +71,37 @@ class LLMService:
                 "content": request.message
             })
             
-            # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                max_tokens=500,
-                temperature=0.7
+            # Call the LLM provider
+            result = await self.resilient.call(
+                lambda timeout: self.provider.chat(
+                    messages,
+                    model=settings.model,
+                    max_tokens=settings.max_tokens,
+                    temperature=settings.temperature,
+                    timeout=timeout
+                ),
+                deadline=settings.timeout
             )
             
             # Extract response
-            ai_response = response.choices[0].message.content or "I apologize, but I couldn't generate a response."
+            ai_response = result.text or "I apologize, but I couldn't generate a response."
             response_time = time.time() - start_time
+
+            # Provider-reported usage (the metered provider fills it in when the provider doesn't)
+            prompt_tokens = result.prompt_tokens if result.prompt_tokens is not None else count_message_tokens(messages, result.model)
+            completion_tokens = result.completion_tokens if result.completion_tokens is not None else count_tokens(result.text, result.model)
             
             return ChatResponse(
                 response=ai_response,
                 prompt_used=system_prompt,
                 response_time=response_time,
-                conversation_id=f"conv_{int(time.time())}"
+                conversation_id=f"conv_{int(time.time())}",
+                model=settings.model,
+                usage=TokenUsage(
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    cost_usd=meter.cost(result.model or settings.model, prompt_tokens, completion_tokens),
+                ),
             )
             
         except Exception as e:
@@ -91,5 +109,7 @@ class LLMService:
             return ChatResponse(
                 response=f"I apologize, but I'm experiencing technical difficulties. Please try again later. Error: {str(e)}",
                 prompt_used=system_prompt if 'system_prompt' in locals() else "fallback",
-                response_time=time.time() - start_time
+                response_time=time.time() - start_time,
+                model=settings.model,
+                degraded=True
             )
@@ -0,0 +1,113 @@
+import os
+import threading
+from dataclasses import dataclass, replace
+from typing import Dict, Tuple
+
+
+@dataclass(frozen=True)
+class GenerationSettings:
+	model: str
+	max_tokens: int
+	temperature: float
+	timeout: float
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+	settings: GenerationSettings
+	route: str  # pinned | default | fast | large
+	reason: str
+
+
+def default_generation_settings() -> GenerationSettings:
+	return GenerationSettings(
+		model=os.getenv("LLM_DEFAULT_MODEL", "gpt-3.5-turbo"),
+		max_tokens=int(os.getenv("LLM_MAX_TOKENS", "500")),
+		temperature=float(os.getenv("LLM_TEMPERATURE", "0.7")),
+		timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "30")),
+	)
+
+
+class ModelRouter:
+	"""Chooses generation settings for a chat request.
+
+	A prompt version's own settings always win field by field. When the version
+	does not pin a model and routing is enabled, short FAQ-style questions go to
+	the fast model and long messages / large retrieved contexts / long histories
+	escalate to the large model. Every decision is recorded with its latency so
+	the thresholds can be tuned from ``stats()``.
+	"""
+
+	def __init__(self):
+		self.defaults = default_generation_settings()
+		self.enabled = os.getenv("ROUTER_ENABLED", "false").lower() == "true"
+		self.fast_model = os.getenv("ROUTER_FAST_MODEL", "gpt-4o-mini")
+		self.large_model = os.getenv("ROUTER_LARGE_MODEL", "gpt-4o")
+		self.fast_max_message_chars = int(os.getenv("ROUTER_FAST_MAX_MESSAGE_CHARS", "200"))
+		self.fast_max_context_chars = int(os.getenv("ROUTER_FAST_MAX_CONTEXT_CHARS", "2000"))
+		self.large_min_message_chars = int(os.getenv("ROUTER_LARGE_MIN_MESSAGE_CHARS", "1200"))
+		self.large_min_context_chars = int(os.getenv("ROUTER_LARGE_MIN_CONTEXT_CHARS", "4000"))
+		self.large_min_history_turns = int(os.getenv("ROUTER_LARGE_MIN_HISTORY_TURNS", "8"))
+		self._lock = threading.Lock()
+		self._stats: Dict[Tuple[str, str], dict] = {}
+
+	def settings_for(self, prompt_version=None) -> GenerationSettings:
+		"""Defaults overlaid with whatever the prompt version sets explicitly."""
+		s = self.defaults
+		if prompt_version is None:
+			return s
+		overrides = {}
+		if prompt_version.model:
+			overrides["model"] = prompt_version.model
+		if prompt_version.max_tokens:
+			overrides["max_tokens"] = int(prompt_version.max_tokens)
+		if prompt_version.temperature is not None:
+			overrides["temperature"] = float(prompt_version.temperature)
+		if prompt_version.timeout_seconds:
+			overrides["timeout"] = float(prompt_version.timeout_seconds)
+		return replace(s, **overrides) if overrides else s
+
+	def route(self, message: str, context_chars: int = 0, history_turns: int = 0, prompt_version=None) -> RouteDecision:
+		settings = self.settings_for(prompt_version)
+		if prompt_version is not None and prompt_version.model:
+			return RouteDecision(settings, "pinned", f"prompt version {prompt_version.id} pins {settings.model}")
+		if not self.enabled:
+			return RouteDecision(settings, "default", "router disabled")
+
+		msg_chars = len(message or "")
+		if msg_chars >= self.large_min_message_chars:
+			return RouteDecision(replace(settings, model=self.large_model), "large", f"message {msg_chars} chars")
+		if context_chars >= self.large_min_context_chars:
+			return RouteDecision(replace(settings, model=self.large_model), "large", f"context {context_chars} chars")
+		if history_turns >= self.large_min_history_turns:
+			return RouteDecision(replace(settings, model=self.large_model), "large", f"history {history_turns} turns")
+		if msg_chars <= self.fast_max_message_chars and context_chars <= self.fast_max_context_chars:
+			return RouteDecision(replace(settings, model=self.fast_model), "fast", f"short query {msg_chars} chars")
+		return RouteDecision(settings, "default", "no rule matched")
+
+	def record(self, decision: RouteDecision, latency_s: float, ok: bool = True) -> None:
+		key = (decision.route, decision.settings.model)
+		with self._lock:
+			st = self._stats.get(key)
+			if st is None:
+				st = self._stats[key] = {"count": 0, "errors": 0, "latency_sum": 0.0, "latency_max": 0.0}
+			st["count"] += 1
+			if not ok:
+				st["errors"] += 1
+			st["latency_sum"] += latency_s
+			st["latency_max"] = max(st["latency_max"], latency_s)
+
+	def stats(self) -> dict:
+		with self._lock:
+			routes = [
+				{
+					"route": route,
+					"model": model,
+					"count": st["count"],
+					"errors": st["errors"],
+					"avg_latency": st["latency_sum"] / st["count"] if st["count"] else 0.0,
+					"max_latency": st["latency_max"],
+				}
+				for (route, model), st in sorted(self._stats.items())
+			]
+		return {"enabled": self.enabled, "routes": routes}
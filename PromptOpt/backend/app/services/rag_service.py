@@ -1,49 +1,262 @@
 import os
 import json
-from typing import List, Tuple, Dict
+import time
+import uuid
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List, Tuple, Dict, Optional
 import numpy as np
-import faiss
-from pypdf import PdfReader
-import openai
+try:
+	import fcntl
+except ImportError:  # Windows: single-writer deployments only
+	fcntl = None
+from app.services.resilience import ResilientClient, upstream_breaker
+from app.providers import get_provider
+from app.providers.base import Provider
+from app.utils.tracing import span, registry
+from app.utils.singleflight import SingleFlight
+from app.services.vector_store import VectorStore, from_faiss, is_store_dir, mmr, normalize_rows
+from app.services.dedup import MinHashIndex, is_index_dir, signature
 
-INDEX_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
-INDEX_PATH = os.path.join(INDEX_DIR, "company.faiss")
-META_PATH = os.path.join(INDEX_DIR, "company_meta.jsonl")
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "data"))
 EMBED_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# float16 / int8 shrink the matrix every search scans 2x / 4x; results are re-ranked against float32 on disk
+VECTOR_DTYPE = np.dtype(os.getenv("RAG_VECTOR_DTYPE", "float32"))
+# Near-duplicate chunks (estimated Jaccard of word 3-shingles >= threshold) are not embedded again.
+# "merge" records the duplicate's source on the kept chunk; "drop" discards it.
+DEDUP_ENABLED = os.getenv("RAG_DEDUP", "true").lower() in ("1", "true", "yes")
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.85"))
+DEDUP_MODE = os.getenv("RAG_DEDUP_MODE", "merge").lower()
+
+# Retrieval: chunks below RAG_MIN_SCORE (cosine) never reach the prompt; of the rest, those within
+# RAG_SCORE_MARGIN of the best hit are kept (adaptive k), then MMR picks up to top_k for diversity.
+MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.25"))
+SCORE_MARGIN = float(os.getenv("RAG_SCORE_MARGIN", "0.1"))
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+CANDIDATE_FACTOR = int(os.getenv("RAG_CANDIDATE_FACTOR", "3"))
+
+RETRIEVALS = registry.counter("promptopt_rag_retrievals_total", "Retrievals by outcome (used, skipped when nothing clears the score floor).", ("outcome",))
+INGEST_CHUNKS = registry.counter("promptopt_rag_ingest_chunks_total", "Chunks seen at ingest by outcome (indexed, duplicate).", ("outcome",))
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+	"""One immutable published version of the index. Searches hold a reference, so a swap never disturbs them."""
+
+	version: Optional[str]
+	store: Optional[VectorStore]
+	path: Optional[str] = None
+	# Row -> other sources the chunk was found in (near-duplicates merged at ingest)
+	aliases: Dict[int, List[str]] = field(default_factory=dict)
+
+	@property
+	def documents(self) -> int:
+		return self.store.ntotal if self.store is not None else 0
+
+
+_EMPTY = IndexSnapshot(None, None)
+
+
+class SnapshotStore:
+	"""Versioned index snapshots under ``<dir>/snapshots/<version>/`` with an atomic ``CURRENT`` pointer.
+
+	Writers build a complete snapshot directory under a temporary name, rename it
+	into place, then replace ``CURRENT`` (``os.replace``), so readers only ever
+	see fully written snapshots. Writers serialize on an advisory file lock.
+	Snapshots are ``VectorStore`` directories that readers memory-map, so every
+	worker on a host shares one copy of the index through the page cache.
+	"""
+
+	def __init__(self, root: str, keep: Optional[int] = None):
+		self.root = root
+		self.snapshots = os.path.join(root, "snapshots")
+		self.pointer = os.path.join(root, "CURRENT")
+		self.keep = keep if keep is not None else int(os.getenv("RAG_SNAPSHOT_KEEP", "3"))
+		os.makedirs(self.snapshots, exist_ok=True)
+
+	def pointer_stat(self) -> Optional[Tuple[int, int]]:
+		try:
+			st = os.stat(self.pointer)
+		except FileNotFoundError:
+			return None
+		return st.st_mtime_ns, st.st_size
+
+	def current(self) -> Optional[str]:
+		try:
+			with open(self.pointer, "r", encoding="utf-8") as f:
+				return f.read().strip() or None
+		except FileNotFoundError:
+			return None
+
+	def load(self, version: Optional[str]) -> IndexSnapshot:
+		if version is None:
+			# Pre-snapshot layout: a single mutable index file pair; the first ingest snapshots it
+			index_path, meta_path = os.path.join(self.root, "company.faiss"), os.path.join(self.root, "company_meta.jsonl")
+			if os.path.exists(index_path) and os.path.exists(meta_path):
+				return IndexSnapshot(None, _read_faiss(index_path, meta_path))
+			return _EMPTY
+		path = os.path.join(self.snapshots, version)
+		if is_store_dir(path):
+			return IndexSnapshot(version, VectorStore.open(path), path, _read_aliases(path))
+		# Snapshot published before the mapped layout: loaded privately, converted on the next ingest
+		return IndexSnapshot(version, _read_faiss(os.path.join(path, "index.faiss"), os.path.join(path, "meta.jsonl")), path)
+
+	def dedup_index(self, snapshot: IndexSnapshot, threshold: float) -> MinHashIndex:
+		"""The snapshot's MinHash index, rebuilt from its chunk texts if it predates deduplication."""
+		if snapshot.path is not None and is_index_dir(snapshot.path):
+			return MinHashIndex.open(snapshot.path, threshold)
+		if snapshot.store is None:
+			return MinHashIndex.empty(threshold)
+		return MinHashIndex.build([snapshot.store.text(i) for i in range(snapshot.store.ntotal)], threshold)
+
+	def publish(self, store: VectorStore, dedup: Optional[MinHashIndex] = None) -> str:
+		"""Write a new snapshot and point ``CURRENT`` at it (caller holds ``lock()``)."""
+		version = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+		tmp = os.path.join(self.snapshots, f".tmp-{version}")
+		store.save(tmp)
+		if dedup is not None:
+			dedup.save(tmp)
+		os.rename(tmp, os.path.join(self.snapshots, version))
+		pointer_tmp = f"{self.pointer}.{uuid.uuid4().hex[:8]}.tmp"
+		with open(pointer_tmp, "w", encoding="utf-8") as f:
+			f.write(version)
+		os.replace(pointer_tmp, self.pointer)
+		self._prune(version)
+		return version
+
+	def _prune(self, current: str) -> None:
+		# Readers that still map a pruned snapshot keep working: on POSIX an unlinked file lives until unmapped.
+		versions = sorted(v for v in os.listdir(self.snapshots) if not v.startswith("."))
+		for v in versions[:max(0, len(versions) - max(1, self.keep))]:
+			if v != current:
+				shutil.rmtree(os.path.join(self.snapshots, v), ignore_errors=True)
+
+	@contextmanager
+	def lock(self):
+		with open(os.path.join(self.root, ".lock"), "a") as f:
+			if fcntl is not None:
+				fcntl.flock(f, fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				if fcntl is not None:
+					fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_aliases(path: str) -> Dict[int, List[str]]:
+	try:
+		with open(os.path.join(path, "dedup.json"), "r", encoding="utf-8") as f:
+			return {int(k): v for k, v in json.load(f).get("aliases", {}).items()}
+	except FileNotFoundError:
+		return {}
+
+
+@dataclass(frozen=True)
+class IngestResult:
+	source: str
+	chunks: int
+	indexed: int
+	duplicates: int = 0
+	merged: int = 0  # duplicates whose source was recorded on the kept chunk
+
+
+def _read_faiss(index_path: str, meta_path: str) -> VectorStore:
+	import faiss  # deferred: only the pre-mmap layouts are faiss files
+
+	with open(meta_path, "r", encoding="utf-8") as f:
+		meta = [json.loads(l) for l in f]
+	return from_faiss(faiss.read_index(index_path), meta, dtype=VECTOR_DTYPE)
+
 
 class RAGService:
-	def __init__(self):
-		self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY", "your-api-key-here"))
-		os.makedirs(INDEX_DIR, exist_ok=True)
-		self.index = None
-		self.meta: List[dict] = []
-		self._load()
-
-	def _load(self):
-		if os.path.exists(INDEX_PATH) and os.path.exists(META_PATH):
-			self.index = faiss.read_index(INDEX_PATH)
-			with open(META_PATH, "r", encoding="utf-8") as f:
-				self.meta = [json.loads(l) for l in f]
-
-	def _save(self):
-		if self.index is not None:
-			faiss.write_index(self.index, INDEX_PATH)
-		with open(META_PATH, "w", encoding="utf-8") as f:
-			for m in self.meta:
-				f.write(json.dumps(m, ensure_ascii=False) + "\n")
-
-	def _ensure_loaded(self):
-		if (self.index is None or not self.meta) and os.path.exists(INDEX_PATH) and os.path.exists(META_PATH):
-			self._load()
+	def __init__(self, provider: Optional[Provider] = None, index_dir: Optional[str] = None):
+		self.provider = provider or get_provider()
+		self.resilient = ResilientClient("embeddings", upstream_breaker, deadline=float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", "10")))
+		# Identical concurrent queries (e.g. everyone asking about the same announcement) share one call.
+		self.embed_flight = SingleFlight("embeddings")
+		self.store = SnapshotStore(index_dir or INDEX_DIR)
+		# New snapshots published by other workers are noticed by a stat of CURRENT at most this often.
+		self.refresh_interval = float(os.getenv("RAG_REFRESH_CHECK_SECONDS", "1.0"))
+		self._snapshot = _EMPTY
+		self._pointer_stat = None
+		self._next_check = 0.0
+		self._loading = threading.Lock()
+		self.refresh()
+
+	@property
+	def snapshot(self) -> IndexSnapshot:
+		self._maybe_refresh()
+		return self._snapshot
+
+	def _maybe_refresh(self) -> None:
+		now = time.monotonic()
+		if now < self._next_check:
+			return
+		self._next_check = now + self.refresh_interval
+		if self.store.pointer_stat() != self._pointer_stat:
+			# Load in the background; until it's swapped in, searches keep using the current snapshot.
+			threading.Thread(target=self.refresh, name="rag-refresh", daemon=True).start()
+
+	def refresh(self) -> bool:
+		"""Load the snapshot ``CURRENT`` points at if it's newer than ours. Returns True on a swap."""
+		if not self._loading.acquire(blocking=False):
+			return False  # another thread is already loading it
+		try:
+			stat = self.store.pointer_stat()
+			version = self.store.current()
+			if version is not None and version == self._snapshot.version:
+				self._pointer_stat = stat
+				return False
+			snapshot = self.store.load(version)
+			self._snapshot, self._pointer_stat = snapshot, stat
+			return True
+		except Exception as e:
+			# E.g. the snapshot was pruned between reading CURRENT and loading it; the next check retries.
+			logger.warning("RAG snapshot refresh failed: %s", e)
+			return False
+		finally:
+			self._loading.release()
 
 	def _embed(self, texts: List[str]) -> np.ndarray:
-		res = self.client.embeddings.create(model=EMBED_MODEL, input=texts)
-		vecs = [np.array(e.embedding, dtype=np.float32) for e in res.data]
-		return np.vstack(vecs)
+		# Large ingest batches get proportionally more time than a single query.
+		deadline = self.resilient.deadline + 0.1 * len(texts)
+		vecs = self.resilient.call_sync(lambda timeout: self.provider.embed(texts, model=EMBED_MODEL, timeout=timeout), deadline=deadline)
+		return np.ascontiguousarray(vecs, dtype=np.float32)
+
+	def embed_query(self, query: str) -> np.ndarray:
+		"""Embed and L2-normalize a single query so callers can share it across retrieval and caching.
+
+		Concurrent identical queries are coalesced, so the returned array may be
+		shared between requests: treat it as read-only.
+		"""
+		def run() -> np.ndarray:
+			return normalize_rows(self._embed([query]))
+
+		q, _ = self.embed_flight.do_sync((EMBED_MODEL, query), run)
+		return q
+
+	async def embed_query_async(self, query: str) -> np.ndarray:
+		"""``embed_query`` for async callers: the provider call runs off the event loop."""
+		async def run() -> np.ndarray:
+			vecs = await self.resilient.call(lambda timeout: self.provider.embed([query], model=EMBED_MODEL, timeout=timeout))
+			return normalize_rows(vecs)
+
+		q, _ = await self.embed_flight.do((EMBED_MODEL, query), run)
+		return q
+
+	def ingest_pdf(self, pdf_path: str, chunk_chars: int = 1200, overlap: int = 150) -> IngestResult:
+		from pypdf import PdfReader  # deferred: only ingestion parses PDFs
 
-	def ingest_pdf(self, pdf_path: str, chunk_chars: int = 1200, overlap: int = 150) -> int:
 		reader = PdfReader(pdf_path)
 		text = "\n\n".join(page.extract_text() or "" for page in reader.pages)
+		return self.ingest_text(text, source=os.path.basename(pdf_path), chunk_chars=chunk_chars, overlap=overlap)
+
+	def ingest_text(self, text: str, source: str, chunk_chars: int = 1200, overlap: int = 150) -> IngestResult:
 		chunks = []
 		start = 0
 		while start < len(text):
@@ -55,42 +268,111 @@ class RAGService:
 			if end == len(text):
 				break
 		if not chunks:
-			return 0
-		vecs = self._embed(chunks)
-		if self.index is None:
-			self.index = faiss.IndexFlatIP(vecs.shape[1])
-		faiss.normalize_L2(vecs)
-		self.index.add(vecs)
-		for i, chunk in enumerate(chunks):
-			self.meta.append({"text": chunk[:1000], "source": os.path.basename(pdf_path), "idx": len(self.meta)})
-		self._save()
-		return len(chunks)
+			return IngestResult(source, 0, 0)
+		sigs = [signature(chunk) for chunk in chunks] if DEDUP_ENABLED else None
+		keep = list(range(len(chunks)))
+		if sigs is not None:
+			# Screen against the snapshot we serve now, so duplicates are never embedded.
+			served = self.snapshot
+			keep, _ = self._deduplicate(self.store.dedup_index(served, DEDUP_THRESHOLD), served, keep, sigs, source)
+		vecs = normalize_rows(self._embed([chunks[i] for i in keep])) if keep else None
+		with self.store.lock():
+			# Build on the latest published snapshot (another worker may have ingested meanwhile), never
+			# on the mapped one readers are searching.
+			current = self.store.current()
+			base = self._snapshot if current == self._snapshot.version else self.store.load(current)
+			dedup, merged = None, 0
+			if sigs is not None:
+				# Re-check against the base (it may hold chunks ingested since the screen) and record merges on it.
+				dedup = self.store.dedup_index(base, DEDUP_THRESHOLD)
+				kept, merged = self._deduplicate(dedup, base, range(len(chunks)), sigs, source, screened=set(keep))
+				vecs = vecs[[keep.index(i) for i in kept]] if kept else None
+				keep = kept
+			if keep or merged:
+				texts = [chunks[i][:1000] for i in keep]
+				if base.store is None:
+					staged = VectorStore.from_records(vecs, texts, [source] * len(texts), dtype=VECTOR_DTYPE)
+				else:
+					staged = base.store.extend(vecs, texts, source) if keep else base.store
+				version = self.store.publish(staged, dedup)
+				# Serve the published files (shared with other workers), not the private staging copy.
+				snapshot = self.store.load(version)
+				self._snapshot, self._pointer_stat = snapshot, self.store.pointer_stat()
+		result = IngestResult(source, len(chunks), len(keep), len(chunks) - len(keep), merged)
+		INGEST_CHUNKS.inc("indexed", amount=result.indexed)
+		INGEST_CHUNKS.inc("duplicate", amount=result.duplicates)
+		logger.info("Ingested %s: %d chunks, %d indexed, %d near-duplicates (%d merged)", source, result.chunks, result.indexed, result.duplicates, result.merged)
+		return result
+
+	def _deduplicate(self, dedup: MinHashIndex, base: IndexSnapshot, candidates, sigs, source: str, screened=None) -> Tuple[List[int], int]:
+		"""Chunks in ``candidates`` that are not near-duplicates of ``dedup`` rows, adding them as it goes.
+
+		Returns (kept chunk indices, duplicates merged onto an existing chunk of another source).
+		Chunks outside ``screened`` were already found to be duplicates and only get their merge recorded.
+		"""
+		kept, merged = [], 0
+		for i in candidates:
+			hit = dedup.query(sigs[i])
+			if hit is None and (screened is None or i in screened):
+				dedup.add(sigs[i])
+				kept.append(i)
+				continue
+			row = hit[0] if hit is not None else None
+			# Rows past the base are earlier chunks of this same document: nothing to merge.
+			if DEDUP_MODE == "merge" and row is not None and row < base.documents:
+				if base.store.meta(row)["source"] != source and dedup.alias(row, source):
+					merged += 1
+		return kept, merged
 
 	def status(self) -> dict:
-		self._ensure_loaded()
-		return {"documents": len(self.meta), "has_index": self.index is not None}
+		snap = self.snapshot
+		return {"documents": snap.documents, "has_index": snap.store is not None, "version": snap.version}
 
-	def retrieve(self, query: str, top_k: int = 4) -> List[Tuple[str, float, dict]]:
-		self._ensure_loaded()
-		if self.index is None or not self.meta:
+	def retrieve(
+		self,
+		query: str,
+		top_k: int = 4,
+		query_vec: Optional[np.ndarray] = None,
+		min_score: Optional[float] = None,
+		margin: Optional[float] = None,
+		mmr_lambda: Optional[float] = None,
+	) -> List[Tuple[str, float, dict]]:
+		"""Up to ``top_k`` relevant, mutually diverse chunks; empty when nothing clears the score floor.
+
+		Candidates are the best ``top_k * CANDIDATE_FACTOR`` hits. Those scoring at
+		least ``min_score`` and within ``margin`` of the best survive, so a query
+		with one clear match gets one chunk rather than padding; MMR then orders
+		and trims them so near-identical chunks don't crowd out other material.
+		"""
+		snap = self.snapshot
+		if not snap.documents:
 			return []
-		q = self._embed([query])
-		faiss.normalize_L2(q)
-		dists, idxs = self.index.search(q, top_k)
+		min_score = MIN_SCORE if min_score is None else min_score
+		margin = SCORE_MARGIN if margin is None else margin
+		mmr_lambda = MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+		q = query_vec if query_vec is not None else self.embed_query(query)
+		with span("rag.search"):
+			dists, idxs = snap.store.search(q, max(top_k, top_k * CANDIDATE_FACTOR))
+			ok = (idxs[0] >= 0) & (dists[0] >= min_score)
+			if ok.any():
+				ok &= dists[0] >= dists[0][ok].max() - margin
+			ids, scores = idxs[0][ok], dists[0][ok]
+			order = mmr(scores, snap.store.rows(ids), top_k, mmr_lambda) if len(ids) > 1 else list(range(len(ids)))
+		RETRIEVALS.inc("used" if order else "skipped")
 		out = []
-		for rank, (i, d) in enumerate(zip(idxs[0], dists[0])):
-			if i < 0 or i >= len(self.meta):
-				continue
-			m = self.meta[i]
-			out.append((m["text"], float(d), m))
+		for j in order:
+			m = snap.store.meta(ids[j])
+			if int(ids[j]) in snap.aliases:
+				m["also_in"] = snap.aliases[int(ids[j])]
+			out.append((m["text"], float(scores[j]), m))
 		return out
 
-	def build_system_prompt_with_provenance(self, base_prompt: str, query: str, top_k: int = 4) -> Tuple[str, List[Dict]]:
-		contexts = self.retrieve(query, top_k=top_k)
+	def build_system_prompt_with_provenance(self, base_prompt: str, query: str, top_k: int = 4, query_vec: Optional[np.ndarray] = None) -> Tuple[str, List[Dict]]:
+		contexts = self.retrieve(query, top_k=top_k, query_vec=query_vec)
 		if not contexts:
 			return base_prompt, []
 		ctx_block = "\n\n".join([f"[Source {i+1}]\n" + t for i, (t, _, _) in enumerate(contexts)])
-		prov = [{"text": t, "score": s, "source": m.get("source")} for (t, s, m) in contexts]
+		prov = [{"text": t, "score": s, "source": m.get("source"), "also_in": m.get("also_in")} for (t, s, m) in contexts]
 		prompt = (
 			f"{base_prompt}\n\n"
 			f"Use ONLY the following company context to answer. If the answer is not in the context, say you cannot find it.\n"
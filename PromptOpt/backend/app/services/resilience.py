@@ -0,0 +1,327 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+from app.providers.base import ProviderError
+from app.utils.tracing import span
+
+
+class CircuitOpenError(Exception):
+	"""Raised without calling upstream while the circuit breaker is open."""
+
+
+class DeadlineExceeded(Exception):
+	"""The per-call deadline ran out before upstream answered."""
+
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def _openai():
+	"""The ``openai`` module if something imported it; its errors can't occur otherwise (keeps startup lean)."""
+	return sys.modules.get("openai")
+
+
+def _is_timeout(exc: BaseException) -> bool:
+	if isinstance(exc, (DeadlineExceeded, TimeoutError, asyncio.TimeoutError)):
+		return True
+	openai = _openai()
+	return openai is not None and isinstance(exc, openai.APITimeoutError)
+
+
+def is_retryable(exc: BaseException) -> bool:
+	if _is_timeout(exc):
+		return True
+	if isinstance(exc, ProviderError):
+		return exc.retryable
+	openai = _openai()
+	if openai is None:
+		return False
+	if isinstance(exc, (openai.APIConnectionError, openai.RateLimitError)):
+		return True
+	if isinstance(exc, openai.APIStatusError):
+		return exc.status_code >= 500 or exc.status_code in RETRYABLE_STATUS
+	return False
+
+
+@dataclass
+class RetryPolicy:
+	max_attempts: int = 3
+	base_delay: float = 0.2
+	max_delay: float = 2.0
+
+	def backoff(self, attempt: int) -> float:
+		"""Full-jitter exponential backoff for the given (0-based) failed attempt."""
+		return random.uniform(0.0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+	@classmethod
+	def from_env(cls) -> "RetryPolicy":
+		return cls(
+			max_attempts=max(1, int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))),
+			base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "0.2")),
+			max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "2.0")),
+		)
+
+
+class CircuitBreaker:
+	"""Consecutive-failure breaker shared by every call to one provider.
+
+	closed -> open after ``failure_threshold`` retryable failures in a row;
+	open -> half_open after ``reset_timeout`` seconds, letting one probe through;
+	the probe's outcome closes or re-opens the circuit.
+	"""
+
+	def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+		self.name = name
+		self.failure_threshold = failure_threshold or int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+		self.reset_timeout = reset_timeout if reset_timeout is not None else float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+		self._lock = threading.Lock()
+		self._state = "closed"
+		self._failures = 0
+		self._opened_at = 0.0
+		self._probe_in_flight = False
+
+	@property
+	def state(self) -> str:
+		with self._lock:
+			if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+				return "half_open"
+			return self._state
+
+	def allow(self) -> bool:
+		with self._lock:
+			if self._state == "closed":
+				return True
+			if self._state == "open":
+				if time.monotonic() - self._opened_at < self.reset_timeout:
+					return False
+				self._state = "half_open"
+				self._probe_in_flight = False
+			if self._probe_in_flight:
+				return False
+			self._probe_in_flight = True
+			return True
+
+	def record_success(self) -> None:
+		with self._lock:
+			self._state = "closed"
+			self._failures = 0
+			self._probe_in_flight = False
+
+	def record_failure(self) -> None:
+		with self._lock:
+			self._failures += 1
+			if self._state == "half_open" or self._failures >= self.failure_threshold:
+				self._state = "open"
+				self._opened_at = time.monotonic()
+			self._probe_in_flight = False
+
+	def release_probe(self) -> None:
+		"""Give back a half-open probe that ended without a verdict (e.g. cancelled), so another can be sent."""
+		with self._lock:
+			if self._state == "half_open":
+				self._probe_in_flight = False
+
+
+class LatencyTracker:
+	"""Rolling window of successful call latencies used to time hedged requests."""
+
+	def __init__(self, window: int = 200, min_samples: int = 20):
+		self._samples = deque(maxlen=window)
+		self.min_samples = min_samples
+		self._lock = threading.Lock()
+
+	def add(self, seconds: float) -> None:
+		with self._lock:
+			self._samples.append(seconds)
+
+	def percentile(self, q: float) -> Optional[float]:
+		with self._lock:
+			if len(self._samples) < self.min_samples:
+				return None
+			ordered = sorted(self._samples)
+		return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientClient:
+	"""Deadline, retry, hedging and circuit-breaking wrapper around a blocking SDK call.
+
+	``fn`` receives the remaining time budget as ``timeout`` and must pass it on to
+	the HTTP client, so an abandoned attempt cannot outlive its deadline.
+	Async callers use ``call`` (attempts run in worker threads); synchronous code
+	paths use ``call_sync``, which retries but never hedges.
+	"""
+
+	def __init__(self, name: str, breaker: CircuitBreaker, deadline: float = 30.0,
+			retry: Optional[RetryPolicy] = None, hedge: Optional[bool] = None):
+		self.name = name
+		self.breaker = breaker
+		self.deadline = deadline
+		self.retry = retry or RetryPolicy.from_env()
+		self.hedge = hedge if hedge is not None else os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+		self.hedge_quantile = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+		self.latency = LatencyTracker()
+		self._lock = threading.Lock()
+		self._stats = {
+			"calls": 0,
+			"successes": 0,
+			"failures": 0,
+			"retries": 0,
+			"timeouts": 0,
+			"short_circuits": 0,
+			"hedges": 0,
+			"hedge_wins": 0,
+		}
+
+	def _bump(self, key: str, n: int = 1) -> None:
+		with self._lock:
+			self._stats[key] += n
+
+	def stats(self) -> dict:
+		with self._lock:
+			out = dict(self._stats)
+		out["circuit"] = self.breaker.state
+		out["p95_latency"] = self.latency.percentile(0.95)
+		return out
+
+	def _before_call(self) -> None:
+		self._bump("calls")
+		if not self.breaker.allow():
+			self._bump("short_circuits")
+			raise CircuitOpenError(f"{self.breaker.name} circuit open")
+
+	def _on_failure(self, exc: BaseException) -> None:
+		if _is_timeout(exc):
+			self._bump("timeouts")
+		if is_retryable(exc):
+			self.breaker.record_failure()
+		else:
+			# Upstream answered (e.g. a 400): the provider itself is healthy.
+			self.breaker.record_success()
+
+	async def call(self, fn: Callable[..., Any], deadline: Optional[float] = None) -> Any:
+		with span(f"upstream.{self.name}"):
+			return await self._call(fn, deadline)
+
+	async def _call(self, fn: Callable[..., Any], deadline: Optional[float]) -> Any:
+		self._before_call()
+		try:
+			return await self._run(fn, deadline)
+		except Exception:
+			raise
+		except BaseException:
+			# Cancelled (client disconnect, failed gather, shutdown): no verdict on the
+			# provider, but a half-open probe must not stay taken forever.
+			self.breaker.release_probe()
+			raise
+
+	async def _run(self, fn: Callable[..., Any], deadline: Optional[float]) -> Any:
+		deadline_at = time.monotonic() + (deadline or self.deadline)
+		attempt = 0
+		while True:
+			remaining = deadline_at - time.monotonic()
+			if remaining <= 0:
+				self._bump("timeouts")
+				self._bump("failures")
+				raise DeadlineExceeded(f"{self.name}: deadline exceeded after {attempt} attempts")
+			try:
+				start = time.monotonic()
+				result = await self._attempt(fn, remaining)
+				self.latency.add(time.monotonic() - start)
+				self.breaker.record_success()
+				self._bump("successes")
+				return result
+			except Exception as exc:
+				self._on_failure(exc)
+				attempt += 1
+				if not is_retryable(exc) or attempt >= self.retry.max_attempts or not self.breaker.allow():
+					self._bump("failures")
+					raise
+				self._bump("retries")
+				delay = min(self.retry.backoff(attempt - 1), max(0.0, deadline_at - time.monotonic()))
+				await asyncio.sleep(delay)
+
+	async def _attempt(self, fn: Callable[..., Any], timeout: float) -> Any:
+		hedge_after = self.latency.percentile(self.hedge_quantile) if self.hedge else None
+		primary = asyncio.ensure_future(asyncio.to_thread(fn, timeout=timeout))
+		if hedge_after is None or hedge_after >= timeout:
+			try:
+				return await asyncio.wait_for(primary, timeout)
+			except asyncio.TimeoutError:
+				raise DeadlineExceeded(f"{self.name}: attempt timed out after {timeout:.2f}s")
+
+		done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+		if done:
+			return primary.result()
+		# Primary is slower than p95: race a second request against it.
+		self._bump("hedges")
+		hedge_timeout = timeout - hedge_after
+		secondary = asyncio.ensure_future(asyncio.to_thread(fn, timeout=hedge_timeout))
+		pending = {primary, secondary}
+		end = time.monotonic() + hedge_timeout
+		error: Optional[BaseException] = None
+		while pending:
+			done, pending = await asyncio.wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+			if not done:
+				break
+			for task in done:
+				if task.exception() is None:
+					if task is secondary:
+						self._bump("hedge_wins")
+					for other in pending:
+						other.cancel()
+					return task.result()
+				error = task.exception()
+		for task in pending:
+			task.cancel()
+		if error is not None:
+			raise error
+		raise DeadlineExceeded(f"{self.name}: hedged attempt timed out after {timeout:.2f}s")
+
+	def call_sync(self, fn: Callable[..., Any], deadline: Optional[float] = None) -> Any:
+		with span(f"upstream.{self.name}"):
+			return self._call_sync(fn, deadline)
+
+	def _call_sync(self, fn: Callable[..., Any], deadline: Optional[float]) -> Any:
+		self._before_call()
+		try:
+			return self._run_sync(fn, deadline)
+		except Exception:
+			raise
+		except BaseException:
+			self.breaker.release_probe()
+			raise
+
+	def _run_sync(self, fn: Callable[..., Any], deadline: Optional[float]) -> Any:
+		deadline_at = time.monotonic() + (deadline or self.deadline)
+		attempt = 0
+		while True:
+			remaining = deadline_at - time.monotonic()
+			if remaining <= 0:
+				self._bump("timeouts")
+				self._bump("failures")
+				raise DeadlineExceeded(f"{self.name}: deadline exceeded after {attempt} attempts")
+			try:
+				start = time.monotonic()
+				result = fn(timeout=remaining)
+				self.latency.add(time.monotonic() - start)
+				self.breaker.record_success()
+				self._bump("successes")
+				return result
+			except Exception as exc:
+				self._on_failure(exc)
+				attempt += 1
+				if not is_retryable(exc) or attempt >= self.retry.max_attempts or not self.breaker.allow():
+					self._bump("failures")
+					raise
+				self._bump("retries")
+				time.sleep(min(self.retry.backoff(attempt - 1), max(0.0, deadline_at - time.monotonic())))
+
+
+# One breaker per upstream provider: when it is degraded, every service falls back.
+upstream_breaker = CircuitBreaker("upstream")
@@ -0,0 +1,275 @@
+"""Token, cost and latency accounting for every provider call.
+
+``MeteredProvider`` (see ``app.providers.get_provider``) times each chat,
+judge, embedding and moderation call and records its tokens here. Tokens come
+from the provider's usage report where there is one; otherwise they are
+counted locally (tiktoken when installed, ~4 characters per token otherwise)
+and the call is flagged as estimated. Cost is priced per model from
+``DEFAULT_PRICES`` overridden by ``USAGE_PRICES`` (JSON, USD per 1M tokens):
+
+    USAGE_PRICES='{"gpt-4o-mini": [0.15, 0.60], "my-finetune": [3.0, 12.0]}'
+
+Calls are attributed to the user and prompt version of the request that made
+them (``attribute``; a ContextVar, so worker threads started with
+``asyncio.to_thread`` inherit it) and aggregated in process per hour. The app
+flushes the aggregate to ``usage_rollups`` every ``USAGE_FLUSH_SECONDS``, one
+upsert per (hour, user, prompt version, operation, model) instead of a row per
+call; the usage endpoints flush before they read.
+"""
+import os
+import json
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.db.models import UsageRollup
+from app.db.upsert import upsert
+from app.services.analytics_service import bucket_start
+from app.utils.tracing import registry
+
+USAGE_ENABLED = os.getenv("USAGE_ENABLED", "true").lower() == "true"
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "10"))
+
+# USD per 1M tokens: (input, output). Matched by longest model-name prefix, so dated snapshots share a price.
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+	"gpt-4o-mini": (0.15, 0.60),
+	"gpt-4o": (2.50, 10.00),
+	"gpt-4.1-nano": (0.10, 0.40),
+	"gpt-4.1-mini": (0.40, 1.60),
+	"gpt-4.1": (2.00, 8.00),
+	"text-embedding-3-small": (0.02, 0.0),
+	"text-embedding-3-large": (0.13, 0.0),
+	"text-embedding-ada-002": (0.10, 0.0),
+	"omni-moderation": (0.0, 0.0),
+	"text-moderation": (0.0, 0.0),
+}
+OPERATIONS = ("chat", "judge", "embed", "moderate")
+_FIELDS = ("calls", "errors", "estimated_calls", "prompt_tokens", "completion_tokens", "cost_usd", "latency_ms")
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_TOKENS = registry.counter("promptopt_provider_tokens_total", "Provider tokens by operation, model and kind (prompt, completion).", ("operation", "model", "kind"))
+PROVIDER_COST = registry.counter("promptopt_provider_cost_usd_total", "Estimated provider spend in USD.", ("operation", "model"))
+
+
+@dataclass
+class UsageScope:
+	user_id: Optional[int] = None
+	prompt_version_id: Optional[int] = None
+
+
+# Mutable scope object: threads copying the context share it, so later attribution reaches them too.
+_scope: ContextVar[Optional[UsageScope]] = ContextVar("promptopt_usage_scope", default=None)
+
+
+def attribute(user_id: Optional[int] = None, prompt_version_id: Optional[int] = None) -> UsageScope:
+	"""Attribute the current request's provider calls from here on to a user and/or prompt version."""
+	scope = _scope.get()
+	if scope is None:
+		scope = UsageScope()
+		_scope.set(scope)
+	if user_id is not None:
+		scope.user_id = user_id
+	if prompt_version_id is not None:
+		scope.prompt_version_id = prompt_version_id
+	return scope
+
+
+@contextmanager
+def usage_scope(user_id: Optional[int] = None, prompt_version_id: Optional[int] = None):
+	"""Attribution for a block (background jobs, batch evaluation); the enclosing scope is restored afterwards."""
+	outer = _scope.get() or UsageScope()
+	token = _scope.set(UsageScope(user_id if user_id is not None else outer.user_id,
+		prompt_version_id if prompt_version_id is not None else outer.prompt_version_id))
+	try:
+		yield
+	finally:
+		_scope.reset(token)
+
+
+# -- token counting and pricing -------------------------------------------
+
+_encodings: dict = {}
+
+
+def _encoding(model: Optional[str]):
+	key = model or ""
+	if key not in _encodings:
+		try:
+			import tiktoken
+		except ImportError:
+			_encodings[key] = None
+		else:
+			try:
+				_encodings[key] = tiktoken.encoding_for_model(key)
+			except KeyError:
+				_encodings[key] = tiktoken.get_encoding("cl100k_base")
+	return _encodings[key]
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+	enc = _encoding(model)
+	if enc is None:
+		return len(text or "") // 4 + 1
+	return len(enc.encode(text or ""))
+
+
+def count_message_tokens(messages: Iterable[dict], model: Optional[str] = None) -> int:
+	# Chat formatting adds a few tokens per message and to prime the reply.
+	return sum(count_tokens(m.get("content") or "", model) + 4 for m in messages) + 2
+
+
+def load_prices() -> Dict[str, Tuple[float, float]]:
+	prices = dict(DEFAULT_PRICES)
+	raw = os.getenv("USAGE_PRICES")
+	if raw:
+		prices.update({model: (float(p[0]), float(p[1])) for model, p in json.loads(raw).items()})
+	return prices
+
+
+class UsageMeter:
+	"""In-process usage aggregate, flushed to ``usage_rollups`` in batches."""
+
+	def __init__(self, prices: Optional[Dict[str, Tuple[float, float]]] = None):
+		self.prices = prices if prices is not None else load_prices()
+		self._lock = threading.Lock()
+		self._pending: Dict[tuple, list] = {}
+
+	def price(self, model: str) -> Optional[Tuple[float, float]]:
+		match = max((m for m in self.prices if model.startswith(m)), key=len, default=None)
+		return self.prices[match] if match is not None else None
+
+	def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+		price = self.price(model or "")
+		if price is None:
+			return 0.0
+		return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+	def record(self, operation: str, model: str, prompt_tokens: int, completion_tokens: int, seconds: float,
+			error: bool = False, estimated: bool = False, ts: Optional[datetime] = None) -> float:
+		"""Add one provider call to the aggregate under the current attribution; returns its cost."""
+		scope = _scope.get() or UsageScope()
+		model = model or "unknown"
+		cost = self.cost(model, prompt_tokens, completion_tokens)
+		key = (bucket_start(ts or datetime.utcnow(), "hour"), scope.user_id or 0, scope.prompt_version_id or 0, operation, model)
+		with self._lock:
+			row = self._pending.get(key)
+			if row is None:
+				row = self._pending[key] = [0, 0, 0, 0, 0, 0.0, 0.0]
+			row[0] += 1
+			row[1] += int(error)
+			row[2] += int(estimated)
+			row[3] += prompt_tokens
+			row[4] += completion_tokens
+			row[5] += cost
+			row[6] += seconds * 1000
+		PROVIDER_TOKENS.inc(operation, model, "prompt", amount=prompt_tokens)
+		if completion_tokens:
+			PROVIDER_TOKENS.inc(operation, model, "completion", amount=completion_tokens)
+		if cost:
+			PROVIDER_COST.inc(operation, model, amount=cost)
+		return cost
+
+	def pending(self) -> int:
+		with self._lock:
+			return len(self._pending)
+
+	def flush(self, db: Optional[Session] = None) -> int:
+		"""Upsert everything recorded so far; on failure the batch goes back into the aggregate. Returns rows written."""
+		with self._lock:
+			batch, self._pending = self._pending, {}
+		if not batch:
+			return 0
+		own = db is None
+		if own:
+			from app.db.database import SessionLocal
+			db = SessionLocal()
+		table = UsageRollup.__table__
+		try:
+			connection = db.connection()
+			for (bucket, user_id, pv_id, operation, model), row in batch.items():
+				values = dict(zip(_FIELDS, row))
+				key = {"bucket_start": bucket, "user_id": user_id, "prompt_version_id": pv_id, "operation": operation, "model": model}
+				upsert(connection, table, key, values, values)
+			db.commit()
+		except Exception:
+			db.rollback()
+			with self._lock:
+				for key, row in batch.items():
+					mine = self._pending.setdefault(key, [0, 0, 0, 0, 0, 0.0, 0.0])
+					for i, v in enumerate(row):
+						mine[i] += v
+			raise
+		finally:
+			if own:
+				db.close()
+		return len(batch)
+
+
+meter = UsageMeter()
+
+
+async def run_periodically(interval: float) -> None:
+	"""Flush ``meter`` every ``interval`` seconds, off the event loop; flushes once more when cancelled."""
+	try:
+		while True:
+			await asyncio.sleep(interval)
+			try:
+				await asyncio.to_thread(meter.flush)
+			except Exception:
+				logger.exception("Usage flush failed")
+	finally:
+		try:
+			meter.flush()
+		except Exception:
+			logger.exception("Final usage flush failed")
+
+
+# -- reporting ------------------------------------------------------------
+
+GROUPS = {"user": "user_id", "prompt_version": "prompt_version_id"}
+
+
+def totals(db: Session, group_by: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+		ids: Optional[Iterable[int]] = None) -> List[dict]:
+	"""Calls, tokens, cost and latency per user or prompt version (0: unattributed), with a per-operation breakdown."""
+	if group_by not in GROUPS:
+		raise ValueError(f"unknown grouping {group_by!r}")
+	t = UsageRollup.__table__
+	col = t.c[GROUPS[group_by]]
+	q = select(col, t.c.operation, *(func.sum(t.c[f]) for f in _FIELDS)).group_by(col, t.c.operation)
+	if start is not None:
+		q = q.where(t.c.bucket_start >= bucket_start(start, "hour"))
+	if end is not None:
+		q = q.where(t.c.bucket_start < end)
+	if ids is not None:
+		q = q.where(col.in_(list(ids)))
+	out: Dict[int, dict] = {}
+	for key, operation, *sums in db.execute(q):
+		ops = dict(zip(_FIELDS, sums))
+		item = out.setdefault(key, {GROUPS[group_by]: key or None, **{f: 0 for f in _FIELDS}, "operations": {}})
+		for f in _FIELDS:
+			item[f] += ops[f]
+		calls = ops["calls"] or 1
+		item["operations"][operation] = {
+			"calls": ops["calls"],
+			"prompt_tokens": ops["prompt_tokens"],
+			"completion_tokens": ops["completion_tokens"],
+			"cost_usd": round(ops["cost_usd"], 6),
+			"avg_prompt_tokens": ops["prompt_tokens"] / calls,
+			"avg_latency_ms": ops["latency_ms"] / calls,
+		}
+	items = []
+	for item in out.values():
+		latency = item.pop("latency_ms")
+		item["total_tokens"] = item["prompt_tokens"] + item["completion_tokens"]
+		item["cost_usd"] = round(item["cost_usd"], 6)
+		item["avg_latency_ms"] = latency / item["calls"] if item["calls"] else 0.0
+		items.append(item)
+	return sorted(items, key=lambda i: (-i["cost_usd"], -i["total_tokens"]))
@@ -0,0 +1,256 @@
+"""Memory-mapped, read-only vector store for RAG snapshots.
+
+A snapshot directory holds plain arrays that every worker maps instead of
+loading, so the OS page cache keeps one physical copy per host:
+
+    vectors.npy      (n, dim) float32, float16 or int8 codes; rows L2-normalized
+    scales.npy       (dim,) float32 per-dimension scale of the int8 codes (int8 only)
+    exact.npy        (n, dim) float32 originals, for re-ranking (float16/int8 only)
+    offsets.npy      (n + 1,) int64 byte offsets of each chunk's text in texts.bin
+    texts.bin        UTF-8 chunk texts, concatenated
+    source_ids.npy   (n,) int32 index into sources.json
+    sources.json     distinct source names
+
+Search is an inner product computed block-wise straight from the mapping. For
+float32 it is exact (the same results as ``faiss.IndexFlatIP``); compressed
+stores score the codes, then re-score the best ``k * RERANK_FACTOR`` candidates
+against ``exact.npy``, which only pages in those rows.
+"""
+import os
+import json
+import mmap
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+FILES = ("vectors.npy", "offsets.npy", "texts.bin", "source_ids.npy", "sources.json")
+# Float32 bytes scored per matrix product: compressed blocks are widened in cache-sized pieces
+BLOCK_BYTES = 1 << 20
+# Candidates re-scored exactly per result; 0 ranks by the compressed scores alone
+RERANK_FACTOR = int(os.getenv("RAG_RERANK_FACTOR", "4"))
+DTYPES = ("float32", "float16", "int8")
+
+
+def quantize(vectors: np.ndarray, dtype) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+	"""Codes for ``vectors`` in ``dtype``, plus per-dimension scales for int8 (symmetric, 127 levels)."""
+	dtype = np.dtype(dtype)
+	if dtype.name not in DTYPES:
+		raise ValueError(f"Unsupported vector dtype {dtype.name!r}; expected one of {DTYPES}")
+	if dtype != np.int8:
+		return np.ascontiguousarray(vectors, dtype=dtype), None
+	vectors = np.asarray(vectors, dtype=np.float32)
+	scales = (np.abs(vectors).max(axis=0) / 127.0) if len(vectors) else np.ones(vectors.shape[1], dtype=np.float32)
+	scales = np.maximum(scales, 1e-12).astype(np.float32)
+	return np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8), scales
+
+
+class VectorStore:
+	def __init__(
+		self,
+		vectors: np.ndarray,
+		offsets: np.ndarray,
+		texts,
+		source_ids: np.ndarray,
+		sources: List[str],
+		scales: Optional[np.ndarray] = None,
+		exact: Optional[np.ndarray] = None,
+	):
+		self.vectors = vectors
+		self.offsets = offsets
+		self._texts = texts
+		self.source_ids = source_ids
+		self.sources = sources
+		self.scales = scales
+		self.exact = exact
+
+	@classmethod
+	def open(cls, path: str) -> "VectorStore":
+		"""Map a snapshot directory; nothing is copied into process memory."""
+		vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+		offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+		source_ids = np.load(os.path.join(path, "source_ids.npy"), mmap_mode="r")
+		scales = _load_optional(os.path.join(path, "scales.npy"))
+		exact = _load_optional(os.path.join(path, "exact.npy"), mmap_mode="r")
+		with open(os.path.join(path, "sources.json"), "r", encoding="utf-8") as f:
+			sources = json.load(f)
+		texts_path = os.path.join(path, "texts.bin")
+		if os.path.getsize(texts_path):
+			with open(texts_path, "rb") as f:
+				texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		else:
+			texts = b""
+		return cls(vectors, offsets, texts, source_ids, sources, scales, exact)
+
+	@classmethod
+	def from_records(cls, vectors: np.ndarray, texts: Sequence[str], sources: Sequence[str], dtype=np.float32) -> "VectorStore":
+		"""In-memory store (used to convert older formats and to stage new snapshots).
+
+		``vectors`` are float32; a compressed ``dtype`` keeps them alongside the codes for re-ranking.
+		"""
+		encoded = [t.encode("utf-8") for t in texts]
+		offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+		offsets[1:] = np.cumsum([len(b) for b in encoded]) if encoded else []
+		names = sorted(set(sources))
+		lookup = {s: i for i, s in enumerate(names)}
+		source_ids = np.array([lookup[s] for s in sources], dtype=np.int32)
+		codes, scales = quantize(vectors, dtype)
+		exact = None if codes.dtype == np.float32 else np.ascontiguousarray(vectors, dtype=np.float32)
+		return cls(codes, offsets, b"".join(encoded), source_ids, names, scales, exact)
+
+	def save(self, path: str) -> None:
+		os.makedirs(path, exist_ok=True)
+		np.save(os.path.join(path, "vectors.npy"), np.ascontiguousarray(self.vectors))
+		np.save(os.path.join(path, "offsets.npy"), np.asarray(self.offsets))
+		np.save(os.path.join(path, "source_ids.npy"), np.asarray(self.source_ids))
+		if self.scales is not None:
+			np.save(os.path.join(path, "scales.npy"), np.asarray(self.scales))
+		if self.exact is not None:
+			np.save(os.path.join(path, "exact.npy"), np.ascontiguousarray(self.exact))
+		with open(os.path.join(path, "texts.bin"), "wb") as f:
+			f.write(self._texts[:])
+		with open(os.path.join(path, "sources.json"), "w", encoding="utf-8") as f:
+			json.dump(self.sources, f, ensure_ascii=False)
+
+	def extend(self, vectors: np.ndarray, texts: Sequence[str], source: str) -> "VectorStore":
+		"""New in-memory store with rows appended; ``self`` is left untouched."""
+		added = VectorStore.from_records(vectors, texts, [source] * len(texts))
+		sources = list(self.sources)
+		if source not in sources:
+			sources.append(source)
+		# Re-quantize everything: int8 scales are fitted to the whole matrix, and new rows may widen them.
+		full = np.concatenate([self.float32(), added.vectors])
+		codes, scales = quantize(full, self.vectors.dtype)
+		return VectorStore(
+			codes,
+			np.concatenate([self.offsets, added.offsets[1:] + self.offsets[-1]]),
+			self._texts[:] + added._texts,
+			np.concatenate([self.source_ids, np.full(len(texts), sources.index(source), dtype=np.int32)]),
+			sources,
+			scales,
+			None if codes.dtype == np.float32 else full,
+		)
+
+	@property
+	def ntotal(self) -> int:
+		return int(self.vectors.shape[0])
+
+	@property
+	def dim(self) -> int:
+		return int(self.vectors.shape[1])
+
+	@property
+	def nbytes(self) -> int:
+		"""Size of the matrix every search scans (the re-ranking file is only touched row by row)."""
+		return int(self.vectors.nbytes)
+
+	def float32(self) -> np.ndarray:
+		"""The vectors at full precision: the re-ranking copy if there is one, else decoded codes."""
+		if self.exact is not None:
+			return np.asarray(self.exact, dtype=np.float32)
+		vectors = np.asarray(self.vectors, dtype=np.float32)
+		return vectors * self.scales if self.scales is not None else vectors
+
+	def rows(self, ids: Sequence[int]) -> np.ndarray:
+		"""Full-precision vectors of ``ids`` (from the re-ranking file when compressed)."""
+		ids = np.asarray(ids, dtype=np.int64)
+		if self.exact is not None:
+			return np.asarray(self.exact[ids], dtype=np.float32)
+		block = np.asarray(self.vectors[ids], dtype=np.float32)
+		return block * self.scales if self.scales is not None else block
+
+	def text(self, i: int) -> str:
+		return self._texts[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8")
+
+	def meta(self, i: int) -> dict:
+		return {"text": self.text(i), "source": self.sources[int(self.source_ids[i])], "idx": int(i)}
+
+	def search(self, q: np.ndarray, k: int, rerank: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+		"""Top-``k`` inner products for each query row, shaped like ``faiss.Index.search`` (-1 pads).
+
+		``rerank`` overrides ``RERANK_FACTOR`` for compressed stores.
+		"""
+		q = np.ascontiguousarray(q, dtype=np.float32).reshape(-1, self.dim)
+		n = self.ntotal
+		# Scaling the query once is cheaper than decoding every int8 row.
+		q_codes = q * self.scales if self.scales is not None else q
+		scores = np.empty((q.shape[0], n), dtype=np.float32)
+		if self.vectors.dtype == np.float32:
+			scores[:] = q_codes @ self.vectors.T
+		else:
+			step = max(1, BLOCK_BYTES // (4 * self.dim))
+			for start in range(0, n, step):
+				block = self.vectors[start:start + step]
+				scores[:, start:start + len(block)] = q_codes @ block.astype(np.float32).T
+		dists = np.full((q.shape[0], k), -np.inf, dtype=np.float32)
+		idxs = np.full((q.shape[0], k), -1, dtype=np.int64)
+		k_eff = min(k, n)
+		if k_eff == 0:
+			return dists, idxs
+		factor = RERANK_FACTOR if rerank is None else rerank
+		if self.exact is not None and factor > 0:
+			top = _top(scores, min(n, k_eff * factor))
+			for row, candidates in enumerate(top):
+				rows = np.sort(candidates)  # ascending rows read the mapped file sequentially
+				exact = np.asarray(self.exact[rows], dtype=np.float32) @ q[row]
+				best = _top(exact[None, :], k_eff)[0]
+				idxs[row, :k_eff] = rows[best]
+				dists[row, :k_eff] = exact[best]
+			return dists, idxs
+		top = _top(scores, k_eff)
+		idxs[:, :k_eff] = top
+		dists[:, :k_eff] = np.take_along_axis(scores, top, axis=1)
+		return dists, idxs
+
+	def close(self) -> None:
+		if isinstance(self._texts, mmap.mmap):
+			self._texts.close()
+
+
+def mmr(scores: np.ndarray, vectors: np.ndarray, k: int, lam: float) -> List[int]:
+	"""Maximal marginal relevance: greedily pick ``k`` of the candidate rows, trading relevance for novelty.
+
+	``scores`` are the candidates' similarities to the query and ``vectors`` their
+	normalized embeddings; ``lam`` = 1 is pure relevance order. Returns positions
+	into the candidate arrays, in pick order.
+	"""
+	n = len(scores)
+	if n == 0 or k <= 0:
+		return []
+	sim = vectors @ vectors.T
+	picked = [int(np.argmax(scores))]
+	redundancy = sim[picked[0]].copy()
+	for _ in range(min(k, n) - 1):
+		gain = lam * scores - (1.0 - lam) * redundancy
+		gain[picked] = -np.inf
+		j = int(np.argmax(gain))
+		picked.append(j)
+		np.maximum(redundancy, sim[j], out=redundancy)
+	return picked
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+	"""Column indices of the ``k`` largest scores per row, best first."""
+	top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+	order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+	return np.take_along_axis(top, order, axis=1)
+
+
+def _load_optional(path: str, mmap_mode: Optional[str] = None) -> Optional[np.ndarray]:
+	return np.load(path, mmap_mode=mmap_mode) if os.path.exists(path) else None
+
+
+def is_store_dir(path: str) -> bool:
+	return all(os.path.exists(os.path.join(path, f)) for f in FILES)
+
+
+def normalize_rows(x: np.ndarray) -> np.ndarray:
+	x = np.ascontiguousarray(x, dtype=np.float32)
+	norms = np.linalg.norm(x, axis=1, keepdims=True)
+	return x / np.maximum(norms, 1e-12)
+
+
+def from_faiss(index, metas: List[dict], dtype=np.float32) -> Optional["VectorStore"]:
+	"""Convert a flat faiss index + metadata list (earlier snapshot formats) to an in-memory store."""
+	if index is None:
+		return None
+	vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype=np.float32)
+	return VectorStore.from_records(vectors, [m.get("text", "") for m in metas], [m.get("source") or "" for m in metas], dtype=dtype)
@@ -0,0 +1,328 @@
+"""Admission control for expensive endpoints (``POST /chat``).
+
+Every admitted request must fit three limits, checked before the route runs:
+
+- a per-user concurrency quota (``ADMISSION_MAX_CONCURRENT_<ROLE>``);
+- a per-user token bucket, refilled at the role's tokens-per-minute budget
+  (``ADMISSION_USER_TPM_<ROLE>``);
+- a global token bucket sized to the provider quota (``PROVIDER_TPM_LIMIT``).
+
+Bucket costs are the request's estimated provider tokens, so one long
+conversation counts for more than a short question. Rejections are 429s with
+``Retry-After``. State lives in-process (``ADMISSION_BACKEND=memory``) or in a
+SQLite file shared by every worker on the host (``ADMISSION_BACKEND=sqlite``).
+"""
+import os
+import json
+import time
+import asyncio
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from jose import JWTError, jwt
+from app.auth.security import ALGORITHM, SECRET_KEY
+from app.utils.rate_limit import TokenBucket
+from app.utils.tracing import registry
+
+ADMISSION_REJECTED = registry.counter("promptopt_admission_rejected_total", "Requests rejected by admission control.", ("scope",))
+ADMITTED_TOKENS = registry.counter("promptopt_admission_tokens_total", "Estimated provider tokens admitted.", ("role",))
+
+
+@dataclass(frozen=True)
+class BucketSpec:
+	key: str
+	capacity: float
+	per_minute: float
+
+
+class AdmissionBackend(ABC):
+	"""Shared limiter state. ``take_all`` is all-or-nothing across the given buckets."""
+
+	# Operations that may wait on I/O or locks run in a worker thread, off the event loop.
+	blocking = False
+
+	@abstractmethod
+	def take_all(self, specs: List[BucketSpec], cost: float) -> Tuple[Optional[str], float]:
+		"""Charge ``cost`` to every bucket, or to none. Returns (rejecting key or None, retry_after)."""
+
+	@abstractmethod
+	def acquire(self, key: str, limit: int, lease_seconds: float) -> Optional[str]:
+		"""Take a concurrency slot; returns a lease ID, or None when ``limit`` are in use."""
+
+	@abstractmethod
+	def release(self, lease_id: str) -> None:
+		...
+
+
+def _refill(tokens: float, updated: float, spec: BucketSpec, now: float) -> float:
+	return min(spec.capacity, tokens + (now - updated) * spec.per_minute / 60.0)
+
+
+def _retry_after(tokens: float, cost: float, spec: BucketSpec) -> float:
+	rate = spec.per_minute / 60.0
+	# A request larger than the whole bucket can never fit: ask the client to wait a full refill.
+	needed = min(cost, spec.capacity) - tokens
+	return needed / rate if rate > 0 else float("inf")
+
+
+class MemoryBackend(AdmissionBackend):
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._buckets: Dict[str, TokenBucket] = {}
+		self._leases: Dict[str, str] = {}
+		self._active: Dict[str, int] = {}
+
+	def take_all(self, specs: List[BucketSpec], cost: float) -> Tuple[Optional[str], float]:
+		now = time.monotonic()
+		with self._lock:
+			buckets = []
+			for spec in specs:
+				b = self._buckets.get(spec.key)
+				if b is None or b.capacity != spec.capacity:
+					b = self._buckets[spec.key] = TokenBucket(spec.capacity, spec.per_minute / 60.0, now)
+				b.tokens = _refill(b.tokens, b.updated, spec, now)
+				b.updated = now
+				if b.tokens < min(cost, spec.capacity):
+					return spec.key, _retry_after(b.tokens, cost, spec)
+				buckets.append(b)
+			for b in buckets:
+				b.tokens -= min(cost, b.capacity)
+			return None, 0.0
+
+	def acquire(self, key: str, limit: int, lease_seconds: float) -> Optional[str]:
+		with self._lock:
+			if self._active.get(key, 0) >= limit:
+				return None
+			lease_id = uuid.uuid4().hex
+			self._leases[lease_id] = key
+			self._active[key] = self._active.get(key, 0) + 1
+			return lease_id
+
+	def release(self, lease_id: str) -> None:
+		with self._lock:
+			key = self._leases.pop(lease_id, None)
+			if key is not None:
+				self._active[key] -= 1
+				if not self._active[key]:
+					del self._active[key]
+
+
+class SQLiteBackend(AdmissionBackend):
+	"""Limiter state in a SQLite file so every worker process on a host shares one budget.
+
+	Each operation is a short ``BEGIN IMMEDIATE`` transaction. Concurrency slots
+	are leases with an expiry, so a crashed worker cannot leak them forever.
+	"""
+
+	blocking = True
+
+	def __init__(self, path: str):
+		self.path = path
+		self._local = threading.local()
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		with self._connect() as conn:
+			conn.execute("CREATE TABLE IF NOT EXISTS admission_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+			conn.execute("CREATE TABLE IF NOT EXISTS admission_leases (id TEXT PRIMARY KEY, key TEXT NOT NULL, expires REAL NOT NULL)")
+			conn.execute("CREATE INDEX IF NOT EXISTS ix_admission_leases_key ON admission_leases (key)")
+
+	def _connect(self) -> sqlite3.Connection:
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+			conn.execute("PRAGMA journal_mode=WAL")
+			self._local.conn = conn
+		return conn
+
+	def _tx(self):
+		conn = self._connect()
+		conn.execute("BEGIN IMMEDIATE")
+		return conn
+
+	def take_all(self, specs: List[BucketSpec], cost: float) -> Tuple[Optional[str], float]:
+		now = time.time()
+		conn = self._tx()
+		try:
+			levels = []
+			for spec in specs:
+				row = conn.execute("SELECT tokens, updated FROM admission_buckets WHERE key = ?", (spec.key,)).fetchone()
+				tokens = spec.capacity if row is None else _refill(row[0], row[1], spec, now)
+				if tokens < min(cost, spec.capacity):
+					conn.execute("COMMIT")
+					return spec.key, _retry_after(tokens, cost, spec)
+				levels.append((spec, tokens))
+			for spec, tokens in levels:
+				conn.execute(
+					"INSERT INTO admission_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+					"ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+					(spec.key, tokens - min(cost, spec.capacity), now),
+				)
+			conn.execute("COMMIT")
+			return None, 0.0
+		except Exception:
+			conn.execute("ROLLBACK")
+			raise
+
+	def acquire(self, key: str, limit: int, lease_seconds: float) -> Optional[str]:
+		now = time.time()
+		conn = self._tx()
+		try:
+			conn.execute("DELETE FROM admission_leases WHERE key = ? AND expires < ?", (key, now))
+			(active,) = conn.execute("SELECT COUNT(*) FROM admission_leases WHERE key = ?", (key,)).fetchone()
+			lease_id = None
+			if active < limit:
+				lease_id = uuid.uuid4().hex
+				conn.execute("INSERT INTO admission_leases (id, key, expires) VALUES (?, ?, ?)", (lease_id, key, now + lease_seconds))
+			conn.execute("COMMIT")
+			return lease_id
+		except Exception:
+			conn.execute("ROLLBACK")
+			raise
+
+	def release(self, lease_id: str) -> None:
+		self._connect().execute("DELETE FROM admission_leases WHERE id = ?", (lease_id,))
+
+
+def create_backend() -> AdmissionBackend:
+	kind = os.getenv("ADMISSION_BACKEND", "memory").lower()
+	if kind == "sqlite":
+		return SQLiteBackend(os.getenv("ADMISSION_SQLITE_PATH", os.path.join(os.path.dirname(__file__), "..", "..", "data", "admission.db")))
+	if kind == "memory":
+		return MemoryBackend()
+	raise ValueError(f"Unknown ADMISSION_BACKEND: {kind}")
+
+
+def estimate_chat_tokens(body: dict) -> int:
+	"""Rough provider-token cost of a /chat body: ~4 chars per token for the user
+	text, plus fixed allowances for the system prompt/RAG context and the completion."""
+	chars = len(str(body.get("message") or ""))
+	for m in body.get("conversation_history") or []:
+		if isinstance(m, dict):
+			chars += len(str(m.get("content") or ""))
+	overhead = int(os.getenv("ADMISSION_PROMPT_OVERHEAD_TOKENS", "600"))
+	completion = int(os.getenv("ADMISSION_COMPLETION_TOKENS", os.getenv("LLM_MAX_TOKENS", "500")))
+	# Evaluation adds a judge call of roughly the same size again.
+	factor = 2 if body.get("evaluate") else 1
+	return (chars // 4 + overhead + completion) * factor
+
+
+class AdmissionController:
+	def __init__(self, backend: Optional[AdmissionBackend] = None):
+		self.enabled = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+		self.backend = backend or create_backend()
+		self.global_tpm = float(os.getenv("PROVIDER_TPM_LIMIT", "90000"))
+		self.lease_seconds = float(os.getenv("ADMISSION_LEASE_SECONDS", "120"))
+
+	@staticmethod
+	def _role_setting(prefix: str, role: str, default: str) -> float:
+		return float(os.getenv(f"{prefix}_{role.upper()}", os.getenv(prefix, default)))
+
+	def user_bucket(self, username: str, role: str) -> BucketSpec:
+		tpm = self._role_setting("ADMISSION_USER_TPM", role, "60000" if role == "admin" else "20000")
+		return BucketSpec(f"user:{username}", capacity=tpm, per_minute=tpm)
+
+	def global_bucket(self) -> BucketSpec:
+		return BucketSpec("global", capacity=self.global_tpm, per_minute=self.global_tpm)
+
+	def max_concurrent(self, role: str) -> int:
+		return int(self._role_setting("ADMISSION_MAX_CONCURRENT", role, "4" if role == "admin" else "2"))
+
+	def admit(self, username: str, role: str, cost: int) -> Tuple[Optional[str], Optional[str], float]:
+		"""Returns (lease_id, rejected_scope, retry_after). Exactly one of lease_id/rejected_scope is set."""
+		lease = self.backend.acquire(f"user:{username}", self.max_concurrent(role), self.lease_seconds)
+		if lease is None:
+			return None, "concurrency", 1.0
+		rejected, retry_after = self.backend.take_all([self.user_bucket(username, role), self.global_bucket()], cost)
+		if rejected is not None:
+			self.backend.release(lease)
+			return None, "global" if rejected == "global" else "user", retry_after
+		ADMITTED_TOKENS.inc(role, amount=cost)
+		return lease, None, 0.0
+
+
+def _claims(scope) -> Optional[dict]:
+	auth = next((v.decode("latin-1") for k, v in scope.get("headers", []) if k == b"authorization"), "")
+	if not auth.lower().startswith("bearer "):
+		return None
+	try:
+		return jwt.decode(auth[7:], SECRET_KEY, algorithms=[ALGORITHM])
+	except JWTError:
+		return None
+
+
+class AdmissionMiddleware:
+	"""Pure ASGI middleware applying ``AdmissionController`` to ``POST /chat``.
+
+	Requests without a valid token pass through untouched; the route answers
+	those with 401.
+	"""
+
+	def __init__(self, app, controller: Optional[AdmissionController] = None, paths: Tuple[str, ...] = ("/chat",)):
+		self.app = app
+		self.controller = controller or AdmissionController()
+		self.paths = paths
+
+	async def __call__(self, scope, receive, send):
+		if not (self.controller.enabled and scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths):
+			return await self.app(scope, receive, send)
+		claims = _claims(scope)
+		if not claims or not claims.get("sub"):
+			return await self.app(scope, receive, send)
+
+		# Buffer the body to size the request, then replay it to the app.
+		chunks = []
+		while True:
+			message = await receive()
+			if message["type"] != "http.request":
+				return
+			chunks.append(message.get("body", b""))
+			if not message.get("more_body"):
+				break
+		body = b"".join(chunks)
+		try:
+			payload = json.loads(body or b"{}")
+		except ValueError:
+			payload = {}
+		cost = estimate_chat_tokens(payload if isinstance(payload, dict) else {})
+
+		lease, rejected, retry_after = await self._call(self.controller.admit, claims["sub"], claims.get("role") or "employee", cost)
+		if rejected is not None:
+			ADMISSION_REJECTED.inc(rejected)
+			return await self._reject(send, rejected, retry_after)
+
+		replayed = False
+
+		async def replay():
+			nonlocal replayed
+			if not replayed:
+				replayed = True
+				return {"type": "http.request", "body": body, "more_body": False}
+			return await receive()
+
+		try:
+			await self.app(scope, replay, send)
+		finally:
+			await self._call(self.controller.backend.release, lease)
+
+	async def _call(self, fn, *args):
+		if self.controller.backend.blocking:
+			return await asyncio.to_thread(fn, *args)
+		return fn(*args)
+
+	@staticmethod
+	async def _reject(send, scope_name: str, retry_after: float):
+		detail = {
+			"concurrency": "Too many concurrent requests for this user",
+			"user": "Per-user token budget exceeded",
+			"global": "Service is at its provider token budget",
+		}[scope_name]
+		body = json.dumps({"detail": detail, "scope": scope_name}).encode()
+		retry = "3600" if retry_after == float("inf") else str(max(1, int(retry_after + 0.999)))
+		await send({
+			"type": "http.response.start",
+			"status": 429,
+			"headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"retry-after", retry.encode())],
+		})
+		await send({"type": "http.response.body", "body": body})
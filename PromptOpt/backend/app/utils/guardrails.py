@@ -1,5 +1,6 @@
 import re
 from typing import Tuple
+from app.utils.tracing import span
 
 PII_PATTERNS = [
 	re.compile(r"\b\d{3}[- ]?\d{2}[- ]?\d{4}\b"),  # US SSN-like
@@ -45,6 +46,7 @@ def detect_sensitive_topics(text: str) -> bool:
 	return any(p.search(text) for p in SENSITIVE_TOPICS)
 
 
+@span("guardrails")
 def analyze_guardrails(user_message: str, assistant_response: str) -> dict:
 	pii_found_user, redacted_user = detect_pii(user_message)
 	pii_found_assistant, redacted_assistant = detect_pii(assistant_response)
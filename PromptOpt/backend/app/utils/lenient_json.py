@@ -0,0 +1,221 @@
+"""Tolerant JSON parsing for LLM output.
+
+``parse_lenient`` reads the first JSON value in a string in a single pass and
+repairs the mistakes judges commonly make instead of giving up:
+
+- prose or Markdown code fences around the JSON
+- single-quoted strings and unquoted keys
+- trailing commas, missing commas between members, ``//`` and ``#`` comments
+- Python literals (``True``/``False``/``None``) and ``NaN``/``±Infinity`` (read as null)
+- truncated output (a ``max_tokens`` cut-off): open strings, arrays and objects are closed
+
+It returns ``(value, repaired)``; ``repaired`` is True when anything beyond
+strict JSON was needed. ``ValueError`` is raised when no value can be read.
+"""
+import json
+from typing import Any, Tuple
+
+_LITERALS = {
+	"true": True, "false": False, "null": None,
+	"True": True, "False": False, "None": None,
+	"NaN": None, "Infinity": None, "undefined": None,
+}
+_NUMBER_CHARS = set("0123456789+-.eE")
+_WORD_STOP = set(" \t\r\n,:]}")
+_MAX_STARTS = 16
+
+
+class _Parser:
+	def __init__(self, text: str):
+		self.s = text
+		self.i = 0
+		self.repaired = False
+
+	def _skip(self) -> None:
+		s, n = self.s, len(self.s)
+		while self.i < n:
+			c = s[self.i]
+			if c in " \t\r\n":
+				self.i += 1
+			elif c == "/" and s.startswith("//", self.i) or c == "#":
+				end = s.find("\n", self.i)
+				self.i = n if end == -1 else end + 1
+				self.repaired = True
+			elif s.startswith("/*", self.i):
+				end = s.find("*/", self.i + 2)
+				self.i = n if end == -1 else end + 2
+				self.repaired = True
+			else:
+				return
+
+	def _peek(self) -> str:
+		self._skip()
+		return self.s[self.i] if self.i < len(self.s) else ""
+
+	def value(self) -> Any:
+		c = self._peek()
+		if c == "{":
+			return self._object()
+		if c == "[":
+			return self._array()
+		if c in "\"'":
+			return self._string()
+		if c and (c.isdigit() or c in "+-."):
+			return self._number()
+		if c:
+			word = self._word()
+			if word in _LITERALS:
+				if word not in ("true", "false", "null"):
+					self.repaired = True
+				return _LITERALS[word]
+			raise ValueError(f"unexpected {word!r} at {self.i}")
+		raise ValueError("unexpected end of input")
+
+	def _object(self) -> dict:
+		self.i += 1
+		out = {}
+		while True:
+			c = self._peek()
+			if c == "}":
+				self.i += 1
+				return out
+			if not c:
+				self.repaired = True  # truncated
+				return out
+			if c == ",":
+				self.i += 1
+				self.repaired = True  # leading / doubled comma
+				continue
+			if c in "\"'":
+				key = self._string()
+			else:
+				key = self._word()
+				if not key:
+					raise ValueError(f"expected a key at {self.i}")
+				self.repaired = True  # unquoted key
+			if self._peek() == ":":
+				self.i += 1
+			else:
+				self.repaired = True
+			if not self._peek() or self._peek() in ",}":
+				self.repaired = True  # key without a value (truncated or elided)
+				out[key] = None
+			else:
+				out[key] = self.value()
+			c = self._peek()
+			if c == ",":
+				self.i += 1
+				if self._peek() == "}":
+					self.repaired = True  # trailing comma
+			elif c != "}":
+				self.repaired = True  # missing comma (or truncated)
+
+	def _array(self) -> list:
+		self.i += 1
+		out = []
+		while True:
+			c = self._peek()
+			if c == "]":
+				self.i += 1
+				return out
+			if not c:
+				self.repaired = True
+				return out
+			if c == ",":
+				self.i += 1
+				self.repaired = True
+				continue
+			out.append(self.value())
+			c = self._peek()
+			if c == ",":
+				self.i += 1
+				if self._peek() == "]":
+					self.repaired = True
+			elif c != "]":
+				self.repaired = True
+
+	def _string(self) -> str:
+		quote = self.s[self.i]
+		if quote == "'":
+			self.repaired = True
+		self.i += 1
+		s, n = self.s, len(self.s)
+		chunks = []
+		while self.i < n:
+			c = s[self.i]
+			if c == quote:
+				self.i += 1
+				return "".join(chunks)
+			if c == "\\" and self.i + 1 < n:
+				esc = s[self.i:self.i + 2]
+				if esc[1] == "u" and self.i + 6 <= n:
+					esc = s[self.i:self.i + 6]
+				try:
+					chunks.append(json.loads(f'"{esc}"'))
+				except ValueError:
+					chunks.append(esc[1])
+					self.repaired = True
+				self.i += len(esc)
+				continue
+			chunks.append(c)
+			self.i += 1
+		self.repaired = True  # unterminated string
+		return "".join(chunks)
+
+	def _number(self) -> Any:
+		start = self.i
+		s, n = self.s, len(self.s)
+		while self.i < n and s[self.i] in _NUMBER_CHARS:
+			self.i += 1
+		raw = s[start:self.i]
+		if raw in ("+", "-") and s.startswith("Infinity", self.i):
+			self.i += len("Infinity")
+			self.repaired = True
+			return None
+		try:
+			value = float(raw)
+		except ValueError:
+			raise ValueError(f"bad number {raw!r} at {start}")
+		if raw.startswith(("+", ".")) or raw.endswith("."):
+			self.repaired = True
+		return int(raw) if raw.lstrip("+-").isdigit() else value
+
+	def _word(self) -> str:
+		start = self.i
+		s, n = self.s, len(self.s)
+		while self.i < n and s[self.i] not in _WORD_STOP:
+			self.i += 1
+		return s[start:self.i]
+
+
+def parse_lenient(text: str, types: Tuple[type, ...] = (dict, list)) -> Tuple[Any, bool]:
+	"""First JSON value of one of ``types`` in ``text``, repaired if necessary."""
+	text = text or ""
+	nonfinite = []
+
+	def constant(name: str) -> None:
+		# json.loads accepts NaN/Infinity as floats; read them as null like the repair pass does.
+		nonfinite.append(name)
+		return None
+
+	try:
+		value = json.loads(text, parse_constant=constant)
+		if isinstance(value, types):
+			return value, bool(nonfinite)
+	except ValueError:
+		pass
+	# Text around the value (prose, code fences) is expected, not a repair. Brackets in
+	# leading prose ("scores [0-5]: {...}") may not parse or have the wrong type; then try the next one.
+	starts = [i for i, c in enumerate(text) if c in "{["][:_MAX_STARTS]
+	error = ValueError("no JSON object or array found")
+	for start in starts:
+		parser = _Parser(text)
+		parser.i = start
+		try:
+			value = parser.value()
+		except ValueError as e:
+			error = e
+			continue
+		if isinstance(value, types):
+			return value, parser.repaired
+	raise error
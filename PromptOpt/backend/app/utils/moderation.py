@@ -1,22 +1,24 @@
 import os
-from typing import Literal, Tuple
-import openai
+from typing import Literal, Optional, Tuple
+from app.services.resilience import ResilientClient, upstream_breaker
+from app.providers import get_provider
+from app.providers.base import Provider
 
 ModerationAction = Literal['allow', 'block', 'redact']
 
 class ModerationService:
-	def __init__(self):
+	def __init__(self, provider: Optional[Provider] = None):
 		self.enabled = os.getenv('ENABLE_MODERATION', 'false').lower() == 'true'
 		self.mode: ModerationAction = os.getenv('MODERATION_MODE', 'block')  # block|redact
-		self.client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY', 'your-api-key-here'))
+		self.provider = provider or get_provider()
 		self.model = os.getenv('MODERATION_MODEL', 'omni-moderation-latest')
+		self.resilient = ResilientClient('moderation', upstream_breaker, deadline=float(os.getenv('MODERATION_TIMEOUT_SECONDS', '5')))
 
-	def check(self, text: str) -> Tuple[ModerationAction, str | None]:
+	async def check(self, text: str) -> Tuple[ModerationAction, str | None]:
 		if not self.enabled:
 			return 'allow', None
 		try:
-			res = self.client.moderations.create(model=self.model, input=text)
-			flagged = bool(res.results[0].flagged)
+			flagged = await self.resilient.call(lambda timeout: self.provider.moderate(text, model=self.model, timeout=timeout))
 			if flagged:
 				if self.mode == 'redact':
 					return 'redact', '[REDACTED FOR SAFETY]'
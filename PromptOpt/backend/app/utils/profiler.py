@@ -0,0 +1,89 @@
+"""Runtime-toggleable sampling profiler.
+
+A daemon thread snapshots every thread's Python stack via ``sys._current_frames``
+at a fixed interval and aggregates them as collapsed stacks
+(``frame;frame;frame count``), the input format of flamegraph.pl and speedscope.
+Nothing runs while it is stopped, so it can stay wired in production.
+"""
+import sys
+import time
+import threading
+from collections import Counter
+from typing import Optional
+
+
+class SamplingProfiler:
+	def __init__(self, max_depth: int = 64):
+		self.max_depth = max_depth
+		self.interval = 0.01
+		self._stacks: Counter = Counter()
+		self._samples = 0
+		self._started_at: Optional[float] = None
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self._lock = threading.Lock()
+
+	@property
+	def running(self) -> bool:
+		return self._thread is not None and self._thread.is_alive()
+
+	def start(self, interval: float = 0.01) -> bool:
+		"""Start sampling; returns False if it was already running."""
+		with self._lock:
+			if self.running:
+				return False
+			self.interval = max(0.001, interval)
+			self._stacks = Counter()
+			self._samples = 0
+			self._started_at = time.time()
+			self._stop.clear()
+			self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+			self._thread.start()
+			return True
+
+	def stop(self) -> str:
+		"""Stop sampling and return the collapsed stacks collected since ``start``."""
+		with self._lock:
+			thread = self._thread
+			self._stop.set()
+		if thread is not None:
+			thread.join(timeout=2 * self.interval + 1)
+		with self._lock:
+			self._thread = None
+		return self.collapsed()
+
+	def _run(self) -> None:
+		own = threading.get_ident()
+		while not self._stop.wait(self.interval):
+			frames = sys._current_frames()
+			batch = []
+			for ident, frame in frames.items():
+				if ident == own:
+					continue
+				stack = []
+				while frame is not None and len(stack) < self.max_depth:
+					code = frame.f_code
+					stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+					frame = frame.f_back
+				batch.append(";".join(reversed(stack)))
+			with self._lock:
+				self._stacks.update(batch)
+				self._samples += 1
+
+	def collapsed(self, limit: Optional[int] = None) -> str:
+		with self._lock:
+			items = self._stacks.most_common(limit)
+		return "\n".join(f"{stack} {count}" for stack, count in items) + ("\n" if items else "")
+
+	def status(self) -> dict:
+		with self._lock:
+			return {
+				"running": self.running,
+				"interval_seconds": self.interval,
+				"samples": self._samples,
+				"distinct_stacks": len(self._stacks),
+				"started_at": self._started_at,
+			}
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,72 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+
+class TokenBucket:
+	"""Classic token bucket: ``capacity`` burst, refilled at ``rate`` tokens per second."""
+
+	__slots__ = ("capacity", "rate", "tokens", "updated")
+
+	def __init__(self, capacity: float, rate: float, now: float):
+		self.capacity = capacity
+		self.rate = rate
+		self.tokens = capacity
+		self.updated = now
+
+	def take(self, now: float, cost: float = 1.0) -> Tuple[bool, float]:
+		"""Consume ``cost`` tokens if available; otherwise return the seconds until they are."""
+		self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+		if self.tokens >= cost:
+			self.tokens -= cost
+			return True, 0.0
+		return False, (cost - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class RateLimiter:
+	"""Per-key token buckets with LRU-bounded memory.
+
+	Evicting an idle key is safe: a fresh bucket starts full, which is exactly the
+	state an idle bucket would have refilled to. Evicting a busy key can at most
+	grant that key one extra burst.
+	"""
+
+	def __init__(self, capacity: float, per_minute: float, max_keys: int = 100_000):
+		self.capacity = capacity
+		self.rate = per_minute / 60.0
+		self.max_keys = max_keys
+		self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+		self._lock = threading.Lock()
+
+	def hit(self, key: Hashable, cost: float = 1.0, now: Optional[float] = None) -> Tuple[bool, float]:
+		"""Returns (allowed, retry_after_seconds)."""
+		now = time.monotonic() if now is None else now
+		with self._lock:
+			bucket = self._buckets.get(key)
+			if bucket is None:
+				bucket = self._buckets[key] = TokenBucket(self.capacity, self.rate, now)
+				if len(self._buckets) > self.max_keys:
+					self._buckets.popitem(last=False)
+			else:
+				self._buckets.move_to_end(key)
+			return bucket.take(now, cost)
+
+	def reset(self, key: Hashable) -> None:
+		with self._lock:
+			self._buckets.pop(key, None)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._buckets.clear()
+
+
+def client_ip(request) -> str:
+	"""Client address for rate limiting; ``X-Forwarded-For`` is only honoured behind a trusted proxy."""
+	if os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true":
+		forwarded = request.headers.get("x-forwarded-for")
+		if forwarded:
+			return forwarded.split(",")[0].strip()
+	return request.client.host if request.client else "unknown"
@@ -0,0 +1,119 @@
+"""Per-process request coalescing ("single flight").
+
+Concurrent callers with the same key share one execution of the underlying
+call: the first becomes the leader, later ones wait for its result instead of
+issuing their own upstream request. Waiting is bounded; a follower that waits
+longer than ``max_wait`` (or whose leader was cancelled) runs the call itself.
+Results are only shared while the call is in flight; nothing is cached after.
+
+A ``concurrent.futures.Future`` is the shared handle, so async callers (``do``)
+and threads (``do_sync``) coalesce with each other.
+"""
+import os
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from app.utils.tracing import registry
+
+SINGLEFLIGHT_CALLS = registry.counter("promptopt_singleflight_calls_total", "Coalescable calls by outcome (leader, coalesced, wait_timeout, leader_aborted).", ("flight", "outcome"))
+
+
+class LeaderAborted(Exception):
+	"""The leader went away (e.g. cancelled) without producing a result."""
+
+
+class SingleFlight:
+	def __init__(self, name: str, max_wait: Optional[float] = None, enabled: Optional[bool] = None):
+		self.name = name
+		self.max_wait = max_wait if max_wait is not None else float(os.getenv("SINGLEFLIGHT_MAX_WAIT_SECONDS", "30"))
+		self.enabled = enabled if enabled is not None else os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+		self._lock = threading.Lock()
+		self._calls: Dict[Hashable, Future] = {}
+		self._stats = {"leader": 0, "coalesced": 0, "wait_timeout": 0, "leader_aborted": 0}
+
+	def _bump(self, outcome: str) -> None:
+		with self._lock:
+			self._stats[outcome] += 1
+		SINGLEFLIGHT_CALLS.inc(self.name, outcome)
+
+	def stats(self) -> dict:
+		with self._lock:
+			out = dict(self._stats)
+			out["in_flight"] = len(self._calls)
+		# Every coalesced follower is one upstream call that did not happen.
+		out["calls_saved"] = out["coalesced"]
+		return out
+
+	def _join(self, key: Hashable) -> Tuple[Future, bool]:
+		"""(future, is_leader) for ``key``."""
+		with self._lock:
+			fut = self._calls.get(key)
+			if fut is not None:
+				return fut, False
+			fut = self._calls[key] = Future()
+			return fut, True
+
+	def _finish(self, key: Hashable, fut: Future) -> None:
+		with self._lock:
+			if self._calls.get(key) is fut:
+				del self._calls[key]
+		if not fut.done():
+			fut.set_exception(LeaderAborted(f"{self.name}: leader aborted"))
+
+	async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+		"""Run ``fn()`` once per key across concurrent callers. Returns (result, shared)."""
+		if not self.enabled:
+			return await fn(), False
+		fut, leader = self._join(key)
+		if not leader:
+			try:
+				result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(fut)), self.max_wait)
+				self._bump("coalesced")
+				return result, True
+			except asyncio.TimeoutError:
+				self._bump("wait_timeout")
+			except LeaderAborted:
+				self._bump("leader_aborted")
+			return await fn(), False
+
+		self._bump("leader")
+		try:
+			result = await fn()
+			fut.set_result(result)
+			return result, False
+		except Exception as exc:
+			fut.set_exception(exc)
+			# Mark the exception retrieved so an unwatched future doesn't log it.
+			fut.exception()
+			raise
+		finally:
+			self._finish(key, fut)
+
+	def do_sync(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+		"""Blocking variant of ``do`` for code running in threads."""
+		if not self.enabled:
+			return fn(), False
+		fut, leader = self._join(key)
+		if not leader:
+			try:
+				result = fut.result(timeout=self.max_wait)
+				self._bump("coalesced")
+				return result, True
+			except FutureTimeout:
+				self._bump("wait_timeout")
+			except LeaderAborted:
+				self._bump("leader_aborted")
+			return fn(), False
+
+		self._bump("leader")
+		try:
+			result = fn()
+			fut.set_result(result)
+			return result, False
+		except Exception as exc:
+			fut.set_exception(exc)
+			fut.exception()
+			raise
+		finally:
+			self._finish(key, fut)
@@ -0,0 +1,254 @@
+"""Lightweight request tracing and Prometheus metrics.
+
+``span("stage")`` times a pipeline stage, as a context manager or as a decorator
+on sync and async functions. Every span feeds the ``promptopt_stage_duration_seconds``
+histogram; while a request trace is active (``TracingMiddleware``) it is also
+recorded on the trace, which is returned as ``Server-Timing`` and, for slow
+requests, logged with its trace ID. Metrics are rendered in the Prometheus text
+exposition format by ``registry.render()`` without a client library dependency.
+"""
+import os
+import re
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import functools
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "2000"))
+TRACE_HEADER = "x-trace-id"
+_TRACE_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+	return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+	parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+	if extra:
+		parts.append(extra)
+	return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+	def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+		self.name = name
+		self.help = help
+		self.labelnames = tuple(labelnames)
+		self._values: Dict[Tuple[str, ...], float] = {}
+		self._lock = threading.Lock()
+
+	def inc(self, *labels: str, amount: float = 1.0) -> None:
+		with self._lock:
+			self._values[labels] = self._values.get(labels, 0.0) + amount
+
+	def value(self, *labels: str) -> float:
+		with self._lock:
+			return self._values.get(labels, 0.0)
+
+	def render(self) -> List[str]:
+		lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+		with self._lock:
+			items = sorted(self._values.items())
+		for labels, v in items:
+			lines.append(f"{self.name}{_labels(self.labelnames, labels)} {v}")
+		return lines
+
+
+class Histogram:
+	"""Fixed-bucket histogram; ``observe`` is a bisect plus a few additions under a lock."""
+
+	def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+		self.name = name
+		self.help = help
+		self.labelnames = tuple(labelnames)
+		self.buckets = tuple(sorted(buckets))
+		# labels -> [per-bucket counts (+Inf last), sum, count]
+		self._series: Dict[Tuple[str, ...], list] = {}
+		self._lock = threading.Lock()
+
+	def observe(self, value: float, *labels: str) -> None:
+		i = bisect_left(self.buckets, value)
+		with self._lock:
+			s = self._series.get(labels)
+			if s is None:
+				s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+			s[0][i] += 1
+			s[1] += value
+			s[2] += 1
+
+	def snapshot(self, *labels: str) -> Tuple[int, float]:
+		"""(count, sum) for one label set."""
+		with self._lock:
+			s = self._series.get(labels)
+			return (s[2], s[1]) if s else (0, 0.0)
+
+	def render(self) -> List[str]:
+		lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+		with self._lock:
+			items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+		for labels, (counts, total, count) in items:
+			cumulative = 0
+			for bound, c in zip(self.buckets, counts):
+				cumulative += c
+				le = 'le="%s"' % bound
+				lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+			inf = 'le="+Inf"'
+			lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, inf)} {count}")
+			lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+			lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+		return lines
+
+
+class MetricsRegistry:
+	def __init__(self):
+		self._metrics: Dict[str, object] = {}
+		self._lock = threading.Lock()
+
+	def _register(self, metric):
+		with self._lock:
+			return self._metrics.setdefault(metric.name, metric)
+
+	def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+		return self._register(Counter(name, help, labelnames))
+
+	def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+		return self._register(Histogram(name, help, labelnames, buckets))
+
+	def render(self) -> str:
+		with self._lock:
+			metrics = list(self._metrics.values())
+		lines: List[str] = []
+		for m in metrics:
+			lines.extend(m.render())
+		return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+STAGE_SECONDS = registry.histogram("promptopt_stage_duration_seconds", "Time spent in each request pipeline stage.", ("stage",))
+STAGE_ERRORS = registry.counter("promptopt_stage_errors_total", "Pipeline stages that raised.", ("stage",))
+REQUEST_SECONDS = registry.histogram("promptopt_http_request_duration_seconds", "HTTP request latency.", ("method", "route", "status"))
+REQUESTS_TOTAL = registry.counter("promptopt_http_requests_total", "HTTP requests served.", ("method", "route", "status"))
+
+
+class Trace:
+	"""Spans recorded for one request: (stage, start offset seconds, duration seconds)."""
+
+	__slots__ = ("trace_id", "start", "spans")
+
+	def __init__(self, trace_id: str):
+		self.trace_id = trace_id
+		self.start = time.perf_counter()
+		self.spans: List[Tuple[str, float, float]] = []
+
+	def stage_totals(self) -> Dict[str, float]:
+		totals: Dict[str, float] = {}
+		for name, _, dur in self.spans:
+			totals[name] = totals.get(name, 0.0) + dur
+		return totals
+
+
+# Copied into worker threads by asyncio.to_thread, so upstream spans land on the request's trace.
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("promptopt_trace", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+	trace = _current_trace.get()
+	return trace.trace_id if trace else None
+
+
+class span:
+	"""Time a stage: ``with span("moderation"):`` or ``@span("guardrails")``."""
+
+	__slots__ = ("name", "_start")
+
+	def __init__(self, name: str):
+		self.name = name
+		self._start = 0.0
+
+	def __enter__(self) -> "span":
+		self._start = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc, tb) -> None:
+		if not TRACING_ENABLED:
+			return
+		end = time.perf_counter()
+		STAGE_SECONDS.observe(end - self._start, self.name)
+		if exc_type is not None:
+			STAGE_ERRORS.inc(self.name)
+		trace = _current_trace.get()
+		if trace is not None:
+			trace.spans.append((self.name, self._start - trace.start, end - self._start))
+
+	def __call__(self, fn):
+		name = self.name
+		if asyncio.iscoroutinefunction(fn):
+			@functools.wraps(fn)
+			async def async_wrapper(*args, **kwargs):
+				with span(name):
+					return await fn(*args, **kwargs)
+			return async_wrapper
+
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			with span(name):
+				return fn(*args, **kwargs)
+		return wrapper
+
+
+class TracingMiddleware:
+	"""Pure ASGI middleware: trace ID propagation, request metrics and ``Server-Timing``.
+
+	An incoming ``X-Trace-Id`` is reused when well-formed, otherwise a new one is
+	generated; either way it is echoed on the response.
+	"""
+
+	def __init__(self, app):
+		self.app = app
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			return await self.app(scope, receive, send)
+
+		incoming = next((v.decode("latin-1") for k, v in scope.get("headers", []) if k == b"x-trace-id"), None)
+		trace = Trace(incoming if incoming and _TRACE_ID_RE.match(incoming) else uuid.uuid4().hex)
+		token = _current_trace.set(trace)
+		status_code = 500
+
+		async def send_with_trace(message):
+			nonlocal status_code
+			if message["type"] == "http.response.start":
+				status_code = message["status"]
+				headers = list(message.get("headers", []))
+				headers.append((TRACE_HEADER.encode(), trace.trace_id.encode()))
+				timing = ", ".join(f"{name};dur={dur * 1000:.1f}" for name, dur in trace.stage_totals().items())
+				if timing:
+					headers.append((b"server-timing", timing.encode()))
+				message = {**message, "headers": headers}
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_with_trace)
+		finally:
+			_current_trace.reset(token)
+			elapsed = time.perf_counter() - trace.start
+			route = scope.get("route")
+			# Route templates, not raw paths, keep label cardinality bounded.
+			path = getattr(route, "path", None) or "unmatched"
+			labels = (scope.get("method", ""), path, str(status_code))
+			REQUEST_SECONDS.observe(elapsed, *labels)
+			REQUESTS_TOTAL.inc(*labels)
+			if elapsed * 1000 >= TRACE_SLOW_MS:
+				breakdown = " ".join(f"{n}={d * 1000:.1f}ms" for n, d in trace.stage_totals().items())
+				logger.info("slow request trace_id=%s %s %s %.1fms %s", trace.trace_id, labels[0], path, elapsed * 1000, breakdown)
@@ -0,0 +1,337 @@
+"""End-to-end load test and latency benchmark for the FastAPI app.
+
+Boots ``app.main:app`` in-process against a freshly migrated + seeded SQLite
+database and the deterministic stub provider, drives the main endpoints with
+configurable concurrency, reports p50/p95/p99 latency and throughput, and
+compares against a stored baseline:
+
+    python -m benchmarks.loadtest --requests 200 --concurrency 16
+    python -m benchmarks.loadtest --update-baseline        # record a new baseline
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --scenarios prompts,chat
+
+Exits with status 1 when any scenario regresses beyond ``--tolerance``.
+"""
+import os
+import sys
+import math
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Run order matters: RAG scenarios run after the synthetic corpus is ingested.
+SCENARIOS = ("login", "prompts", "chat", "chat_eval", "logs", "chat_login_storm", "chat_rag", "chat_rag_eval")
+RAG_SCENARIOS = ("chat_rag", "chat_rag_eval")
+
+QUESTIONS = [
+	"How many vacation days do new employees get",
+	"What is the parental leave policy",
+	"How do I submit an expense report",
+	"When is open enrollment for health benefits",
+	"Can I work remotely two days a week",
+	"Who approves overtime requests",
+	"How does the 401k match work",
+	"What holidays does the company observe",
+]
+
+HANDBOOK = """
+Paid time off. Full-time employees accrue fifteen vacation days per year, rising to twenty days after three years
+of service. Unused vacation up to five days carries over into the next calendar year. Requests go through the HR
+portal and need manager approval at least two weeks in advance.
+Parental leave. Birth and adoptive parents receive sixteen weeks of fully paid parental leave, which can be taken
+within the first year. Notify HR thirty days before the expected start date where possible.
+Expenses. Submit expense reports in the finance portal within thirty days with itemised receipts. Managers approve
+reports weekly and reimbursement is paid with the next payroll run.
+Benefits. Open enrollment for medical, dental and vision coverage runs every November. The company matches 401k
+contributions dollar for dollar up to four percent of salary, vesting immediately.
+Remote work. Employees may work remotely up to two days per week with manager agreement; core hours are ten to
+three in the local office time zone. Overtime for non-exempt staff must be approved in advance by the manager.
+Holidays. The company observes eleven paid holidays including New Year's Day, Memorial Day, Independence Day,
+Labor Day, Thanksgiving and the day after, and Christmas Day.
+"""
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+	"""Nearest-rank percentile of an already sorted list."""
+	if not sorted_values:
+		return 0.0
+	rank = max(1, math.ceil(q * len(sorted_values)))
+	return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+@dataclass
+class ScenarioResult:
+	name: str
+	latencies_ms: List[float] = field(default_factory=list)
+	errors: int = 0
+	wall_s: float = 0.0
+
+	def summary(self) -> dict:
+		lat = sorted(self.latencies_ms)
+		n = len(lat) + self.errors
+		return {
+			"requests": n,
+			"errors": self.errors,
+			"p50_ms": round(percentile(lat, 0.50), 2),
+			"p95_ms": round(percentile(lat, 0.95), 2),
+			"p99_ms": round(percentile(lat, 0.99), 2),
+			"mean_ms": round(sum(lat) / len(lat), 2) if lat else 0.0,
+			"throughput_rps": round(n / self.wall_s, 2) if self.wall_s else 0.0,
+		}
+
+
+class Context:
+	"""Auth headers for the seeded benchmark users."""
+
+	def __init__(self, admin_token: str, employee_token: str):
+		self.admin = {"Authorization": f"Bearer {admin_token}"}
+		self.employee = {"Authorization": f"Bearer {employee_token}"}
+
+
+def _question(i: int, unique: bool) -> str:
+	q = QUESTIONS[i % len(QUESTIONS)]
+	# Unique suffixes defeat the response cache so the full pipeline is measured.
+	return f"{q}? (request {i})" if unique else f"{q}?"
+
+
+def build_requests(args) -> Dict[str, Callable[..., Awaitable]]:
+	unique = not args.allow_cache_hits
+
+	async def login(client, i, ctx):
+		return await client.post("/login", data={"username": "employee", "password": "employee"})
+
+	async def prompts(client, i, ctx):
+		return await client.get("/prompts")
+
+	async def chat(client, i, ctx, evaluate=False):
+		return await client.post("/chat", headers=ctx.employee, json={"message": _question(i, unique), "evaluate": evaluate})
+
+	async def chat_eval(client, i, ctx):
+		return await chat(client, i, ctx, evaluate=True)
+
+	async def logs(client, i, ctx):
+		return await client.get("/chat/logs", headers=ctx.admin)
+
+	return {
+		"login": login,
+		"prompts": prompts,
+		"chat": chat,
+		"chat_eval": chat_eval,
+		"logs": logs,
+		"chat_login_storm": chat,
+		"chat_rag": chat,
+		"chat_rag_eval": chat_eval,
+	}
+
+
+async def run_scenario(client, name: str, fn, ctx: Context, requests: int, concurrency: int) -> ScenarioResult:
+	result = ScenarioResult(name)
+	counter = iter(range(requests))
+
+	async def worker():
+		for i in counter:
+			start = time.perf_counter()
+			try:
+				resp = await fn(client, i, ctx)
+				ok = resp.status_code < 400
+			except Exception:
+				ok = False
+			if ok:
+				result.latencies_ms.append((time.perf_counter() - start) * 1000)
+			else:
+				result.errors += 1
+
+	start = time.perf_counter()
+	await asyncio.gather(*(worker() for _ in range(concurrency)))
+	result.wall_s = time.perf_counter() - start
+	return result
+
+
+def configure_environment(args, workdir: str) -> None:
+	"""Point the app at a scratch database/index and the stub provider before it is imported."""
+	os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+	os.environ["RAG_INDEX_DIR"] = os.path.join(workdir, "data")
+	os.environ["LLM_PROVIDER"] = "stub"
+	os.environ["ENABLE_MODERATION"] = "true"
+	os.environ["STUB_CHAT_LATENCY"] = args.chat_latency
+	os.environ["STUB_JUDGE_LATENCY"] = args.judge_latency
+	os.environ["STUB_EMBED_LATENCY"] = args.embed_latency
+	os.environ["STUB_MODERATION_LATENCY"] = args.moderation_latency
+	os.environ["STUB_SEED"] = str(args.seed)
+	# The harness logs in far more often than a real user; only limit when measuring the limiter itself.
+	os.environ["LOGIN_RATE_LIMIT_ENABLED"] = "true" if args.login_rate_limit else "false"
+	os.environ["ADMISSION_ENABLED"] = "true" if args.admission else "false"
+
+
+def boot_app():
+	"""Migrate + seed the scratch database and import the app."""
+	from alembic import command
+	from alembic.config import Config
+
+	cfg = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+	cfg.set_main_option("script_location", os.path.join(BACKEND_DIR, "app", "migrations"))
+	cfg.set_main_option("sqlalchemy.url", os.environ["DATABASE_URL"])
+	command.upgrade(cfg, "head")
+
+	from app.utils.seed import seed
+	seed()
+	from app.main import app
+	return app
+
+
+def ingest_corpus() -> int:
+	from app.services.container import services
+	return services.rag.ingest_text(HANDBOOK * 4, source="bench_handbook.txt", chunk_chars=400, overlap=50).indexed
+
+
+async def login_token(client, username: str, password: str) -> str:
+	resp = await client.post("/login", data={"username": username, "password": password})
+	resp.raise_for_status()
+	return resp.json()["access_token"]
+
+
+async def login_storm(client, stop: asyncio.Event, concurrency: int) -> Dict[str, int]:
+	"""Hammer /login (mostly bad passwords, like credential stuffing) until ``stop`` is set."""
+	outcomes: Dict[str, int] = {}
+
+	async def attacker(n):
+		i = 0
+		while not stop.is_set():
+			password = "employee" if i % 10 == 0 else f"guess-{n}-{i}"
+			try:
+				resp = await client.post("/login", data={"username": "employee", "password": password})
+				key = str(resp.status_code)
+			except Exception:
+				key = "error"
+			outcomes[key] = outcomes.get(key, 0) + 1
+			i += 1
+
+	await asyncio.gather(*(attacker(n) for n in range(concurrency)))
+	return outcomes
+
+
+async def run(args) -> Dict[str, dict]:
+	import httpx
+
+	if args.url:
+		client = httpx.AsyncClient(base_url=args.url, timeout=60.0)
+	else:
+		app = boot_app()
+		client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60.0)
+
+	requests = build_requests(args)
+	selected = [s for s in SCENARIOS if s in args.scenarios]
+	results: Dict[str, dict] = {}
+	async with client:
+		ctx = Context(await login_token(client, "admin", "admin"), await login_token(client, "employee", "employee"))
+		ingested = False
+		for name in selected:
+			if name in RAG_SCENARIOS and not ingested and not args.url:
+				ingest_corpus()
+				ingested = True
+			n = args.login_requests if name == "login" else args.requests
+			# Warm-up so one-off costs (imports, index load) don't land in the percentiles.
+			await run_scenario(client, name, requests[name], ctx, min(args.warmup, n), args.concurrency)
+			if name == "chat_login_storm":
+				stop = asyncio.Event()
+				storm = asyncio.ensure_future(login_storm(client, stop, args.storm_concurrency))
+				await asyncio.sleep(0.5)  # let the storm saturate the hashing pool first
+				res = await run_scenario(client, name, requests[name], ctx, n, args.concurrency)
+				stop.set()
+				outcomes = await storm
+				print(f"{'':<17} login storm: " + ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items())), flush=True)
+			else:
+				res = await run_scenario(client, name, requests[name], ctx, n, args.concurrency)
+			results[name] = res.summary()
+			print(format_row(name, results[name]), flush=True)
+	return results
+
+
+def format_row(name: str, s: dict) -> str:
+	return (f"{name:<17} n={s['requests']:<5} err={s['errors']:<3} p50={s['p50_ms']:>8.1f}ms "
+		f"p95={s['p95_ms']:>8.1f}ms p99={s['p99_ms']:>8.1f}ms rps={s['throughput_rps']:>8.1f}")
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+	"""Regressions: p95/p99 slower or throughput lower than baseline by more than ``tolerance``."""
+	regressions = []
+	for name, cur in results.items():
+		base = baseline.get(name)
+		if not base:
+			continue
+		for key in ("p95_ms", "p99_ms"):
+			if base.get(key) and cur[key] > base[key] * (1 + tolerance):
+				regressions.append(f"{name}: {key} {cur[key]:.1f} > baseline {base[key]:.1f} (+{tolerance:.0%})")
+		if base.get("throughput_rps") and cur["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+			regressions.append(f"{name}: throughput {cur['throughput_rps']:.1f} < baseline {base['throughput_rps']:.1f} (-{tolerance:.0%})")
+		if cur["errors"] > base.get("errors", 0):
+			regressions.append(f"{name}: {cur['errors']} errors (baseline {base.get('errors', 0)})")
+	return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None):
+	p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	p.add_argument("--url", help="Benchmark a running server instead of booting the app in-process")
+	p.add_argument("--scenarios", default=",".join(SCENARIOS), type=lambda v: [s.strip() for s in v.split(",") if s.strip()])
+	p.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+	p.add_argument("--login-requests", type=int, default=40, help="Requests for the (bcrypt-bound) login scenario")
+	p.add_argument("--concurrency", type=int, default=16)
+	p.add_argument("--warmup", type=int, default=10)
+	p.add_argument("--storm-concurrency", type=int, default=32, help="Concurrent attackers in the chat_login_storm scenario")
+	p.add_argument("--login-rate-limit", action="store_true", help="Keep the /login rate limiter on (storm attempts then get 429)")
+	p.add_argument("--admission", action="store_true", help="Keep /chat admission control on (the single bench user then gets 429s)")
+	p.add_argument("--allow-cache-hits", action="store_true", help="Repeat questions so the response cache can serve them")
+	p.add_argument("--chat-latency", default="fixed:0", help="Stub latency spec, e.g. lognormal:0.8,0.4")
+	p.add_argument("--judge-latency", default="fixed:0")
+	p.add_argument("--embed-latency", default="fixed:0")
+	p.add_argument("--moderation-latency", default="fixed:0")
+	p.add_argument("--seed", type=int, default=0)
+	p.add_argument("--baseline", default=DEFAULT_BASELINE)
+	p.add_argument("--no-baseline", action="store_true", help="Skip the baseline comparison")
+	p.add_argument("--update-baseline", action="store_true", help="Write this run as the new baseline")
+	p.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression (0.25 = 25%%)")
+	p.add_argument("--output", help="Also write the results as JSON to this path")
+	args = p.parse_args(argv)
+	unknown = set(args.scenarios) - set(SCENARIOS)
+	if unknown:
+		p.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+	return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+	args = parse_args(argv)
+	sys.path.insert(0, BACKEND_DIR)
+	with tempfile.TemporaryDirectory(prefix="promptopt-bench-") as workdir:
+		if not args.url:
+			configure_environment(args, workdir)
+		results = asyncio.run(run(args))
+
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(results, f, indent=2)
+	if args.update_baseline:
+		with open(args.baseline, "w", encoding="utf-8") as f:
+			json.dump({"config": {"requests": args.requests, "concurrency": args.concurrency, "chat_latency": args.chat_latency}, "scenarios": results}, f, indent=2)
+			f.write("\n")
+		print(f"Baseline written to {args.baseline}")
+		return 0
+	if args.no_baseline or not os.path.exists(args.baseline):
+		return 0
+	with open(args.baseline, "r", encoding="utf-8") as f:
+		baseline = json.load(f).get("scenarios", {})
+	regressions = compare(results, baseline, args.tolerance)
+	for r in regressions:
+		print(f"REGRESSION {r}")
+	if not regressions:
+		print("No regressions against baseline.")
+	return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,136 @@
+"""Per-worker memory and search latency of the RAG index with N worker processes.
+
+Builds a synthetic snapshot, then starts N processes that each open it the way
+a uvicorn worker would and run searches while all of them are alive:
+
+    mmap   VectorStore.open (what RAGService serves): pages shared through the page cache
+    copy   the snapshot read into private memory (how faiss.read_index loaded it before)
+
+    python -m benchmarks.rag_memory                          # 4 and 16 workers, both modes
+    python -m benchmarks.rag_memory --rows 200000 --dim 1536 --dtype float16 --workers 4
+
+RSS counts shared pages in every process; PSS divides them between the
+processes mapping them and is the number that adds up to host memory.
+Memory figures come from /proc/self/smaps_rollup (Linux).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing as mp
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BACKEND_DIR not in sys.path:
+	sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+
+from app.services.vector_store import VectorStore, normalize_rows
+
+
+def memory_kb() -> Dict[str, int]:
+	out = {}
+	with open("/proc/self/smaps_rollup", "r") as f:
+		for line in f:
+			parts = line.split()
+			if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+				out[parts[0].rstrip(":").lower()] = int(parts[1])
+	out["uss"] = out.pop("private_clean", 0) + out.pop("private_dirty", 0)
+	return out
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+	if not sorted_values:
+		return 0.0
+	return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def build_snapshot(path: str, rows: int, dim: int, dtype: str, seed: int) -> None:
+	rng = np.random.default_rng(seed)
+	vectors = np.concatenate([normalize_rows(rng.standard_normal((min(50000, rows - i), dim))) for i in range(0, rows, 50000)])
+	texts = [f"Synthetic policy chunk {i}. " * 8 for i in range(rows)]
+	VectorStore.from_records(vectors, texts, [f"doc{i % 50}.pdf" for i in range(rows)], dtype=np.dtype(dtype)).save(path)
+
+
+def _worker(path: str, mode: str, queries: int, k: int, seed: int, barrier, results) -> None:
+	store = VectorStore.open(path)
+	if mode == "copy":
+		# The float32 re-ranking file (compressed dtypes) stays mapped: only candidate rows are ever read.
+		store = VectorStore(np.array(store.vectors), np.array(store.offsets), store._texts[:], np.array(store.source_ids), store.sources, store.scales, store.exact)
+	rng = np.random.default_rng(seed)
+	q = normalize_rows(rng.standard_normal((queries, store.dim)))
+	latencies = []
+	for row in q:
+		t0 = time.perf_counter()
+		_, idxs = store.search(row, k)
+		store.meta(int(idxs[0, 0]))
+		latencies.append((time.perf_counter() - t0) * 1000)
+	# Measure while every worker still holds its mapping, so PSS reflects the sharing.
+	barrier.wait()
+	mem = memory_kb()
+	barrier.wait()
+	latencies.sort()
+	results.put({**mem, "p50_ms": percentile(latencies, 0.5), "p95_ms": percentile(latencies, 0.95)})
+
+
+def run(path: str, mode: str, workers: int, queries: int, k: int) -> dict:
+	ctx = mp.get_context("spawn")
+	barrier, results = ctx.Barrier(workers), ctx.Queue()
+	procs = [ctx.Process(target=_worker, args=(path, mode, queries, k, i, barrier, results)) for i in range(workers)]
+	for p in procs:
+		p.start()
+	rows = [results.get(timeout=600) for _ in procs]
+	for p in procs:
+		p.join()
+	mean = lambda key: sum(r[key] for r in rows) / len(rows)
+	return {
+		"mode": mode,
+		"workers": workers,
+		"rss_mb": round(mean("rss") / 1024, 1),
+		"pss_mb": round(mean("pss") / 1024, 1),
+		"uss_mb": round(mean("uss") / 1024, 1),
+		"host_pss_mb": round(sum(r["pss"] for r in rows) / 1024, 1),
+		"p50_ms": round(mean("p50_ms"), 3),
+		"p95_ms": round(max(r["p95_ms"] for r in rows), 3),
+	}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+	p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	p.add_argument("--rows", type=int, default=100000)
+	p.add_argument("--dim", type=int, default=384)
+	p.add_argument("--dtype", default="float32", choices=("float32", "float16", "int8"))
+	p.add_argument("--workers", default="4,16", type=lambda v: [int(n) for n in v.split(",") if n.strip()])
+	p.add_argument("--modes", default="mmap,copy", type=lambda v: [m.strip() for m in v.split(",") if m.strip()])
+	p.add_argument("--queries", type=int, default=50, help="Searches per worker")
+	p.add_argument("--k", type=int, default=4)
+	p.add_argument("--seed", type=int, default=0)
+	p.add_argument("--output", help="Also write the results as JSON to this path")
+	return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+	args = parse_args(argv)
+	results = []
+	with tempfile.TemporaryDirectory(prefix="promptopt-ragmem-") as workdir:
+		path = os.path.join(workdir, "snapshot")
+		build_snapshot(path, args.rows, args.dim, args.dtype, args.seed)
+		size_mb = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 2**20
+		print(f"snapshot: {args.rows} rows x {args.dim} {args.dtype}, {size_mb:.1f} MB on disk")
+		print(f"{'mode':<6} {'workers':>7} {'rss MB':>9} {'pss MB':>9} {'uss MB':>9} {'host MB':>9} {'p50 ms':>8} {'p95 ms':>8}")
+		for workers in args.workers:
+			for mode in args.modes:
+				r = run(path, mode, workers, args.queries, args.k)
+				results.append(r)
+				print(f"{mode:<6} {workers:>7} {r['rss_mb']:>9} {r['pss_mb']:>9} {r['uss_mb']:>9} {r['host_pss_mb']:>9} {r['p50_ms']:>8} {r['p95_ms']:>8}")
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump({"config": vars(args), "results": results}, f, indent=2)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,112 @@
+"""Vector memory saved against recall@k lost by the compressed RAG storage modes.
+
+Builds a synthetic clustered corpus (embeddings of related chunks sit close
+together, as with real documents), then compares every ``RAG_VECTOR_DTYPE``
+with and without float32 re-ranking against exact float32 search:
+
+    python -m benchmarks.rag_quantization
+    python -m benchmarks.rag_quantization --rows 100000 --dim 1536 --rerank 2,4,8
+
+``scan MB`` is the matrix every search reads (what stays hot in the page
+cache); ``disk MB`` adds the float32 re-ranking file, of which a search only
+touches its candidate rows. FAISS's 8-bit scalar quantizer is included as a
+reference point when faiss is installed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import List, Optional
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BACKEND_DIR not in sys.path:
+	sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+
+from app.services.vector_store import VectorStore, normalize_rows
+
+
+def synthetic_corpus(rows: int, dim: int, clusters: int, spread: float, seed: int) -> np.ndarray:
+	rng = np.random.default_rng(seed)
+	centers = normalize_rows(rng.standard_normal((clusters, dim)))
+	assignment = rng.integers(0, clusters, rows)
+	return normalize_rows(centers[assignment] + spread * rng.standard_normal((rows, dim)).astype(np.float32) / np.sqrt(dim))
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+	return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def measure(name: str, search, queries: np.ndarray, truth: np.ndarray, k: int, scan_bytes: int, disk_bytes: int) -> dict:
+	found, latencies = [], []
+	for q in queries:
+		t0 = time.perf_counter()
+		_, idxs = search(q[None, :], k)
+		latencies.append((time.perf_counter() - t0) * 1000)
+		found.append(idxs[0])
+	latencies.sort()
+	return {
+		"mode": name,
+		"scan_mb": round(scan_bytes / 2**20, 1),
+		"disk_mb": round(disk_bytes / 2**20, 1),
+		f"recall@{k}": round(recall_at_k(np.array(found), truth), 4),
+		"p50_ms": round(latencies[len(latencies) // 2], 3),
+	}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+	p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	p.add_argument("--rows", type=int, default=50000)
+	p.add_argument("--dim", type=int, default=1536)
+	p.add_argument("--clusters", type=int, default=500)
+	p.add_argument("--spread", type=float, default=1.0, help="Noise around each cluster center (higher = harder)")
+	p.add_argument("--queries", type=int, default=200)
+	p.add_argument("--k", type=int, default=4)
+	p.add_argument("--rerank", default="4", type=lambda v: [int(n) for n in v.split(",") if n.strip()], help="Re-rank factors to try")
+	p.add_argument("--seed", type=int, default=0)
+	p.add_argument("--output", help="Also write the results as JSON to this path")
+	return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+	args = parse_args(argv)
+	corpus = synthetic_corpus(args.rows, args.dim, args.clusters, args.spread, args.seed)
+	rng = np.random.default_rng(args.seed + 1)
+	queries = normalize_rows(corpus[rng.integers(0, args.rows, args.queries)] + 0.5 * rng.standard_normal((args.queries, args.dim)).astype(np.float32) / np.sqrt(args.dim))
+
+	exact = VectorStore.from_records(corpus, [""] * args.rows, [""] * args.rows)
+	_, truth = exact.search(queries, args.k)
+	results = [measure("float32", exact.search, queries, truth, args.k, exact.nbytes, exact.nbytes)]
+	for dtype in ("float16", "int8"):
+		store = VectorStore.from_records(corpus, [""] * args.rows, [""] * args.rows, dtype=np.dtype(dtype))
+		disk = store.nbytes + store.exact.nbytes
+		for factor in [0] + args.rerank:
+			search = lambda q, k, factor=factor: store.search(q, k, rerank=factor)
+			label = f"{dtype}" + (f"+rerank{factor}" if factor else "")
+			results.append(measure(label, search, queries, truth, args.k, store.nbytes, disk if factor else store.nbytes))
+	try:
+		import faiss
+	except ImportError:
+		faiss = None
+	if faiss is not None:
+		index = faiss.IndexScalarQuantizer(args.dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+		index.train(corpus)
+		index.add(corpus)
+		results.append(measure("faiss-sq8", index.search, queries, truth, args.k, index.code_size * args.rows, index.code_size * args.rows))
+
+	recall = f"recall@{args.k}"
+	print(f"corpus: {args.rows} x {args.dim}, {args.clusters} clusters, {args.queries} queries")
+	print(f"{'mode':<18} {'scan MB':>8} {'disk MB':>8} {'saved':>7} {recall:>9} {'p50 ms':>8}")
+	for r in results:
+		saved = exact.nbytes / 2**20 / r["scan_mb"] if r["scan_mb"] else 0
+		print(f"{r['mode']:<18} {r['scan_mb']:>8} {r['disk_mb']:>8} {saved:>6.1f}x {r[recall]:>9} {r['p50_ms']:>8}")
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump({"config": vars(args), "results": results}, f, indent=2)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,134 @@
+import json
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.auth.security import require_admin
+from app.db.database import Base, get_db
+
+
+class FakeOpenAIServer:
+    """OpenAI-compatible HTTP endpoint with scriptable latency and error injection.
+
+    ``script`` is consumed one entry per request: ``("delay", seconds)`` answers
+    normally after sleeping, ``("status", code)`` returns that HTTP error.
+    Requests beyond the script are answered after ``latency`` seconds.
+    """
+
+    def __init__(self):
+        self.script = deque()
+        self.latency = 0.0
+        self.requests = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with fake._lock:
+                    fake.requests += 1
+                    action = fake.script.popleft() if fake.script else ("delay", fake.latency)
+                kind, value = action
+                if kind == "status":
+                    return self._send(value, {"error": {"message": "injected", "type": "server_error"}})
+                time.sleep(value)
+                self._send(200, fake.payload(self.path, body))
+
+            def _send(self, code, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def payload(path, body):
+        if path.endswith("/embeddings"):
+            inputs = body.get("input") or []
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            return {"object": "list", "model": body.get("model"), "data": [
+                {"object": "embedding", "index": i, "embedding": [1.0, 0.0, 0.0]} for i in range(len(inputs))
+            ], "usage": {"prompt_tokens": 1, "total_tokens": 1}}
+        if path.endswith("/moderations"):
+            return {"id": "modr-fake", "model": body.get("model"), "results": [{"flagged": False, "categories": {}, "category_scores": {}}]}
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "fake answer"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+        }
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def fake_openai():
+    server = FakeOpenAIServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def engine():
+    """In-memory SQLite with the full schema, one connection shared by every session and thread."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def db_session(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def api_client(session_factory):
+    """``api_client(*routers)``: a TestClient for an app with just those routers, on the test
+    database, with the admin check switched off."""
+    def make(*routers):
+        app = FastAPI()
+        for router in routers:
+            app.include_router(router)
+
+        def override():
+            s = session_factory()
+            try:
+                yield s
+            finally:
+                s.close()
+
+        app.dependency_overrides[get_db] = override
+        app.dependency_overrides[require_admin] = lambda: None
+        return TestClient(app)
+    return make
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app.auth.security import create_access_token
+from app.utils.admission import AdmissionController, AdmissionMiddleware, BucketSpec, MemoryBackend, SQLiteBackend, estimate_chat_tokens
+
+
+def _app(controller):
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+
+    @app.post("/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        await asyncio.sleep(body.get("sleep", 0))
+        return {"echo": body["message"]}
+
+    return app
+
+
+def _controller(monkeypatch, **env):
+    for k, v in env.items():
+        monkeypatch.setenv(k, str(v))
+    return AdmissionController(MemoryBackend())
+
+
+def _auth(user="alice", role="employee"):
+    return {"Authorization": f"Bearer {create_access_token(user, role, user_id=1)}"}
+
+
+def test_cost_grows_with_conversation_and_evaluation():
+    short = estimate_chat_tokens({"message": "hi"})
+    long = estimate_chat_tokens({"message": "hi", "conversation_history": [{"role": "user", "content": "x" * 4000}]})
+    assert long - short == 1000
+    assert estimate_chat_tokens({"message": "hi", "evaluate": True}) == 2 * short
+
+
+def test_body_is_replayed_and_unauthenticated_requests_pass(monkeypatch):
+    client = TestClient(_app(_controller(monkeypatch)))
+    assert client.post("/chat", json={"message": "hello"}, headers=_auth()).json() == {"echo": "hello"}
+    assert client.post("/chat", json={"message": "anon"}).status_code == 200
+
+
+def test_user_token_budget_returns_429_with_retry_after(monkeypatch):
+    controller = _controller(monkeypatch, ADMISSION_USER_TPM_EMPLOYEE=2500, ADMISSION_PROMPT_OVERHEAD_TOKENS=0, ADMISSION_COMPLETION_TOKENS=1000)
+    client = TestClient(_app(controller))
+    assert client.post("/chat", json={"message": "a"}, headers=_auth()).status_code == 200
+    assert client.post("/chat", json={"message": "b"}, headers=_auth()).status_code == 200
+    resp = client.post("/chat", json={"message": "c"}, headers=_auth())
+    assert resp.status_code == 429 and resp.json()["scope"] == "user"
+    assert 1 <= int(resp.headers["retry-after"]) <= 12
+    # Budgets are per user; admins get a larger one.
+    assert client.post("/chat", json={"message": "d"}, headers=_auth("bob")).status_code == 200
+
+
+def test_global_provider_budget_is_shared(monkeypatch):
+    controller = _controller(monkeypatch, PROVIDER_TPM_LIMIT=2000, ADMISSION_PROMPT_OVERHEAD_TOKENS=0, ADMISSION_COMPLETION_TOKENS=1000)
+    client = TestClient(_app(controller))
+    assert client.post("/chat", json={"message": "a"}, headers=_auth("u1")).status_code == 200
+    assert client.post("/chat", json={"message": "b"}, headers=_auth("u2")).status_code == 200
+    resp = client.post("/chat", json={"message": "c"}, headers=_auth("u3"))
+    assert resp.status_code == 429 and resp.json()["scope"] == "global"
+
+
+def test_per_user_concurrency_quota(monkeypatch):
+    app = _app(_controller(monkeypatch, ADMISSION_MAX_CONCURRENT_EMPLOYEE=2))
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            return await asyncio.gather(*(client.post("/chat", json={"message": "m", "sleep": 0.2}, headers=_auth()) for _ in range(3)))
+
+    codes = sorted(r.status_code for r in asyncio.run(burst()))
+    assert codes == [200, 200, 429]
+
+
+def test_sqlite_backend_shares_state_between_workers(tmp_path):
+    path = str(tmp_path / "admission.db")
+    worker_a, worker_b = SQLiteBackend(path), SQLiteBackend(path)
+    spec = BucketSpec("user:alice", capacity=100, per_minute=60)
+    assert worker_a.take_all([spec], 80) == (None, 0.0)
+    rejected, retry_after = worker_b.take_all([spec], 80)
+    assert rejected == "user:alice" and 55 < retry_after <= 60
+    lease = worker_a.acquire("user:alice", 1, lease_seconds=60)
+    assert lease and worker_b.acquire("user:alice", 1, lease_seconds=60) is None
+    worker_a.release(lease)
+    assert worker_b.acquire("user:alice", 1, lease_seconds=60)
+    # Expired leases from a crashed worker are reclaimed.
+    assert worker_a.acquire("user:bob", 1, lease_seconds=-1)
+    assert worker_b.acquire("user:bob", 1, lease_seconds=60)
+
+
+def test_sqlite_backend_runs_off_the_event_loop(tmp_path):
+    threads = []
+
+    class Recording(SQLiteBackend):
+        def take_all(self, specs, cost):
+            threads.append(threading.get_ident())
+            return super().take_all(specs, cost)
+
+        def release(self, lease_id):
+            threads.append(threading.get_ident())
+            super().release(lease_id)
+
+    app = _app(AdmissionController(Recording(str(tmp_path / "admission.db"))))
+
+    async def call():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            resp = await client.post("/chat", json={"message": "m"}, headers=_auth())
+        return resp, threading.get_ident()
+
+    resp, loop_thread = asyncio.run(call())
+    assert resp.status_code == 200
+    assert len(threads) == 2 and loop_thread not in threads
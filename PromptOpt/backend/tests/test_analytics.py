@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+import pytest
+from app.db import models
+from app.services import analytics_service
+
+
+@pytest.fixture
+def db(db_session):
+    db_session.add(models.User(id=1, username="admin", password_hash="x", role="admin"))
+    db_session.add(models.Prompt(id=1, title="HR FAQ", created_by="admin"))
+    db_session.add_all([
+        models.PromptVersion(id=10, prompt_id=1, version=1, content="A"),
+        models.PromptVersion(id=11, prompt_id=1, version=2, content="B"),
+    ])
+    db_session.commit()
+    return db_session
+
+
+def _chat(db, pv_id, overall, when, label="good", action="allow"):
+    conv = models.Conversation(user_id=1, prompt_version_id=pv_id, started_at=when)
+    db.add(conv)
+    db.flush()
+    criteria = {c: overall for c in ("helpfulness", "accuracy", "clarity", "safety", "relevance", "tone")}
+    db.add(models.Evaluation(conversation_id=conv.id, overall=overall, criteria=criteria, label=label, created_at=when))
+    db.add(models.Guardrail(conversation_id=conv.id, action=action, report={}, created_at=when))
+    db.commit()
+
+
+def test_rollups_are_maintained_on_insert(db):
+    t = datetime(2026, 3, 2, 9, 15)
+    _chat(db, 10, 4.0, t)
+    _chat(db, 10, 3.0, t + timedelta(minutes=20), label="average", action="redact")
+    _chat(db, 11, 4.6, t + timedelta(hours=3))
+
+    series = analytics_service.score_series(db, "overall", "day")
+    (a,), (b,) = series[10], series[11]
+    assert a == {"bucket": "2026-03-02T00:00:00", "n": 2, "mean": 3.5, "std": pytest.approx(0.7071, abs=1e-4),
+                 "min": 3.0, "max": 4.0, "histogram": [0, 0, 0, 0, 0, 0, 1, 0, 1, 0]}
+    assert b["n"] == 1 and b["histogram"][9] == 1
+
+    hourly = analytics_service.score_series(db, "tone", "hour", version_ids=[10])
+    assert [p["bucket"] for p in hourly[10]] == ["2026-03-02T09:00:00"]
+
+    labels = analytics_service.count_series(db, "label", "day", version_ids=[10])
+    assert labels[10][0]["counts"] == {"average": 1, "good": 1}
+
+    guardrails = analytics_service.count_series(db, "guardrail", "day", by_version=False)
+    assert guardrails[0][0]["n"] == 3
+    assert guardrails[0][0]["rates"]["redact"] == pytest.approx(1 / 3, abs=1e-4)
+
+
+def test_rollups_survive_conversation_pruning(db):
+    _chat(db, 10, 4.0, datetime(2026, 3, 2, 9))
+    db.delete(db.query(models.Conversation).one())
+    db.commit()
+    assert db.query(models.Evaluation).count() == 0
+    assert analytics_service.score_series(db, "overall", "day")[10][0]["n"] == 1
+
+
+def test_week_and_month_merge_daily_buckets_within_range(db):
+    start = datetime(2026, 1, 1, 12)
+    for day in range(60):
+        _chat(db, 10, 2.0 + (day % 2), start + timedelta(days=day))
+
+    weeks = analytics_service.score_series(db, "overall", "week", start=datetime(2026, 1, 5), end=datetime(2026, 1, 19))[10]
+    assert [(p["bucket"], p["n"]) for p in weeks] == [("2026-01-05T00:00:00", 7), ("2026-01-12T00:00:00", 7)]
+
+    months = analytics_service.score_series(db, "overall", "month")[10]
+    assert [(p["bucket"], p["n"]) for p in months] == [("2026-01-01T00:00:00", 31), ("2026-02-01T00:00:00", 28), ("2026-03-01T00:00:00", 1)]
+    assert months[0]["min"] == 2.0 and months[0]["max"] == 3.0
+
+    with pytest.raises(ValueError):
+        analytics_service.score_series(db, "overall", "fortnight")
@@ -0,0 +1,70 @@
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+from sqlalchemy import event
+from app.auth.security import ALGORITHM, SECRET_KEY, create_access_token, get_current_user, require_admin
+from app.auth.user_cache import user_cache
+from app.db import models
+
+
+@pytest.fixture
+def db(engine, db_session):
+    db_session.add_all([
+        models.User(username="alice", password_hash="x", role="admin"),
+        models.User(username="bob", password_hash="x", role="employee"),
+    ])
+    db_session.commit()
+    db_session.queries = []
+    event.listen(engine, "before_cursor_execute", lambda *a: db_session.queries.append(a[2]))
+    user_cache.clear()
+    yield db_session
+    user_cache.clear()
+
+
+def _token(db, username):
+    user = db.query(models.User).filter(models.User.username == username).one()
+    db.queries.clear()
+    return create_access_token(user.username, user.role, user_id=user.id)
+
+
+def test_repeat_requests_skip_the_user_query(db):
+    token = _token(db, "alice")
+    first = get_current_user(db, token)
+    second = get_current_user(db, token)
+    assert first == second and first.role == "admin"
+    assert len(db.queries) == 1
+    assert "iat" in jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+def test_user_update_invalidates_cached_entry(db):
+    token = _token(db, "alice")
+    assert require_admin(db, token).username == "alice"
+    db.query(models.User).filter(models.User.username == "alice").one().role = "employee"
+    db.commit()
+    with pytest.raises(HTTPException) as exc:
+        require_admin(db, token)
+    assert exc.value.status_code == 403
+
+
+def test_deleted_user_is_rejected(db):
+    token = _token(db, "bob")
+    get_current_user(db, token)
+    db.delete(db.query(models.User).filter(models.User.username == "bob").one())
+    db.commit()
+    with pytest.raises(HTTPException) as exc:
+        get_current_user(db, token)
+    assert exc.value.status_code == 401
+
+
+def test_stateless_admin_check_trusts_signed_claims(db, monkeypatch):
+    monkeypatch.setenv("AUTH_STATELESS", "true")
+    admin, employee = _token(db, "alice"), _token(db, "bob")
+    assert require_admin(db, admin).id == 1
+    with pytest.raises(HTTPException) as exc:
+        require_admin(db, employee)
+    assert exc.value.status_code == 403
+    assert db.queries == []
+    forged = jwt.encode({"sub": "bob", "role": "admin", "uid": 2}, "wrong-key", algorithm=ALGORITHM)
+    with pytest.raises(HTTPException) as exc:
+        require_admin(db, forged)
+    assert exc.value.status_code == 401
@@ -0,0 +1,109 @@
+import asyncio
+import time
+import json
+import os
+import pytest
+from app.providers.stub import StubProvider
+from app.services.batch_eval import BatchEvalRun, EvalVersion, read_results
+from app.services.evaluation_service import EvaluationService
+from app.services.llm_service import LLMService
+
+
+VERSIONS = [
+    EvalVersion(id=10, version=1, content="You are a terse HR assistant."),
+    EvalVersion(id=11, version=2, content="You are a thorough HR assistant.", max_tokens=300),
+]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "golden.jsonl"
+    rows = [{"question": f"How many vacation days do I get in year {i}?"} for i in range(25)]
+    rows.append({"id": "with-history", "message": "And sick days?", "history": [{"role": "user", "content": "hi"}]})
+    path.write_text("\n".join(json.dumps(r) for r in rows) + "\n")
+    return path
+
+
+def _services():
+    stub = StubProvider(seed=7, embed_dim=32)
+    return {"llm_service": LLMService(provider=stub), "evaluation_service": EvaluationService(provider=stub)}
+
+
+def test_run_scores_every_case_for_every_version(tmp_path, dataset):
+    run = BatchEvalRun.create(str(tmp_path / "run"), str(dataset), VERSIONS, concurrency=8, shard_size=10, **_services())
+    report = asyncio.run(run.run())
+
+    assert report["completed"] == report["total"] == 26 * 2
+    assert [v["n"] for v in report["versions"]] == [26, 26]
+    for v in report["versions"]:
+        assert 0 <= v["mean"] <= 5
+        assert set(v["criteria"]) == {"helpfulness", "accuracy", "clarity", "safety", "relevance", "tone"}
+    assert report["best_version"] in (1, 2)
+    assert json.loads((tmp_path / "run" / "report.json").read_text()) == report
+    # Checkpointed in shards of at most shard_size rows.
+    assert len([f for f in os.listdir(tmp_path / "run") if f.startswith("part-")]) >= 6
+
+
+def test_resume_only_evaluates_missing_pairs(tmp_path, dataset):
+    run_dir = str(tmp_path / "run")
+    run = BatchEvalRun.create(run_dir, str(dataset), VERSIONS, concurrency=1, shard_size=5, **_services())
+
+    def interrupt(done, total):
+        if done == 20:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(run.run(interrupt))
+    assert len(read_results(run_dir)["case"]) == 20
+
+    calls = []
+    resumed = BatchEvalRun(run_dir, **_services())
+    report = asyncio.run(resumed.run(lambda done, total: calls.append(done)))
+
+    assert len(calls) == 52 - 20
+    assert report["completed"] == 52
+    pairs = list(zip(*(read_results(run_dir)[k].tolist() for k in ("case", "version_id"))))
+    assert len(pairs) == len(set(pairs))
+
+
+def test_create_refuses_to_overwrite_a_run(tmp_path, dataset):
+    BatchEvalRun.create(str(tmp_path / "run"), str(dataset), VERSIONS, **_services())
+    with pytest.raises(FileExistsError):
+        BatchEvalRun.create(str(tmp_path / "run"), str(dataset), VERSIONS, **_services())
+
+
+def test_resume_endpoint_finishes_an_interrupted_run(tmp_path, dataset, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.auth.security import require_admin
+    from app.routes import evaluation
+    from app.services.container import services
+
+    run_id = "ab" * 16
+    run_dir = str(tmp_path / "runs" / run_id)
+    run = BatchEvalRun.create(run_dir, str(dataset), VERSIONS, concurrency=1, shard_size=5, **_services())
+
+    def interrupt(done, total):
+        if done == 10:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(run.run(interrupt))
+
+    monkeypatch.setattr(evaluation, "EVAL_RUNS_DIR", str(tmp_path / "runs"))
+    for name, service in _services().items():
+        monkeypatch.setitem(services._instances, name.split("_")[0], service)
+    app = FastAPI()
+    app.include_router(evaluation.router)
+    app.dependency_overrides[require_admin] = lambda: None
+
+    with TestClient(app) as client:
+        resp = client.post(f"/eval/runs/{run_id}/resume")
+        assert resp.status_code == 200 and resp.json()["completed"] == 10
+        for _ in range(200):
+            status = client.get(f"/eval/runs/{run_id}").json()
+            if status["finished"]:
+                break
+            time.sleep(0.05)
+    assert status["finished"] and status["report"]["completed"] == 52
+    assert "error" not in status
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import pytest
+from app.models.evaluation import EvaluationRequest
+from app.providers.base import ChatResult, ProviderError
+from app.providers.stub import StubProvider
+from app.services.evaluation_service import EvaluationService
+
+
+class CountingStub(StubProvider):
+    def __init__(self, batch_reply=None):
+        super().__init__(seed=3, embed_dim=16)
+        self.batch_reply = batch_reply
+        self.calls = []
+
+    def judge(self, messages, model, max_tokens, timeout):
+        batched = "### Item" in messages[-1]["content"]
+        self.calls.append("batch" if batched else "single")
+        if batched and self.batch_reply is not None:
+            return ChatResult(text=self.batch_reply, model=model)
+        return super().judge(messages, model, max_tokens, timeout)
+
+
+def _items(n, prompt="Be helpful.", answer="Employees get 20 vacation days."):
+    return [EvaluationRequest(user_message=f"question {i}?", assistant_response=answer, prompt_used=prompt) for i in range(n)]
+
+
+def test_batches_are_packed_per_prompt():
+    stub = CountingStub()
+    service = EvaluationService(provider=stub)
+    results = asyncio.run(service.evaluate_batch(_items(10, "A") + _items(10, "B")))
+
+    assert len(results) == 20
+    assert all(r.judge_model == service.judge_model for r in results)
+    # 10 items per prompt at 8 per call -> 2 calls per prompt
+    assert stub.calls == ["batch"] * 4
+
+
+def test_batch_prompt_asks_for_the_items_object():
+    service = EvaluationService(provider=CountingStub())
+    system, user = service._batch_messages(_items(3), [0, 1, 2])
+    assert '{"items": [...]}' in system["content"]
+    assert user["content"].endswith('Return a JSON object {"items": [...]} with exactly 3 entries, one per item.')
+    assert "array" not in user["content"]
+
+
+def test_batch_size_adapts_to_token_budget(monkeypatch):
+    monkeypatch.setenv("JUDGE_BATCH_MAX_INPUT_TOKENS", "1100")
+    service = EvaluationService(provider=CountingStub())
+    batches = service._plan_batches(_items(8, answer="x" * 1200))  # ~300 tokens per item
+    assert [len(b) for b in batches] == [3, 3, 2]
+
+    monkeypatch.setenv("JUDGE_BATCH_MAX_OUTPUT_TOKENS", "250")
+    service = EvaluationService(provider=CountingStub())
+    assert max(len(b) for b in service._plan_batches(_items(8))) == 2
+
+
+def test_invalid_entries_fall_back_to_single_judging():
+    entry = {"helpfulness": 4, "accuracy": 4, "clarity": 4, "safety": 5, "relevance": 4, "tone": 4, "overall": 4.2}
+    reply = "Here you go:\n" + json.dumps([
+        {"index": 1, **entry},
+        {"index": 2, **entry, "accuracy": "great"},  # not a score
+        {"index": 3, **{k: v for k, v in entry.items() if k != "tone"}},  # missing criterion
+        {"index": 4, **entry},
+        {"index": 4, **entry},                      # duplicate -> ambiguous
+        {"index": 7, **entry},                      # no such item
+    ])
+    stub = CountingStub(batch_reply=reply)
+    service = EvaluationService(provider=stub)
+    results = asyncio.run(service.evaluate_batch(_items(5)))
+
+    assert results[0].overall_score == pytest.approx(4.2)
+    assert stub.calls == ["batch"] + ["single"] * 4
+    assert all(r.judge_model == service.judge_model for r in results)
+
+
+def test_unparseable_batch_rejudges_each_item():
+    stub = CountingStub(batch_reply="sorry, I cannot do that")
+    results = asyncio.run(EvaluationService(provider=stub).evaluate_batch(_items(3)))
+    assert stub.calls == ["batch"] + ["single"] * 3
+    assert len(results) == 3
+
+
+def test_failed_batch_call_uses_heuristic():
+    stub = CountingStub()
+
+    def boom(*args, **kwargs):
+        raise ProviderError("down", retryable=False)
+
+    stub.judge = boom
+    results = asyncio.run(EvaluationService(provider=stub).evaluate_batch(_items(4)))
+    assert [r.judge_model for r in results] == ["heuristic"] * 4
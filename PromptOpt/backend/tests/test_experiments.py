@@ -0,0 +1,158 @@
+import random
+import statistics
+import threading
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.db import models
+from app.db.database import Base
+from app.services.experiment_service import ArmSummary, ExperimentService, spending_boundaries, welford_update
+
+
+@pytest.fixture
+def db(db_session):
+    db_session.add(models.Prompt(id=1, title="HR FAQ", created_by="admin"))
+    db_session.add_all([
+        models.PromptVersion(id=10, prompt_id=1, version=1, content="A", is_active=True, traffic_weight=3),
+        models.PromptVersion(id=11, prompt_id=1, version=2, content="B", is_active=True, traffic_weight=1),
+    ])
+    db_session.commit()
+    return db_session
+
+
+def test_welford_matches_batch_statistics():
+    xs = [random.uniform(1, 5) for _ in range(500)]
+    n, mean, m2 = 0, 0.0, 0.0
+    for x in xs:
+        n, mean, m2 = welford_update(n, mean, m2, x)
+    assert mean == pytest.approx(statistics.fmean(xs))
+    assert m2 / (n - 1) == pytest.approx(statistics.variance(xs))
+
+
+def test_assignment_is_sticky_and_follows_weights(db):
+    service = ExperimentService()
+    arms = db.query(models.PromptVersion).all()
+    picks = [service.choose_version(arms, user_id, 1).version for user_id in range(20000)]
+    assert picks[:50] == [service.choose_version(arms, u, 1).version for u in range(50)]
+    assert picks.count(1) / len(picks) == pytest.approx(0.75, abs=0.02)
+    assert service.choose_version(arms[:1], 7, 1).version == 1
+
+
+def test_clear_winner_is_promoted_after_min_samples(db, monkeypatch):
+    monkeypatch.setenv("EXPERIMENT_MIN_SAMPLES", "30")
+    service = ExperimentService()
+    rng = random.Random(0)
+    promoted = None
+    for i in range(30):
+        service.record_score(db, 10, rng.gauss(3.4, 0.3))
+        service.record_score(db, 11, rng.gauss(4.2, 0.3))
+        promoted = service.maybe_promote(db, 1)
+        db.commit()
+        if i < 29:
+            assert promoted is None
+    assert promoted is not None and promoted.version == 2
+    active = db.query(models.PromptVersion).filter(models.PromptVersion.is_active == True).all()
+    assert [v.version for v in active] == [2] and active[0].traffic_weight is None
+    stats = db.get(models.PromptArmStats, 11)
+    assert stats.n == 30 and stats.mean == pytest.approx(4.2, abs=0.2)
+
+
+def test_indistinguishable_arms_are_not_promoted(db, monkeypatch):
+    monkeypatch.setenv("EXPERIMENT_MIN_SAMPLES", "30")
+    service = ExperimentService()
+    rng = random.Random(1)
+    for _ in range(200):
+        service.record_score(db, 10, rng.gauss(4.0, 0.5))
+        service.record_score(db, 11, rng.gauss(4.02, 0.5))
+    assert service.maybe_promote(db, 1) is None
+    assert db.query(models.PromptVersion).filter(models.PromptVersion.is_active == True).count() == 2
+
+
+def test_boundaries_spend_alpha_across_fixed_looks(monkeypatch):
+    monkeypatch.setenv("EXPERIMENT_MIN_SAMPLES", "30")
+    monkeypatch.delenv("EXPERIMENT_LOOKS", raising=False)
+    monkeypatch.delenv("EXPERIMENT_MAX_SAMPLES", raising=False)
+    monkeypatch.setenv("EXPERIMENT_ALPHA", "0.01")
+    service = ExperimentService()
+    assert service.checkpoints == [30, 60, 90, 120, 150]
+    z = service.boundaries()
+    assert all(a > b for a, b in zip(z, z[1:]))
+    # Early looks need overwhelming evidence; the last is a little above the fixed-sample 2.58
+    assert z[0] > 5 and 2.58 < z[-1] < 2.9
+    assert spending_boundaries([100], 100, 0.01)[0] == pytest.approx(2.576, abs=1e-3)
+    # Three arms: the best is compared against two others
+    assert service.boundaries(2)[-1] > z[-1]
+
+
+def test_sequential_looks_hold_the_false_promotion_rate(monkeypatch):
+    monkeypatch.setenv("EXPERIMENT_MIN_SAMPLES", "30")
+    monkeypatch.setenv("EXPERIMENT_LOOKS", "5")
+    monkeypatch.setenv("EXPERIMENT_ALPHA", "0.05")
+    monkeypatch.setenv("EXPERIMENT_MIN_EFFECT", "0")
+    service = ExperimentService()
+    naive = ExperimentService()
+    naive.checkpoints = list(range(30, 151))
+    naive._boundaries = {1: [1.96] * len(naive.checkpoints)}
+    rng = random.Random(7)
+    promoted = {"sequential": 0, "naive": 0}
+    for _ in range(1000):
+        arms = [(0, 0.0, 0.0), (0, 0.0, 0.0)]
+        hit = {"sequential": False, "naive": False}
+        for _ in range(150):
+            arms = [welford_update(*a, rng.gauss(4.0, 0.5)) for a in arms]
+            summaries = [ArmSummary(i, i + 1, 1.0, n, mean, m2 / (n - 1) if n > 1 else 0.0) for i, (n, mean, m2) in enumerate(arms)]
+            for name, s in (("sequential", service), ("naive", naive)):
+                if not hit[name] and arms[0][0] in s.checkpoints and s.winner(summaries) is not None:
+                    hit[name] = True
+        for name in hit:
+            promoted[name] += hit[name]
+    # Testing after every score promotes identical arms far more often than alpha
+    assert promoted["naive"] / 1000 > 0.1
+    assert promoted["sequential"] / 1000 <= 0.05
+
+
+def test_promotion_is_only_tested_when_an_arm_completes_a_look(db, monkeypatch):
+    monkeypatch.setenv("EXPERIMENT_MIN_SAMPLES", "5")
+    monkeypatch.setenv("EXPERIMENT_LOOKS", "3")
+    monkeypatch.setenv("EXPERIMENT_MIN_EFFECT", "0.1")
+    service = ExperimentService()
+    assert service.checkpoints == [5, 10, 15]
+    tested = []
+    monkeypatch.setattr(service, "winner", lambda arms: tested.append(min(a.n for a in arms)))
+    for _ in range(20):
+        service.record_score(db, 10, 3.0)
+        service.maybe_promote(db, 1, scored_version_id=10)
+        service.record_score(db, 11, 4.0)
+        service.maybe_promote(db, 1, scored_version_id=11)
+    # Once per look, none between looks and none after the last
+    assert tested == [5, 10, 15]
+
+
+def test_concurrent_first_scores_create_the_arm_row_once(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'exp.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    service = ExperimentService()
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def score():
+        db = Session()
+        try:
+            barrier.wait()
+            service.record_score(db, 10, 4.0)
+            db.commit()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=score) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    db = Session()
+    assert db.get(models.PromptArmStats, 10).n == 8
+    db.close()
@@ -0,0 +1,85 @@
+import pytest
+from app.services.intent_gate import GateModel, IntentGate
+
+HR_QUESTIONS = [
+    "How many vacation days do new hires get",
+    "What is the parental leave policy",
+    "How do I submit an expense report",
+    "When does open enrollment for dental start",
+    "Can I work remotely on Fridays",
+    "Who approves overtime",
+    "How does the pension match work",
+    "Which holidays are paid",
+]
+CHITCHAT = [
+    "What is the capital of France",
+    "Write me a haiku about autumn",
+    "Tell me a joke",
+    "What's 17 times 23",
+    "Recommend a good sci-fi novel",
+    "How do you say cat in Spanish",
+    "Who won the world cup in 2018",
+    "Explain recursion like I'm five",
+]
+
+
+@pytest.fixture
+def gate(tmp_path):
+    return IntentGate(model_path=str(tmp_path / "missing.json"))
+
+
+@pytest.mark.parametrize("message,history,retrieve,reason", [
+    ("hi", 0, False, "smalltalk"),
+    ("Thanks so much!", 2, False, "smalltalk"),
+    ("can you shorten that", 2, False, "followup"),
+    ("rephrase", 2, False, "followup"),
+    ("rephrase", 0, True, "default"),
+    ("How many vacation days do I get?", 0, True, "lexicon"),
+    ("shorten the leave policy summary for managers", 2, True, "lexicon"),
+    # Rewrite verbs around an HR topic are new questions, not follow-ups
+    ("Can you summarize the sick leave policy in this handbook?", 2, True, "lexicon"),
+    ("clarify the vacation policy", 2, True, "lexicon"),
+    ("What's the weather like", 0, True, "default"),
+])
+def test_lexicon_decisions(gate, message, history, retrieve, reason):
+    decision = gate.decide(message, history)
+    assert (decision.retrieve, decision.reason) == (retrieve, reason)
+
+
+def test_use_company_context_forces_the_decision(gate, monkeypatch):
+    assert gate.decide("hi", force=True).retrieve is True
+    assert gate.decide("What is the parental leave policy", force=False).retrieve is False
+    monkeypatch.setenv("RAG_GATE_ENABLED", "false")
+    assert IntentGate(model_path="/nonexistent").decide("thanks").reason == "disabled"
+
+
+def test_classifier_learns_from_labelled_messages_and_round_trips(tmp_path):
+    model = GateModel.train(HR_QUESTIONS + CHITCHAT, [True] * len(HR_QUESTIONS) + [False] * len(CHITCHAT))
+    assert model.probability("What is the sick leave policy for employees") > model.threshold
+    assert model.probability("Write me a limerick about dogs") < model.threshold
+    model.save(str(tmp_path / "gate.json"))
+
+    gate = IntentGate(model_path=str(tmp_path / "gate.json"))
+    assert gate.model.meta == {"samples": 16, "positive_rate": 0.5}
+    decision = gate.decide("Tell me a joke about pirates")
+    assert decision.reason == "classifier" and not decision.retrieve
+    # Greetings, follow-ups and obvious HR questions never reach the classifier.
+    assert gate.decide("hello").reason == "smalltalk"
+    gate.model.threshold = 1.1
+    decision = gate.decide("what's our pto policy")
+    assert (decision.retrieve, decision.reason) == (True, "lexicon")
+
+
+def test_stats_report_skip_rate_and_estimated_savings(gate):
+    gate.decide("How do I file an expense report")
+    gate.record_retrieval(0.040, found=True)
+    gate.decide("Tell me a joke")
+    gate.record_retrieval(0.020, found=False)
+    gate.decide("thanks")
+    gate.decide("ok")
+    stats = gate.stats()
+    assert stats["decisions"] == 4 and stats["skipped"] == 2 and stats["skip_rate"] == 0.5
+    assert stats["by_reason"] == {"retrieve:default": 1, "retrieve:lexicon": 1, "skip:smalltalk": 2}
+    assert stats["empty_retrieval_rate"] == 0.5
+    assert stats["avg_retrieval_ms"] == pytest.approx(30.0)
+    assert stats["estimated_saved_ms"] == pytest.approx(60.0)
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from app.providers.base import ChatResult
+from app.providers.stub import StubProvider
+from app.services.evaluation_service import EvaluationService, coerce_score
+from app.utils.lenient_json import parse_lenient
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('Sure! ```json\n{"a": 1, "b": "x",}\n```', {"a": 1, "b": "x"}),
+    ("{'a': 1, b: True, c: None}", {"a": 1, "b": True, "c": None}),
+    ('{"a": 1 "b": 2}', {"a": 1, "b": 2}),
+    ('{"a": 1, // why\n "b": NaN}', {"a": 1, "b": None}),
+    ('{"a": NaN, "b": [Infinity, -Infinity]}', {"a": None, "b": [None, None]}),
+    ('{"a": -Infinity, // cut\n', {"a": None}),
+    ('Scores [0-5]: {"a": 4.5}', {"a": 4.5}),
+    ('{"a": [1, 2,', {"a": [1, 2]}),
+    ('{"a": 4, "comments": "cut off mid-sent', {"a": 4, "comments": "cut off mid-sent"}),
+])
+def test_parse_lenient_repairs_common_mistakes(text, expected):
+    value, repaired = parse_lenient(text)
+    assert value == expected
+    assert repaired == (text != '{"a": 1}' and not text.startswith("Scores"))
+
+
+def test_parse_lenient_rejects_non_json():
+    with pytest.raises(ValueError):
+        parse_lenient("I would rate this response highly.")
+    with pytest.raises(ValueError):
+        parse_lenient("[1, 2]", types=(dict,))
+
+
+@pytest.mark.parametrize("raw, score, adjusted", [
+    (4, 4.0, False), (4.5, 4.5, False), ("4", 4.0, True), ("4.5/5", 4.5, True),
+    ("8 out of 10", 4.0, True), (7, 5.0, True), (-1, 0.0, True),
+])
+def test_coerce_score_clamps_and_rescales(raw, score, adjusted):
+    assert coerce_score(raw) == (pytest.approx(score), adjusted)
+
+
+@pytest.mark.parametrize("raw", [None, "great", True, float("nan")])
+def test_coerce_score_rejects_non_scores(raw):
+    with pytest.raises(ValueError):
+        coerce_score(raw)
+
+
+class ScriptedJudge(StubProvider):
+    def __init__(self, replies):
+        super().__init__(seed=1, embed_dim=16)
+        self.replies = list(replies)
+
+    def judge(self, messages, model, max_tokens, timeout):
+        return ChatResult(text=self.replies.pop(0), model=model)
+
+
+def test_repaired_output_is_scored_not_fallback():
+    reply = "```json\n{helpfulness: 4, accuracy: '9', clarity: 3, safety: 5, relevance: 4, tone: 4,}\n```"
+    service = EvaluationService(provider=ScriptedJudge([reply]))
+    result = asyncio.run(service.evaluate("q", "a"))
+    assert result.judge_model == service.judge_model
+    assert result.criteria.accuracy == 5.0
+    assert result.overall_score == pytest.approx(25 / 6)
+    assert service.stats()["repaired"] == 1
+
+
+def test_unparseable_output_is_retried_then_counted_as_fallback():
+    good = '{"helpfulness": 4, "accuracy": 4, "clarity": 4, "safety": 4, "relevance": 4, "tone": 4, "overall": 4}'
+    service = EvaluationService(provider=ScriptedJudge(["no json here", good]))
+    assert asyncio.run(service.evaluate("q", "a")).overall_score == 4
+
+    service = EvaluationService(provider=ScriptedJudge(["nope", '{"helpfulness": 4}']))
+    assert asyncio.run(service.evaluate("q", "a")).judge_model == "heuristic"
+    stats = service.stats()
+    assert stats["fallback_parse"] == 1 and stats["parse_retries"] == 2
+    assert stats["fallback_rate"] == 1.0
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+import os
+from benchmarks.loadtest import compare, percentile
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 0.50) == 50.0
+    assert percentile(values, 0.95) == 95.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_compare_flags_latency_throughput_and_error_regressions():
+    baseline = {"chat": {"p95_ms": 100.0, "p99_ms": 200.0, "throughput_rps": 50.0, "errors": 0}}
+    ok = {"chat": {"p95_ms": 110.0, "p99_ms": 210.0, "throughput_rps": 45.0, "errors": 0}}
+    assert compare(ok, baseline, 0.25) == []
+    bad = {"chat": {"p95_ms": 140.0, "p99_ms": 210.0, "throughput_rps": 30.0, "errors": 2}}
+    assert len(compare(bad, baseline, 0.25)) == 3
+
+
+def test_harness_runs_end_to_end_against_stub():
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.loadtest", "--scenarios", "prompts,chat,chat_rag", "--requests", "5",
+         "--concurrency", "2", "--warmup", "1", "--no-baseline"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert "chat_rag" in proc.stdout and "err=0" in proc.stdout
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from app.auth.hashing import HashingBusy, PasswordHasherPool
+from app.auth.security import get_password_hash
+from app.routes import auth as auth_routes
+from app.utils.rate_limit import RateLimiter
+
+
+def _request(ip="10.0.0.1"):
+    return Request({"type": "http", "method": "POST", "path": "/login", "headers": [], "client": (ip, 1234)})
+
+
+def test_token_bucket_allows_burst_then_refills():
+    limiter = RateLimiter(capacity=2, per_minute=60)
+    assert limiter.hit("k", now=0.0) == (True, 0.0)
+    assert limiter.hit("k", now=0.0)[0]
+    allowed, retry_after = limiter.hit("k", now=0.0)
+    assert not allowed and retry_after == pytest.approx(1.0)
+    assert limiter.hit("k", now=1.0)[0]
+    assert limiter.hit("other", now=0.0)[0]
+
+
+def test_rate_limiter_memory_is_bounded():
+    limiter = RateLimiter(capacity=1, per_minute=1, max_keys=3)
+    for i in range(10):
+        limiter.hit(i, now=0.0)
+    assert len(limiter._buckets) == 3
+
+
+def test_login_limits_per_username_and_ip(monkeypatch):
+    monkeypatch.setattr(auth_routes, "LOGIN_RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(auth_routes, "login_ip_limiter", RateLimiter(capacity=3, per_minute=1))
+    monkeypatch.setattr(auth_routes, "login_user_limiter", RateLimiter(capacity=2, per_minute=1))
+    auth_routes._enforce_login_rate_limit(_request(), "Alice")
+    auth_routes._enforce_login_rate_limit(_request(), "alice ")
+    with pytest.raises(HTTPException) as exc:
+        auth_routes._enforce_login_rate_limit(_request(), "alice")
+    assert exc.value.status_code == 429 and int(exc.value.headers["Retry-After"]) >= 1
+    # Username buckets are independent; the IP bucket (3) is now exhausted too.
+    with pytest.raises(HTTPException):
+        auth_routes._enforce_login_rate_limit(_request(), "bob")
+    auth_routes._enforce_login_rate_limit(_request("10.0.0.2"), "bob")
+
+
+def test_hasher_pool_runs_off_loop_and_sheds_excess():
+    hashed = get_password_hash("secret")
+    pool = PasswordHasherPool(workers=1, queue_limit=1)
+    assert asyncio.run(pool.verify("secret", hashed))
+    assert not asyncio.run(pool.verify("wrong", hashed))
+
+    gate = threading.Event()
+
+    async def saturate():
+        blocked = [asyncio.ensure_future(pool._run(gate.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(HashingBusy):
+            await pool.verify("secret", hashed)
+        gate.set()
+        await asyncio.gather(*blocked)
+
+    asyncio.run(saturate())
+    assert pool.stats()["rejected"] == 1 and pool.stats()["in_flight"] == 0
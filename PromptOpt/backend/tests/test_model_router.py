@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+from app.services.model_router import ModelRouter
+
+
+def _version(**kw):
+    base = dict(id=1, model=None, max_tokens=None, temperature=None, timeout_seconds=None)
+    base.update(kw)
+    return SimpleNamespace(**base)
+
+
+def _router(enabled=True):
+    router = ModelRouter()
+    router.enabled = enabled
+    return router
+
+
+def test_version_settings_override_defaults_field_by_field():
+    router = _router(enabled=False)
+    settings = router.settings_for(_version(max_tokens=120, temperature=0.0))
+    assert settings.max_tokens == 120
+    assert settings.temperature == 0.0
+    assert settings.model == router.defaults.model
+    assert settings.timeout == router.defaults.timeout
+
+
+def test_pinned_model_is_never_rerouted():
+    decision = _router().route("hi", prompt_version=_version(model="gpt-4o"))
+    assert decision.route == "pinned" and decision.settings.model == "gpt-4o"
+
+
+def test_short_queries_go_fast_and_large_inputs_escalate():
+    router = _router()
+    assert router.route("How many PTO days do I get?").settings.model == router.fast_model
+    assert router.route("x" * router.large_min_message_chars).route == "large"
+    assert router.route("short", context_chars=router.large_min_context_chars).route == "large"
+    assert router.route("y" * (router.fast_max_message_chars + 1)).route == "default"
+
+
+def test_disabled_router_uses_defaults_and_records_latency():
+    router = _router(enabled=False)
+    decision = router.route("How many PTO days?")
+    assert decision.route == "default"
+    router.record(decision, 0.5)
+    router.record(decision, 1.5, ok=False)
+    stats = router.stats()["routes"][0]
+    assert stats["count"] == 2 and stats["errors"] == 1 and stats["avg_latency"] == 1.0
@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import event
+from app.db import models
+from app.routes import prompt
+
+
+@pytest.fixture
+def env(engine, session_factory, api_client):
+    db = session_factory()
+    for pid in range(1, 31):
+        db.add(models.Prompt(id=pid, title=f"Prompt {pid}", created_by="admin"))
+        # Long histories with an older version left active (v1), plus a pinned model on it
+        db.add_all(models.PromptVersion(prompt_id=pid, version=v, content=f"p{pid} v{v}", is_active=(v == 1), model="gpt-4o" if v == 1 else None) for v in range(1, 21))
+    db.add(models.Prompt(id=31, title="No live version", created_by="admin"))
+    db.commit()
+    db.close()
+
+    client = api_client(prompt.router)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return client, session_factory, statements
+
+
+def test_listing_returns_the_active_version_with_two_queries(env):
+    client, _, statements = env
+    resp = client.get("/prompts")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert len(body) == 31 and resp.headers["X-Total-Count"] == "31"
+    assert body[0] == {"id": 1, "title": "Prompt 1", "content": "p1 v1", "created_by": "admin", "model": "gpt-4o", "max_tokens": None, "temperature": None, "timeout_seconds": None}
+    assert body[-1]["content"] == ""
+    # One aggregate for the ETag, one joined listing: no per-prompt version loads.
+    assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 2
+
+
+def test_pagination(env):
+    client, _, _ = env
+    page = client.get("/prompts", params={"limit": 10, "offset": 20}).json()
+    assert [p["id"] for p in page] == list(range(21, 31))
+    assert client.get("/prompts", params={"limit": 0}).status_code == 422
+
+
+def test_conditional_get_tracks_prompt_and_version_changes(env):
+    client, Session, _ = env
+    first = client.get("/prompts", params={"limit": 5})
+    etag = first.headers["ETag"]
+    assert client.get("/prompts", params={"limit": 5}, headers={"If-None-Match": etag}).status_code == 304
+    # Different page, different representation
+    assert client.get("/prompts", params={"limit": 5, "offset": 5}, headers={"If-None-Match": etag}).status_code == 200
+
+    db = Session()
+    version = db.query(models.PromptVersion).filter_by(prompt_id=3, version=7).one()
+    version.is_active = True
+    db.commit()
+    changed = client.get("/prompts", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json()[2]["content"] == "p3 v7"
+
+    etag = changed.headers["ETag"]
+    db.query(models.Prompt).filter_by(id=4).one().title = "Renamed"
+    db.commit()
+    db.close()
+    assert client.get("/prompts", params={"limit": 5}, headers={"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,55 @@
+import json
+import time
+import numpy as np
+import openai
+import pytest
+from fastapi.testclient import TestClient
+from app.providers.openai_provider import OpenAIProvider
+from app.providers.stub import LatencyDistribution, StubProvider
+from app.providers.stub_server import build_app
+from app.services.evaluation_service import JUDGE_SYSTEM_PROMPT
+
+
+def test_latency_specs():
+    assert LatencyDistribution.parse("").sample(0.5) == 0.0
+    assert LatencyDistribution.parse("0.2").sample(0.9) == 0.2
+    assert LatencyDistribution.parse("uniform:0.1,0.3").sample(0.5) == pytest.approx(0.2)
+    assert LatencyDistribution.parse("lognormal:0.2,0.5").sample(0.5) == pytest.approx(0.2)
+    with pytest.raises(ValueError):
+        LatencyDistribution.parse("gamma:1")
+
+
+def test_stub_outputs_are_deterministic():
+    a, b = StubProvider(seed=1, embed_dim=64), StubProvider(seed=1, embed_dim=64)
+    msgs = [{"role": "system", "content": "sys"}, {"role": "user", "content": "How do I request leave?"}]
+    assert a.chat(msgs, "m", 200, 0.7, 1.0).text == b.chat(msgs, "m", 200, 0.7, 1.0).text
+    assert np.array_equal(a.embed(["leave policy"], "e", 1.0), b.embed(["leave policy"], "e", 1.0))
+    scores = json.loads(a.judge(msgs, "j", 300, 1.0).text)
+    assert all(3.0 <= scores[k] <= 5.0 for k in ("helpfulness", "accuracy", "tone"))
+
+
+def test_hash_embeddings_reflect_lexical_overlap():
+    stub = StubProvider(embed_dim=256)
+    v = stub.embed(["how many vacation days do I get", "how many vacation days do we get", "expense report deadline"], "e", 1.0)
+    assert v[0] @ v[1] > 0.6 > v[0] @ v[2]
+
+
+def test_stub_latency_respects_timeout(monkeypatch):
+    monkeypatch.setenv("STUB_CHAT_LATENCY", "fixed:5")
+    stub = StubProvider()
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        stub.chat([{"role": "user", "content": "hi"}], "m", 10, 0.0, timeout=0.05)
+    assert time.monotonic() - start < 1.0
+
+
+def test_http_stand_in_speaks_the_openai_protocol():
+    stub = StubProvider(embed_dim=32)
+    client = openai.OpenAI(api_key="stub", base_url="http://testserver/v1", http_client=TestClient(build_app(stub)), max_retries=0)
+    provider = OpenAIProvider(client)
+    msgs = [{"role": "user", "content": "What is the PTO policy?"}]
+    assert provider.chat(msgs, "m", 100, 0.7, 5.0).text == stub.chat_text(msgs, "m", 100)
+    judged = provider.judge([{"role": "system", "content": JUDGE_SYSTEM_PROMPT}] + msgs, "j", 300, 5.0)
+    assert "helpfulness" in json.loads(judged.text)
+    assert np.allclose(provider.embed(["pto policy"], "e", 5.0), stub.embed_matrix(["pto policy"]))
+    assert provider.moderate("this has stubflag in it", "mod", 5.0) is True
@@ -0,0 +1,99 @@
+import random
+import numpy as np
+import pytest
+from app.providers.stub import StubProvider
+from app.services import rag_service
+from app.services.dedup import MinHashIndex, is_empty, lsh_params, signature
+from app.services.rag_service import RAGService
+
+VOCAB = [f"term{i}" for i in range(3000)]
+
+
+def prose(seed: int, words: int = 400) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(VOCAB) for _ in range(words))
+
+
+class CountingStub(StubProvider):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.embedded = 0
+
+    def embed(self, texts, **kwargs):
+        self.embedded += len(texts)
+        return super().embed(texts, **kwargs)
+
+
+@pytest.fixture
+def rag(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_REFRESH_CHECK_SECONDS", "0")
+    return RAGService(provider=CountingStub(seed=1, embed_dim=32), index_dir=str(tmp_path))
+
+
+def test_minhash_index_finds_near_duplicates_and_survives_a_reload(tmp_path):
+    original = prose(1)
+    edited = original.replace(original.split()[100], "amended", 1) + " Confidential."
+    index = MinHashIndex.empty(0.85)
+    index.add(signature(original))
+    assert index.query(signature(edited))[0] == 0
+    assert index.query(signature(prose(2))) is None
+
+    index.save(str(tmp_path))
+    reloaded = MinHashIndex.open(str(tmp_path), 0.85)
+    assert reloaded.query(signature(edited))[0] == 0
+    # A different threshold changes the banding; the band tables are rebuilt from the signatures.
+    assert lsh_params(0.6) != lsh_params(0.85)
+    assert MinHashIndex.open(str(tmp_path), 0.6).query(signature(edited))[0] == 0
+
+
+def test_chunks_without_words_are_never_duplicates():
+    index = MinHashIndex.empty(0.85)
+    index.add(signature("----  ----"))
+    assert is_empty(signature("*** • ***")) and not is_empty(signature(prose(5)))
+    assert index.query(signature("*** • ***")) is None
+    assert index.query(signature("----  ----")) is None
+
+
+def test_same_policy_in_a_second_document_is_merged_not_embedded(rag):
+    policy = prose(3, words=300)
+    first = rag.ingest_text(policy, source="handbook.pdf", chunk_chars=1200, overlap=100)
+    embedded = rag.provider.embedded
+
+    second = rag.ingest_text(policy + " " + prose(4, words=150), source="benefits.pdf", chunk_chars=1200, overlap=100)
+    assert second.chunks > second.indexed > 0
+    assert second.duplicates == second.merged >= first.indexed - 1
+    # Only the new material was embedded, and the index grew by exactly that much.
+    assert rag.provider.embedded - embedded == second.indexed
+    assert rag.status()["documents"] == first.indexed + second.indexed
+
+    hits = rag.retrieve(policy[:400], top_k=1)
+    assert hits[0][2]["source"] == "handbook.pdf" and hits[0][2]["also_in"] == ["benefits.pdf"]
+
+
+def test_repeated_boilerplate_within_a_document_is_indexed_once(rag):
+    disclaimer = prose(5, words=200)
+    result = rag.ingest_text(disclaimer + " " + disclaimer + " " + disclaimer, source="a.pdf", chunk_chars=len(disclaimer) + 1, overlap=0)
+    assert result.chunks == 3 and result.indexed == 1 and result.duplicates == 2 and result.merged == 0
+
+
+def test_drop_mode_and_disabled_dedup(rag, monkeypatch):
+    policy = prose(6, words=100)
+    rag.ingest_text(policy, source="a.pdf")
+    monkeypatch.setattr(rag_service, "DEDUP_MODE", "drop")
+    dropped = rag.ingest_text(policy, source="b.pdf")
+    assert (dropped.indexed, dropped.duplicates, dropped.merged) == (0, 1, 0)
+    assert "also_in" not in rag.retrieve(policy, top_k=1)[0][2]
+
+    monkeypatch.setattr(rag_service, "DEDUP_ENABLED", False)
+    assert rag.ingest_text(policy, source="c.pdf").indexed == 1
+    assert rag.status()["documents"] == 2
+
+
+def test_snapshots_without_a_minhash_index_are_backfilled(rag, monkeypatch):
+    policy = prose(7, words=100)
+    monkeypatch.setattr(rag_service, "DEDUP_ENABLED", False)
+    rag.ingest_text(policy, source="old.pdf")
+    monkeypatch.setattr(rag_service, "DEDUP_ENABLED", True)
+    result = rag.ingest_text(policy, source="new.pdf")
+    assert result.duplicates == 1 and result.merged == 1
+    assert np.asarray(MinHashIndex.open(rag.snapshot.path, 0.85).signatures).shape == (1, 128)
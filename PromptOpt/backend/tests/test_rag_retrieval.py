@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from app.providers.stub import StubProvider
+from app.services import rag_service
+from app.services.rag_service import RAGService, RETRIEVALS
+from app.services.vector_store import mmr, normalize_rows
+
+LEAVE = "Parental leave is sixteen weeks of fully paid leave for birth and adoptive parents."
+TOPICS = [
+    LEAVE,
+    "Expense reports go through the finance portal within thirty days with itemised receipts.",
+    "Open enrollment for medical, dental and vision coverage runs every November.",
+    "Remote work is allowed up to two days per week with manager agreement.",
+]
+
+
+@pytest.fixture
+def rag(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_REFRESH_CHECK_SECONDS", "0")
+    monkeypatch.setattr(rag_service, "DEDUP_ENABLED", False)
+    service = RAGService(provider=StubProvider(seed=1, embed_dim=256), index_dir=str(tmp_path))
+    for i, text in enumerate(TOPICS):
+        service.ingest_text(text, source=f"{i}.txt")
+    return service
+
+
+def test_off_topic_questions_skip_augmentation(rag):
+    skipped = RETRIEVALS.value("skipped")
+    assert rag.retrieve("write me a poem about cats") == []
+    prompt, prov = rag.build_system_prompt_with_provenance("You are helpful.", "write me a poem about cats")
+    assert (prompt, prov) == ("You are helpful.", [])
+    assert RETRIEVALS.value("skipped") == skipped + 2
+
+
+def test_k_adapts_to_the_score_distribution(rag):
+    hits = rag.retrieve("How long is parental leave for adoptive parents?", top_k=4)
+    assert [h[2]["source"] for h in hits] == ["0.txt"]
+    # Without the margin the weaker matches above the floor would pad the context.
+    assert len(rag.retrieve("How long is parental leave for adoptive parents?", top_k=4, min_score=-1.0, margin=2.0)) == 4
+
+
+def test_near_identical_chunks_do_not_crowd_out_other_material(rag):
+    rag.ingest_text(LEAVE + " Parental leave applies to all staff.", source="copy.txt")
+    query = "parental leave weeks and remote work days"
+    relevance_only = rag.retrieve(query, top_k=2, min_score=0.0, margin=1.0, mmr_lambda=1.0)
+    diverse = rag.retrieve(query, top_k=2, min_score=0.0, margin=1.0, mmr_lambda=0.5)
+    assert {h[2]["source"] for h in relevance_only} == {"0.txt", "copy.txt"}
+    sources = [h[2]["source"] for h in diverse]
+    assert "3.txt" in sources and len({"0.txt", "copy.txt"} & set(sources)) == 1
+
+
+def test_mmr_prefers_novel_candidates():
+    vectors = normalize_rows(np.array([[1.0, 0.0, 0.0], [0.99, 0.1, 0.0], [0.0, 1.0, 0.0]], dtype=np.float32))
+    scores = np.array([0.9, 0.88, 0.6], dtype=np.float32)
+    assert mmr(scores, vectors, 2, lam=1.0) == [0, 1]
+    assert mmr(scores, vectors, 2, lam=0.5) == [0, 2]
+    assert mmr(scores, vectors, 5, lam=0.5) == [0, 2, 1]
+    assert mmr(scores[:0], vectors[:0], 3, lam=0.5) == []
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import threading
+import time
+import faiss
+import numpy as np
+import pytest
+from app.providers.stub import StubProvider
+from app.services.rag_service import RAGService
+
+HANDBOOK = "Employees accrue 20 vacation days per year. Expense reports are due within 30 days. " * 20
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_REFRESH_CHECK_SECONDS", "0")
+    stub = StubProvider(seed=1, embed_dim=32)
+    return [RAGService(provider=stub, index_dir=str(tmp_path)) for _ in range(2)]
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def test_other_workers_pick_up_new_snapshots(workers, tmp_path):
+    a, b = workers
+    assert b.status() == {"documents": 0, "has_index": False, "version": None}
+
+    a.ingest_text(HANDBOOK, source="handbook.txt", chunk_chars=400, overlap=50)
+    version = a.status()["version"]
+    assert (tmp_path / "CURRENT").read_text() == version
+
+    # B notices the new CURRENT with a stat and swaps the snapshot in from a background thread.
+    b.status()
+    _wait_for(lambda: b.status()["version"] == version)
+    assert b.status()["documents"] == a.status()["documents"]
+    assert b.retrieve("vacation days")[0][2]["source"] == "handbook.txt"
+
+
+def test_swap_does_not_disturb_in_flight_searches(workers):
+    a, b = workers
+    a.ingest_text(HANDBOOK, source="v1.txt", chunk_chars=400, overlap=50)
+    b.refresh()
+    in_flight = b.snapshot
+    n_before = in_flight.documents
+
+    a.ingest_text("Parental leave is 16 weeks. " * 40, source="v2.txt", chunk_chars=400, overlap=50)
+    assert b.refresh() is True
+    # The old snapshot object is untouched and still searchable.
+    assert in_flight.documents == n_before and len(in_flight.store.offsets) == n_before + 1
+    q = b.embed_query("parental leave")
+    assert in_flight.store.search(q, 2)[1].max() < n_before
+    assert b.snapshot.documents > n_before
+
+
+def test_concurrent_ingests_from_two_workers_keep_both_documents(workers):
+    a, b = workers
+    threads = [
+        threading.Thread(target=a.ingest_text, args=(HANDBOOK,), kwargs={"source": "a.txt", "chunk_chars": 400, "overlap": 50}),
+        threading.Thread(target=b.ingest_text, args=("Parental leave is 16 weeks. " * 40,), kwargs={"source": "b.txt", "chunk_chars": 400, "overlap": 50}),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    a.refresh()
+    store = a.snapshot.store
+    assert {store.meta(i)["source"] for i in range(store.ntotal)} == {"a.txt", "b.txt"}
+    assert len(store.source_ids) == len(store.offsets) - 1 == store.ntotal
+
+
+def test_old_snapshots_are_pruned(workers, tmp_path):
+    a, _ = workers
+    a.store.keep = 2
+    for i in range(4):
+        a.ingest_text(f"Policy number {i}. " * 30, source=f"{i}.txt", chunk_chars=400, overlap=50)
+    assert len(os.listdir(tmp_path / "snapshots")) == 2
+    assert a.status()["version"] in os.listdir(tmp_path / "snapshots")
+
+
+def test_legacy_index_is_served_and_snapshotted_on_next_ingest(tmp_path):
+    stub = StubProvider(seed=1, embed_dim=32)
+    index = faiss.IndexFlatIP(32)
+    index.add(np.eye(32, dtype=np.float32)[:3])
+    faiss.write_index(index, str(tmp_path / "company.faiss"))
+    (tmp_path / "company_meta.jsonl").write_text("".join(f'{{"text": "old {i}", "source": "old.pdf", "idx": {i}}}\n' for i in range(3)))
+
+    rag = RAGService(provider=stub, index_dir=str(tmp_path))
+    assert rag.status() == {"documents": 3, "has_index": True, "version": None}
+    rag.ingest_text(HANDBOOK, source="new.txt", chunk_chars=400, overlap=50)
+    store = rag.snapshot.store
+    assert {store.meta(i)["source"] for i in range(store.ntotal)} == {"old.pdf", "new.txt"}
+    assert store.meta(1)["text"] == "old 1"
+    assert rag.status()["version"] is not None
+
+
+def test_ingest_endpoint_runs_off_the_event_loop(api_client, tmp_path, monkeypatch):
+    from app.routes import rag
+    from app.services import rag_service
+    from app.services.container import services
+
+    calls = []
+
+    class FakeRAG:
+        def ingest_pdf(self, path):
+            try:
+                asyncio.get_running_loop()
+                calls.append("loop")
+            except RuntimeError:
+                calls.append("thread")
+            return rag_service.IngestResult(os.path.basename(path), 1, 1)
+
+    monkeypatch.setattr(rag_service, "INDEX_DIR", str(tmp_path))
+    monkeypatch.setitem(services._instances, "rag", FakeRAG())
+    resp = api_client(rag.router).post("/rag/ingest", files={"file": ("handbook.pdf", b"%PDF-1.4", "application/pdf")})
+    assert resp.status_code == 200 and resp.json()["chunks"] == 1
+    assert calls == ["thread"]
@@ -0,0 +1,116 @@
+import asyncio
+import time
+import openai
+import pytest
+from app.models.chat import ChatRequest
+from app.providers.openai_provider import OpenAIProvider
+from app.services.llm_service import LLMService
+from app.services.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientClient, RetryPolicy
+
+
+def _client(fake):
+    return openai.OpenAI(api_key="test", base_url=fake.base_url, max_retries=0)
+
+
+def _resilient(breaker=None, attempts=3, hedge=False, deadline=2.0):
+    breaker = breaker or CircuitBreaker("test", failure_threshold=5, reset_timeout=60)
+    return ResilientClient("chat", breaker, deadline=deadline, retry=RetryPolicy(attempts, 0.01, 0.02), hedge=hedge)
+
+
+def _complete(client):
+    return lambda timeout: client.chat.completions.create(model="m", messages=[{"role": "user", "content": "hi"}], timeout=timeout)
+
+
+def test_retries_retryable_errors_then_succeeds(fake_openai):
+    fake_openai.script.extend([("status", 500), ("status", 429)])
+    rc = _resilient()
+    resp = asyncio.run(rc.call(_complete(_client(fake_openai))))
+    assert resp.choices[0].message.content == "fake answer"
+    assert fake_openai.requests == 3
+    assert rc.stats()["retries"] == 2
+
+
+def test_non_retryable_error_is_not_retried(fake_openai):
+    fake_openai.script.append(("status", 400))
+    rc = _resilient()
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(rc.call(_complete(_client(fake_openai))))
+    assert fake_openai.requests == 1
+    assert rc.breaker.state == "closed"
+
+
+def test_deadline_bounds_a_hung_upstream(fake_openai):
+    fake_openai.latency = 2.0
+    rc = _resilient(deadline=0.3)
+    start = time.monotonic()
+    with pytest.raises((DeadlineExceeded, openai.APITimeoutError)):
+        asyncio.run(rc.call(_complete(_client(fake_openai))))
+    assert time.monotonic() - start < 1.0
+
+
+def test_circuit_opens_short_circuits_and_recovers(fake_openai):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.2)
+    rc = _resilient(breaker, attempts=1)
+    client = _client(fake_openai)
+    fake_openai.script.extend([("status", 503), ("status", 503)])
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            rc.call_sync(_complete(client))
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        rc.call_sync(_complete(client))
+    assert fake_openai.requests == 2
+    time.sleep(0.25)
+    assert breaker.state == "half_open"
+    rc.call_sync(_complete(client))
+    assert breaker.state == "closed"
+
+
+def test_cancelled_half_open_probe_is_released(fake_openai):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.1)
+    rc = _resilient(breaker, attempts=1)
+    client = _client(fake_openai)
+    fake_openai.script.append(("status", 503))
+    with pytest.raises(openai.InternalServerError):
+        rc.call_sync(_complete(client))
+    time.sleep(0.15)
+    fake_openai.latency = 1.0
+
+    async def cancel_probe():
+        probe = asyncio.ensure_future(rc.call(_complete(client)))
+        await asyncio.sleep(0.1)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(cancel_probe())
+    assert breaker.state == "half_open"
+    fake_openai.latency = 0.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_hedged_request_beats_slow_primary(fake_openai):
+    rc = _resilient(hedge=True)
+    for _ in range(rc.latency.min_samples):
+        rc.latency.add(0.05)
+    fake_openai.script.append(("delay", 0.8))
+
+    async def timed():
+        start = time.monotonic()
+        await rc.call(_complete(_client(fake_openai)))
+        return time.monotonic() - start
+
+    # Timed inside the loop: asyncio.run() itself waits for the abandoned primary thread.
+    assert asyncio.run(timed()) < 0.5
+    assert rc.stats()["hedge_wins"] == 1
+
+
+def test_llm_service_falls_back_when_provider_is_down(fake_openai):
+    fake_openai.script.extend([("status", 500)] * 3)
+    service = LLMService(provider=OpenAIProvider(_client(fake_openai)))
+    service.resilient = _resilient()
+    response = asyncio.run(service.generate_response(ChatRequest(message="hello")))
+    assert response.degraded is True
+    assert fake_openai.requests == 3
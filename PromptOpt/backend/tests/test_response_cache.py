@@ -0,0 +1,89 @@
+import numpy as np
+from app.services.cache_service import ResponseCache, normalize_message
+
+
+def _cache(**overrides):
+    cache = ResponseCache()
+    cache.enabled = True
+    cache.semantic_enabled = True
+    cache.similarity_threshold = 0.9
+    for k, v in overrides.items():
+        setattr(cache, k, v)
+    return cache
+
+
+def _vec(*values):
+    return np.array([values], dtype=np.float32)
+
+
+def test_normalize_message_ignores_case_whitespace_and_trailing_punctuation():
+    assert normalize_message("  How many PTO   days?? ") == normalize_message("how many pto days")
+
+
+def test_exact_hit_and_namespace_isolation():
+    cache = _cache()
+    ns = cache.namespace(7, 1, None)
+    cache.put(ns, 1, "What is the PTO policy?", "20 days", "sys")
+    hit = cache.get(ns, "what is the pto policy")
+    assert hit is not None and hit.tier == "exact" and hit.entry.response == "20 days"
+    other = cache.namespace(8, 1, None)
+    assert cache.get(other, "what is the pto policy") is None
+    ctx = cache.namespace(7, 1, [{"text": "chunk", "source": "handbook.pdf"}])
+    assert cache.get(ctx, "what is the pto policy") is None
+    # Another worker mapping a newer RAG snapshot misses without being told about the ingest
+    cache.put(cache.namespace(7, 1, None, "v1"), 1, "What is the PTO policy?", "20 days", "sys")
+    assert cache.get(cache.namespace(7, 1, None, "v1"), "what is the pto policy") is not None
+    assert cache.get(cache.namespace(7, 1, None, "v2"), "what is the pto policy") is None
+
+
+def test_semantic_hit_requires_threshold_and_same_namespace():
+    cache = _cache()
+    ns = cache.namespace(7, 1, None)
+    cache.put(ns, 1, "How much vacation do I get?", "20 days", "sys", query_vec=_vec(1.0, 0.0, 0.0))
+    hit = cache.get(ns, "What's my vacation allowance?", embed=lambda: _vec(0.99, 0.1, 0.0))
+    assert hit is not None and hit.tier == "semantic" and hit.similarity > 0.9
+    assert cache.get(ns, "Who is my manager?", embed=lambda: _vec(0.0, 1.0, 0.0)) is None
+    assert cache.get(cache.namespace(9, 1, None), "vacation?", embed=lambda: _vec(1.0, 0.0, 0.0)) is None
+
+
+def test_embed_is_not_called_on_exact_hit():
+    cache = _cache()
+    ns = cache.namespace(1, 1, None)
+    cache.put(ns, 1, "hello", "hi", "sys")
+
+    def boom():
+        raise AssertionError("embed should not be called")
+
+    assert cache.get(ns, "hello", embed=boom).tier == "exact"
+
+
+def test_ttl_expiry():
+    cache = _cache(ttl_seconds=-1)
+    ns = cache.namespace(1, 1, None)
+    cache.put(ns, 1, "hello", "hi", "sys")
+    assert cache.get(ns, "hello") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_lru_eviction_by_bytes():
+    cache = _cache(max_bytes=400)
+    ns = cache.namespace(1, 1, None)
+    cache.put(ns, 1, "a", "x" * 100, None)
+    cache.put(ns, 1, "b", "x" * 100, None)
+    assert cache.get(ns, "a") is not None  # touch "a" so "b" is least recently used
+    cache.put(ns, 1, "c", "x" * 100, None)
+    assert cache.get(ns, "b") is None
+    assert cache.get(ns, "a") is not None and cache.get(ns, "c") is not None
+    assert cache.stats()["bytes"] <= 400
+
+
+def test_invalidation_by_prompt_and_collection():
+    cache = _cache()
+    ns1, ns2 = cache.namespace(1, 1, None), cache.namespace(2, 2, None)
+    cache.put(ns1, 1, "q", "a1", None, query_vec=_vec(1.0, 0.0))
+    cache.put(ns2, 2, "q", "a2", None, query_vec=_vec(1.0, 0.0))
+    assert cache.invalidate_prompt(1) == 1
+    assert cache.get(ns1, "q") is None
+    assert cache.get(ns2, "q") is not None
+    cache.invalidate_collection()
+    assert cache.stats()["entries"] == 0
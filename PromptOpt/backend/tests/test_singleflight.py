@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+from app.providers.stub import StubProvider
+from app.services.rag_service import RAGService
+from app.utils.singleflight import SingleFlight
+
+
+def test_identical_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test", max_wait=5)
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return f"answer:{key}"
+
+    async def main():
+        return await asyncio.gather(*(flight.do(k, lambda k=k: fetch(k)) for k in ["a"] * 10 + ["b"] * 2))
+
+    results = asyncio.run(main())
+    assert sorted(calls) == ["a", "b"]
+    assert [r for r, _ in results] == ["answer:a"] * 10 + ["answer:b"] * 2
+    assert sum(shared for _, shared in results) == 10
+    assert flight.stats()["calls_saved"] == 10 and flight.stats()["in_flight"] == 0
+
+
+def test_errors_fan_out_and_waiting_is_bounded():
+    flight = SingleFlight("test", max_wait=0.05)
+
+    async def boom():
+        await asyncio.sleep(0.02)
+        raise ValueError("upstream down")
+
+    async def slow():
+        await asyncio.sleep(0.3)
+        return "slow"
+
+    async def main():
+        errors = await asyncio.gather(*(flight.do("e", boom) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(e, ValueError) for e in errors)
+        leader = asyncio.ensure_future(flight.do("s", slow))
+        await asyncio.sleep(0.01)
+        start = time.monotonic()
+        result, shared = await flight.do("s", lambda: asyncio.sleep(0, result="own"))
+        assert (result, shared) == ("own", False) and time.monotonic() - start < 0.2
+        await leader
+
+    asyncio.run(main())
+    assert flight.stats()["wait_timeout"] == 1
+
+
+def test_follower_recovers_when_leader_is_cancelled():
+    flight = SingleFlight("test", max_wait=5)
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("k", lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.do("k", lambda: asyncio.sleep(0, result="mine")))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == ("mine", False)
+    assert flight.stats()["leader_aborted"] == 1
+
+
+def test_threads_coalesce_with_async_leader():
+    flight = SingleFlight("test", max_wait=5)
+    out = []
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("k", lambda: asyncio.sleep(0.1, result="v")))
+        await asyncio.sleep(0.01)
+        t = threading.Thread(target=lambda: out.append(flight.do_sync("k", lambda: "thread")))
+        t.start()
+        await leader
+        await asyncio.to_thread(t.join)
+
+    asyncio.run(main())
+    assert out == [("v", True)]
+
+
+def test_concurrent_identical_query_embeddings_hit_provider_once(monkeypatch):
+    monkeypatch.setenv("STUB_EMBED_LATENCY", "0.05")
+    provider = StubProvider(embed_dim=64)
+    calls = []
+    embed = provider.embed
+    monkeypatch.setattr(provider, "embed", lambda texts, **kw: calls.append(texts) or embed(texts, **kw))
+    service = RAGService(provider=provider)
+
+    async def main():
+        return await asyncio.gather(*(service.embed_query_async("When is open enrollment?") for _ in range(8)))
+
+    vecs = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(v is vecs[0] for v in vecs) and vecs[0].shape == (1, 64)
@@ -0,0 +1,74 @@
+import asyncio
+import time
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.profiler import SamplingProfiler
+from app.utils.tracing import MetricsRegistry, STAGE_SECONDS, Trace, _current_trace, span
+
+
+def test_histogram_renders_prometheus_buckets():
+    reg = MetricsRegistry()
+    h = reg.histogram("t_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+    h.observe(0.05, "a")
+    h.observe(0.5, "a")
+    text = reg.render()
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="a",le="1.0"} 2' in text
+    assert 't_seconds_bucket{stage="a",le="+Inf"} 2' in text
+    assert 't_seconds_count{stage="a"} 2' in text
+
+
+def test_span_decorates_async_functions_and_records_on_trace():
+    @span("test.async_stage")
+    async def work():
+        await asyncio.sleep(0.01)
+        with span("test.inner"):
+            pass
+
+    trace = Trace("abc")
+    token = _current_trace.set(trace)
+    try:
+        before = STAGE_SECONDS.snapshot("test.async_stage")[0]
+        asyncio.run(work())
+    finally:
+        _current_trace.reset(token)
+    assert STAGE_SECONDS.snapshot("test.async_stage")[0] == before + 1
+    assert [name for name, _, _ in trace.spans] == ["test.inner", "test.async_stage"]
+    assert trace.stage_totals()["test.async_stage"] >= 0.01
+
+
+def test_span_overhead_is_a_few_microseconds():
+    n = 20000
+    start = time.perf_counter()
+    for _ in range(n):
+        with span("test.overhead"):
+            pass
+    per_span = (time.perf_counter() - start) / n
+    # ~15 spans per chat request must stay far below 1% of a ~100ms request.
+    assert per_span < 50e-6
+
+
+def test_middleware_propagates_trace_id_and_exports_metrics():
+    client = TestClient(app)
+    resp = client.get("/health", headers={"X-Trace-Id": "req-123"})
+    assert resp.headers["x-trace-id"] == "req-123"
+    assert len(client.get("/health", headers={"X-Trace-Id": "bad id!"}).headers["x-trace-id"]) == 32
+    text = client.get("/metrics").text
+    assert 'promptopt_http_requests_total{method="GET",route="/health",status="200"}' in text
+
+
+def test_sampling_profiler_collects_collapsed_stacks():
+    prof = SamplingProfiler()
+    assert prof.start(interval=0.002)
+    assert not prof.start()
+
+    def busy():
+        end = time.perf_counter() + 0.15
+        while time.perf_counter() < end:
+            pass
+
+    busy()
+    out = prof.stop()
+    assert not prof.running
+    assert prof.status()["samples"] > 5
+    assert "busy (test_tracing.py" in out
@@ -0,0 +1,141 @@
+import asyncio
+import pytest
+from app.db import models
+from app.providers.base import ChatResult, ProviderError
+from app.providers.metered import MeteredProvider
+from app.providers.stub import StubProvider
+from app.routes import usage
+from app.services import usage_service
+from app.services.usage_service import UsageMeter, attribute, usage_scope
+
+PRICES = {"gpt-4o-mini": (0.15, 0.60), "text-embedding-3-small": (0.02, 0.0)}
+MESSAGES = [{"role": "system", "content": "You are an HR assistant."}, {"role": "user", "content": "How many vacation days do I get?"}]
+
+
+class NoUsageStub(StubProvider):
+    """A backend that reports no usage, so tokens have to be counted locally."""
+
+    def chat(self, messages, model, max_tokens, temperature, timeout):
+        result = super().chat(messages, model, max_tokens, temperature, timeout)
+        return ChatResult(text=result.text, model=result.model)
+
+
+class FailingStub(StubProvider):
+    def judge(self, messages, model, max_tokens, timeout):
+        raise ProviderError("upstream timeout")
+
+
+def _run_in_request(fn):
+    """Each call runs in its own context, like a request task."""
+    async def go():
+        return await asyncio.to_thread(fn)
+    return asyncio.run(go())
+
+
+def test_calls_are_metered_per_user_and_prompt_version(session_factory):
+    meter = UsageMeter(PRICES)
+    provider = MeteredProvider(StubProvider(seed=1), meter)
+
+    def alice():
+        attribute(user_id=1)
+        provider.moderate("How many vacation days do I get?", model="omni-moderation-latest", timeout=5)
+        attribute(prompt_version_id=10)
+        return provider.chat(MESSAGES, model="gpt-4o-mini", max_tokens=200, temperature=0.2, timeout=5)
+
+    def bob():
+        attribute(user_id=2, prompt_version_id=11)
+        provider.embed(["vacation days policy"], model="text-embedding-3-small", timeout=5)
+        provider.chat(MESSAGES, model="gpt-4o-mini", max_tokens=200, temperature=0.2, timeout=5)
+
+    result = _run_in_request(alice)
+    _run_in_request(bob)
+    db = session_factory()
+    assert meter.flush(db) == 4 and meter.pending() == 0
+
+    users = {u["user_id"]: u for u in usage_service.totals(db, "user")}
+    a = users[1]
+    assert a["calls"] == 2 and a["errors"] == 0 and a["estimated_calls"] == 1
+    assert a["operations"]["chat"]["prompt_tokens"] == result.prompt_tokens
+    assert a["operations"]["chat"]["completion_tokens"] == result.completion_tokens
+    assert a["cost_usd"] == pytest.approx((result.prompt_tokens * 0.15 + result.completion_tokens * 0.60) / 1e6, abs=1e-6)
+    # Moderation is free; embeddings are billed on input only
+    assert a["operations"]["moderate"]["cost_usd"] == 0.0
+    assert users[2]["operations"]["embed"]["completion_tokens"] == 0 and users[2]["operations"]["embed"]["prompt_tokens"] > 0
+
+    versions = {v["prompt_version_id"]: v for v in usage_service.totals(db, "prompt_version")}
+    # Alice's moderation call ran before her prompt version was known
+    assert set(versions) == {None, 10, 11} and versions[10]["calls"] == 1 and versions[11]["calls"] == 2
+    db.close()
+
+
+def test_local_token_counting_and_errors(session_factory):
+    meter = UsageMeter(PRICES)
+    result = MeteredProvider(NoUsageStub(seed=1), meter).chat(MESSAGES, model="gpt-4o-mini", max_tokens=200, temperature=0.2, timeout=5)
+    assert result.prompt_tokens == usage_service.count_message_tokens(MESSAGES, "gpt-4o-mini")
+    assert result.completion_tokens == usage_service.count_tokens(result.text, "gpt-4o-mini")
+
+    failing = MeteredProvider(FailingStub(seed=1), meter)
+    with usage_scope(prompt_version_id=7), pytest.raises(ProviderError):
+        failing.judge(MESSAGES, model="gpt-4o-mini", max_tokens=100, timeout=5)
+    # Attributes not provided by the wrapper still reach the provider
+    assert failing.embed_dim == StubProvider(seed=1).embed_dim
+
+    db = session_factory()
+    meter.flush(db)
+    (row,) = usage_service.totals(db, "prompt_version", ids=[7])
+    assert row["errors"] == 1 and row["total_tokens"] == 0 and row["avg_latency_ms"] >= 0
+    (unattributed,) = usage_service.totals(db, "prompt_version", ids=[0])
+    assert unattributed["estimated_calls"] == 1 and unattributed["prompt_tokens"] == result.prompt_tokens
+    db.close()
+
+
+def test_flush_upserts_into_hourly_rows_and_requeues_on_failure(session_factory):
+    meter = UsageMeter({"gpt-4o-mini": (1.0, 2.0)})
+    with usage_scope(user_id=3):
+        for _ in range(5):
+            meter.record("chat", "gpt-4o-mini-2024-07-18", 1000, 500, 0.2)
+    assert meter.pending() == 1
+
+    broken = session_factory()
+    broken.connection().exec_driver_sql("DROP TABLE usage_rollups")
+    with pytest.raises(Exception):
+        meter.flush(broken)
+    assert meter.pending() == 1
+    broken.close()
+
+    db = session_factory()
+    models.UsageRollup.__table__.create(db.connection())
+    meter.flush(db)
+    with usage_scope(user_id=3):
+        meter.record("chat", "gpt-4o-mini", 1000, 500, 0.2)
+    meter.flush(db)
+    assert db.query(models.UsageRollup).count() == 2  # one row per model name
+    (u,) = usage_service.totals(db, "user")
+    # Dated snapshots are priced by their base model
+    assert u["calls"] == 6 and u["cost_usd"] == pytest.approx(6 * (1000 * 1.0 + 500 * 2.0) / 1e6)
+    assert u["avg_latency_ms"] == pytest.approx(200.0)
+    db.close()
+
+
+def test_prompt_version_endpoint_labels_versions(session_factory, api_client, monkeypatch):
+    db = session_factory()
+    db.add(models.Prompt(id=1, title="HR FAQ", created_by="admin"))
+    db.add_all([models.PromptVersion(id=10, prompt_id=1, version=1, content="A"), models.PromptVersion(id=11, prompt_id=1, version=2, content="B")])
+    db.commit()
+    db.close()
+    meter = UsageMeter(PRICES)
+    monkeypatch.setattr(usage_service, "meter", meter)
+    with usage_scope(user_id=1, prompt_version_id=11):
+        meter.record("chat", "gpt-4o-mini", 800, 200, 0.5)
+        meter.record("judge", "gpt-4o-mini", 1200, 100, 0.7)
+    with usage_scope(prompt_version_id=99):
+        meter.record("chat", "gpt-4o-mini", 10, 10, 0.1)
+
+    client = api_client(usage.router)
+
+    (item,) = client.get("/usage/prompt-versions", params={"prompt_id": 1}).json()["prompt_versions"]
+    assert (item["prompt_id"], item["version"], item["calls"]) == (1, 2, 2)
+    assert item["operations"]["chat"]["avg_prompt_tokens"] == 800
+    assert client.get("/usage/prompt-versions", params={"prompt_id": 5}).status_code == 404
+    assert len(client.get("/usage/prompt-versions").json()["prompt_versions"]) == 2
+    assert client.get("/usage/users", params={"user_id": 1}).json()["users"][0]["total_tokens"] == 2300
@@ -0,0 +1,81 @@
+import numpy as np
+import faiss
+import pytest
+from app.services.vector_store import VectorStore, from_faiss, is_store_dir, normalize_rows
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return normalize_rows(rng.standard_normal((300, 16)))
+
+
+def test_saved_store_is_memory_mapped_and_round_trips(tmp_path, vectors):
+    texts = [f"chunk {i} — naïve café" for i in range(len(vectors))]
+    sources = ["a.pdf" if i % 3 else "b.pdf" for i in range(len(vectors))]
+    VectorStore.from_records(vectors, texts, sources).save(str(tmp_path))
+    assert is_store_dir(str(tmp_path))
+
+    store = VectorStore.open(str(tmp_path))
+    assert isinstance(store.vectors, np.memmap) and store.ntotal == 300 and store.dim == 16
+    assert store.meta(7) == {"text": texts[7], "source": "a.pdf", "idx": 7}
+    assert store.meta(9)["source"] == "b.pdf"
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float16, np.int8])
+def test_search_matches_faiss_flat_ip(vectors, dtype):
+    index = faiss.IndexFlatIP(16)
+    index.add(vectors)
+    store = VectorStore.from_records(vectors, [""] * len(vectors), [""] * len(vectors), dtype=dtype)
+    q = vectors[:5] + 0.01
+    expected_d, expected_i = index.search(q, 4)
+    # Compressed stores re-rank their candidates against the float32 copy, so results are exact.
+    dists, idxs = store.search(q, 4)
+    assert (idxs == expected_i).all()
+    assert np.allclose(dists, expected_d, atol=1e-5)
+
+
+@pytest.mark.parametrize("dtype,atol", [(np.float16, 1e-2), (np.int8, 5e-2)])
+def test_compressed_scores_without_rerank_are_close(vectors, dtype, atol):
+    store = VectorStore.from_records(vectors, [""] * len(vectors), [""] * len(vectors), dtype=dtype)
+    q = vectors[:5]
+    dists, idxs = store.search(q, 1, rerank=0)
+    assert (idxs[:, 0] == np.arange(5)).all()
+    assert np.allclose(dists[:, 0], 1.0, atol=atol)
+    assert store.nbytes == vectors.nbytes // np.dtype(np.float32).itemsize * np.dtype(dtype).itemsize
+
+
+def test_search_pads_when_k_exceeds_rows(vectors):
+    store = VectorStore.from_records(vectors[:2], ["x", "y"], ["s", "s"])
+    dists, idxs = store.search(vectors[:1], 4)
+    assert list(idxs[0]) == [0, 1, -1, -1]
+
+
+def test_extend_appends_without_touching_the_original(tmp_path, vectors):
+    VectorStore.from_records(vectors[:10], [f"old {i}" for i in range(10)], ["old.pdf"] * 10).save(str(tmp_path))
+    base = VectorStore.open(str(tmp_path))
+    grown = base.extend(vectors[10:13], ["new 0", "new 1", "new 2"], "new.pdf")
+    assert base.ntotal == 10 and grown.ntotal == 13
+    assert grown.meta(3) == {"text": "old 3", "source": "old.pdf", "idx": 3}
+    assert grown.meta(12) == {"text": "new 2", "source": "new.pdf", "idx": 12}
+    assert grown.search(vectors[11:12], 1)[1][0, 0] == 11
+
+
+def test_int8_store_round_trips_codes_scales_and_exact_vectors(tmp_path, vectors):
+    VectorStore.from_records(vectors[:10], [f"old {i}" for i in range(10)], ["old.pdf"] * 10, dtype=np.int8).save(str(tmp_path))
+    base = VectorStore.open(str(tmp_path))
+    assert base.vectors.dtype == np.int8 and isinstance(base.exact, np.memmap)
+    # New rows outside the fitted range widen the scales instead of clipping.
+    louder = np.zeros((1, 16), dtype=np.float32)
+    louder[0, 0] = 1.0
+    grown = base.extend(louder, ["new"], "new.pdf")
+    assert grown.scales[0] >= 1.0 / 127 and np.allclose(grown.float32()[:10], vectors[:10])
+    assert grown.search(louder, 1, rerank=0)[1][0, 0] == 10
+
+
+def test_from_faiss_keeps_rows_and_metadata(vectors):
+    index = faiss.IndexFlatIP(16)
+    index.add(vectors[:3])
+    store = from_faiss(index, [{"text": f"t{i}", "source": "legacy.pdf", "idx": i} for i in range(3)])
+    assert np.allclose(store.vectors, vectors[:3])
+    assert store.meta(2) == {"text": "t2", "source": "legacy.pdf", "idx": 2}
@@ -12,8 +12,9 @@ Set-Location $BackendDir
 if (-not (Test-Path .venv)) { py -m venv .venv }
 . .\.venv\Scripts\Activate.ps1
 python -m pip install -r requirements.txt | Out-Null
-if (-not (Test-Path (Join-Path $BackendDir 'app.db'))) {
-  alembic upgrade head
+$NewDb = -not (Test-Path (Join-Path $BackendDir 'app.db'))
+alembic upgrade head
+if ($NewDb) {
   python -m app.utils.seed
 }
 
@@ -10,8 +10,10 @@ cd backend
 python3 -m venv .venv || true
 source .venv/bin/activate
 pip install -r requirements.txt
-if [ ! -f app.db ]; then
-  alembic upgrade head
+NEW_DB=0
+[ -f app.db ] || NEW_DB=1
+alembic upgrade head
+if [ "$NEW_DB" = "1" ]; then
   python -m app.utils.seed
 fi
 